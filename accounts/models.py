@@ -34,6 +34,9 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
+def save_user_profile(sender, instance, update_fields=None, **kwargs):
+    # Logging in only touches last_login; the profile has not changed
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
     if hasattr(instance, 'profile'):
         instance.profile.save()
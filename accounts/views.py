@@ -4,9 +4,12 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from .forms import SignupForm, LoginForm, ProfileEditForm
 from .models import Profile
-from main.models import Order
+from main.archive import user_orders
+from main.query_budget import query_budget
+from main.ratelimit import rate_limit
 
 
+@query_budget(14)
 def signup_view(request):
     if request.user.is_authenticated:
         # Redirect based on role
@@ -33,6 +36,9 @@ def signup_view(request):
 
 from django.contrib.auth.models import User
 
+# Each POST hashes a password; limit per client IP, not per attempted username
+@query_budget(9)
+@rate_limit('10/m', key='ip', burst=5, methods=['POST'])
 def login_view(request):
     if request.user.is_authenticated:
         if request.user.is_superuser or (hasattr(request.user, 'profile') and request.user.profile.role == 'staff'):
@@ -76,6 +82,7 @@ def login_view(request):
 
 
 
+@query_budget(6)
 @login_required
 def logout_view(request):
     logout(request)
@@ -83,6 +90,7 @@ def logout_view(request):
     return redirect('accounts:login')
 
 
+@query_budget(11)
 @login_required
 def profile_view(request):
     """Profile page with editing and order history"""
@@ -91,8 +99,8 @@ def profile_view(request):
     # Ensure profile exists
     profile, created = Profile.objects.get_or_create(user=user)
     
-    # Get user's order history with related items
-    orders = Order.objects.filter(user=user).prefetch_related('items__dish').order_by('-created_at')
+    # Order history, live and archived
+    orders = user_orders(user)
     
     if request.method == 'POST':
         form = ProfileEditForm(request.POST, instance=profile, user=user)
@@ -0,0 +1,223 @@
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.db.models import F
+
+from main.models import Restaurant, Dish, Cuisine, Review
+
+
+MAX_PAGE_SIZE = 200
+DEFAULT_PAGE_SIZE = 50
+
+
+class APIError(ValueError):
+    """Bad request parameters; rendered as a 400 JSON response"""
+
+
+def _image_url(path):
+    return default_storage.url(path) if path else None
+
+
+def _to_int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise APIError(f'"{name}" must be an integer.')
+
+
+def _to_bool(value, name):
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise APIError(f'"{name}" must be true or false.')
+
+
+class Resource:
+    """
+    Describes how a model is exposed: public field name -> ORM column,
+    which fields are returned by default, the allowed filters and the
+    related resources that can be embedded with ?expand=.
+    """
+
+    def __init__(self, model, fields, default_fields, filters=None, expand=None, converters=None, base_filters=None):
+        self.model = model
+        # Always applied, for rows the model's manager cannot hide on its own
+        self.base_filters = base_filters or {}
+        self.fields = fields
+        self.default_fields = default_fields
+        self.filters = filters or {}
+        self.expand = expand or {}
+        self.converters = converters or {}
+
+    def columns(self, names):
+        return [self.fields[name] for name in names]
+
+    def serialize(self, row, names):
+        data = {}
+        for name in names:
+            value = row[self.fields[name]]
+            if name in self.converters:
+                value = self.converters[name](value)
+            data[name] = value
+        return data
+
+
+class One:
+    """Embed a single related object referenced by a foreign key column"""
+
+    def __init__(self, resource, column):
+        self.resource = resource
+        self.column = column
+
+    def fetch(self, rows):
+        target = RESOURCES[self.resource]
+        ids = {row[self.column] for row in rows if row[self.column] is not None}
+        names = target.default_fields
+        related = {}
+        if ids:
+            for item in target.model.objects.filter(pk__in=ids).values(*target.columns(names)):
+                related[item['id']] = target.serialize(item, names)
+        return {row['id']: related.get(row[self.column]) for row in rows}
+
+
+class Many:
+    """Embed a list of related objects, reached from the target by ``lookup``"""
+
+    def __init__(self, resource, lookup):
+        self.resource = resource
+        self.lookup = lookup
+
+    def fetch(self, rows):
+        target = RESOURCES[self.resource]
+        names = target.default_fields
+        related = {row['id']: [] for row in rows}
+        if related:
+            items = (
+                target.model.objects
+                .filter(**{f'{self.lookup}__in': list(related)})
+                .order_by('id')
+                .values(*target.columns(names), _parent=F(self.lookup))
+            )
+            for item in items:
+                related[item['_parent']].append(target.serialize(item, names))
+        return related
+
+
+RESOURCES = {
+    'restaurants': Resource(
+        Restaurant,
+        fields={
+            'id': 'id', 'name': 'name', 'description': 'description',
+            'opening_time': 'opening_time', 'closing_time': 'closing_time',
+            'location': 'location', 'image': 'image', 'featured': 'featured',
+            'owner': 'owner_id', 'created_at': 'created_at', 'updated_at': 'updated_at',
+        },
+        default_fields=('id', 'name', 'location', 'opening_time', 'closing_time', 'image', 'featured'),
+        filters={'featured': ('featured', _to_bool), 'cuisine': ('cuisines__id', _to_int)},
+        expand={'cuisines': Many('cuisines', 'restaurants'), 'dishes': Many('dishes', 'restaurant')},
+        converters={'image': _image_url},
+    ),
+    'dishes': Resource(
+        Dish,
+        fields={
+            'id': 'id', 'name': 'name', 'description': 'description', 'price': 'price',
+            'image': 'image', 'featured': 'featured', 'restaurant': 'restaurant_id',
+            'created_at': 'created_at', 'updated_at': 'updated_at',
+        },
+        default_fields=('id', 'name', 'price', 'image', 'featured', 'restaurant'),
+        filters={'featured': ('featured', _to_bool), 'restaurant': ('restaurant_id', _to_int)},
+        expand={'restaurant': One('restaurants', 'restaurant_id')},
+        converters={'image': _image_url},
+    ),
+    'cuisines': Resource(
+        Cuisine,
+        fields={'id': 'id', 'name': 'name'},
+        default_fields=('id', 'name'),
+    ),
+    'reviews': Resource(
+        Review,
+        fields={
+            'id': 'id', 'rating': 'rating', 'comment': 'comment',
+            'restaurant': 'restaurant_id', 'user': 'user_id', 'created_at': 'created_at',
+        },
+        default_fields=('id', 'rating', 'comment', 'restaurant', 'user', 'created_at'),
+        filters={'restaurant': ('restaurant_id', _to_int), 'rating': ('rating', _to_int)},
+        expand={'user': One('users', 'user_id'), 'restaurant': One('restaurants', 'restaurant_id')},
+        # Reviews of a soft-deleted restaurant stay until its purge runs
+        base_filters={'restaurant__deleted_at__isnull': True},
+    ),
+    # Only reachable through ?expand=user on reviews
+    'users': Resource(
+        User,
+        fields={'id': 'id', 'username': 'username'},
+        default_fields=('id', 'username'),
+    ),
+}
+
+
+def _split(value):
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+def parse_query(resource, params):
+    """Validate fields/expand/filter/pagination parameters"""
+    fields = _split(params.get('fields', '')) or list(resource.default_fields)
+    unknown = [name for name in fields if name not in resource.fields]
+    if unknown:
+        raise APIError(f'Unknown field(s): {", ".join(unknown)}.')
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+
+    expand = _split(params.get('expand', ''))
+    unknown = [name for name in expand if name not in resource.expand]
+    if unknown:
+        raise APIError(f'Cannot expand: {", ".join(unknown)}.')
+
+    filters = {}
+    for name, (lookup, convert) in resource.filters.items():
+        if params.get(name):
+            filters[lookup] = convert(params[name], name)
+
+    limit = _to_int(params.get('limit', DEFAULT_PAGE_SIZE), 'limit')
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise APIError(f'"limit" must be between 1 and {MAX_PAGE_SIZE}.')
+
+    after = params.get('after')
+    after = _to_int(after, 'after') if after else None
+
+    return fields, expand, filters, limit, after
+
+
+def fetch_rows(resource, fields, expand, filters, limit=None, after=None, pk=None):
+    """
+    Fetch values() rows and embed expansions. Related objects are loaded
+    with one IN query per expansion, like prefetch_related, but without
+    building model instances.
+    """
+    columns = set(resource.columns(fields))
+    for name in expand:
+        relation = resource.expand[name]
+        if isinstance(relation, One):
+            columns.add(relation.column)
+
+    queryset = resource.model.objects.filter(**resource.base_filters).filter(**filters)
+    if pk is not None:
+        queryset = queryset.filter(pk=pk)
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+    if any('__' in lookup for lookup in filters):
+        queryset = queryset.distinct()
+    queryset = queryset.order_by('id').values(*columns)
+    if limit is not None:
+        queryset = queryset[:limit + 1]
+    rows = list(queryset)
+
+    has_more = limit is not None and len(rows) > limit
+    rows = rows[:limit] if limit is not None else rows
+
+    data = [resource.serialize(row, fields) for row in rows]
+    for name in expand:
+        related = resource.expand[name].fetch(rows)
+        for item in data:
+            item[name] = related[item['id']]
+    return data, has_more
@@ -0,0 +1,29 @@
+from datetime import time as clock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from main.models import Restaurant, Review
+
+
+class ReviewListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner')
+        cls.user = User.objects.create_user('customer')
+        cls.open, cls.deleted = Restaurant.objects.bulk_create([
+            Restaurant(name=name, owner=owner, opening_time=clock(9), closing_time=clock(22))
+            for name in ('Open', 'Deleted')
+        ])
+        cls.visible = Review.objects.create(user=cls.user, restaurant=cls.open, rating=4)
+        cls.hidden = Review.objects.create(user=cls.user, restaurant=cls.deleted, rating=1)
+        Restaurant.all_objects.filter(pk=cls.deleted.pk).update(deleted_at=timezone.now())
+
+    def test_reviews_of_deleted_restaurants_are_hidden(self):
+        response = self.client.get(reverse('api:review_list'))
+        self.assertEqual([review['id'] for review in response.json()['data']], [self.visible.pk])
+        response = self.client.get(reverse('api:review_list'), {'restaurant': self.deleted.pk})
+        self.assertEqual(response.json()['data'], [])
+        self.assertEqual(self.client.get(reverse('api:review_detail', args=[self.hidden.pk])).status_code, 404)
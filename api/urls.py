@@ -0,0 +1,15 @@
+from django.urls import path
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    path('v1/restaurants/', views.resource_list, {'resource': 'restaurants'}, name='restaurant_list'),
+    path('v1/restaurants/<int:pk>/', views.resource_detail, {'resource': 'restaurants'}, name='restaurant_detail'),
+    path('v1/dishes/', views.resource_list, {'resource': 'dishes'}, name='dish_list'),
+    path('v1/dishes/<int:pk>/', views.resource_detail, {'resource': 'dishes'}, name='dish_detail'),
+    path('v1/cuisines/', views.resource_list, {'resource': 'cuisines'}, name='cuisine_list'),
+    path('v1/cuisines/<int:pk>/', views.resource_detail, {'resource': 'cuisines'}, name='cuisine_detail'),
+    path('v1/reviews/', views.resource_list, {'resource': 'reviews'}, name='review_list'),
+    path('v1/reviews/<int:pk>/', views.resource_detail, {'resource': 'reviews'}, name='review_detail'),
+]
@@ -0,0 +1,69 @@
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_safe
+
+from .resources import RESOURCES, APIError, fetch_rows, parse_query
+from main.query_budget import query_budget
+
+
+def _json_response(request, payload, status=200):
+    """Serialize once, tag with a content ETag and honour If-None-Match"""
+    body = json.dumps(payload, cls=DjangoJSONEncoder)
+    etag = quote_etag(hashlib.md5(body.encode()).hexdigest())
+
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    response = HttpResponse(body, content_type='application/json', status=status)
+    response['ETag'] = etag
+    return response
+
+
+def _error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+@query_budget(6)
+@require_safe
+def resource_list(request, resource):
+    """Keyset-paginated list of a catalog resource"""
+    spec = RESOURCES[resource]
+    try:
+        fields, expand, filters, limit, after = parse_query(spec, request.GET)
+    except APIError as e:
+        return _error(str(e))
+
+    data, has_more = fetch_rows(spec, fields, expand, filters, limit=limit, after=after)
+
+    next_url = None
+    if has_more:
+        params = request.GET.copy()
+        params['after'] = data[-1]['id']
+        next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+    return _json_response(request, {'data': data, 'next': next_url})
+
+
+@query_budget(5)
+@require_safe
+def resource_detail(request, resource, pk):
+    """Single catalog object"""
+    spec = RESOURCES[resource]
+    try:
+        fields, expand, _, _, _ = parse_query(spec, {
+            'fields': request.GET.get('fields', ''),
+            'expand': request.GET.get('expand', ''),
+        })
+    except APIError as e:
+        return _error(str(e))
+
+    data, _ = fetch_rows(spec, fields, expand, {}, pk=pk)
+    if not data:
+        return _error('Not found.', status=404)
+    return _json_response(request, {'data': data[0]})
@@ -0,0 +1,86 @@
+"""
+Minimal local stand-in for the Stripe Checkout API.
+
+Point the site at it with ``STRIPE_API_BASE=http://127.0.0.1:<port>`` (and
+any ``STRIPE_SECRET_KEY``). It answers ``POST /v1/checkout/sessions`` like
+Stripe does, remembers the sessions, and ``signed_webhook()`` builds the
+``checkout.session.completed`` delivery Stripe would send afterwards.
+"""
+import hashlib
+import hmac
+import itertools
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/v1/checkout/sessions':
+            self._send_json(404, {'error': {'type': 'invalid_request_error', 'message': f'Unknown path {self.path}'}})
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        form = parse_qs(self.rfile.read(length).decode())
+        # Unique across runs, since Order.stripe_session_id is unique
+        session_id = f'cs_test_fake_{self.server.run_id}_{next(self.server.counter)}'
+        session = {
+            'id': session_id,
+            'object': 'checkout.session',
+            'mode': 'payment',
+            'payment_status': 'unpaid',
+            'url': f'http://{self.server.server_address[0]}:{self.server.server_address[1]}/pay/{session_id}',
+            'metadata': {
+                key[len('metadata['):-1]: values[0]
+                for key, values in form.items() if key.startswith('metadata[')
+            },
+        }
+        with self.server.lock:
+            self.server.sessions[session_id] = session
+        self._send_json(200, session)
+
+    def do_GET(self):
+        # The hosted payment page; the load test "pays" by sending the webhook
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.end_headers()
+        self.wfile.write(b'Fake Stripe checkout page')
+
+
+def start_fake_stripe(host='127.0.0.1', port=12111):
+    """Start the stand-in in a daemon thread and return the server"""
+    server = ThreadingHTTPServer((host, port), FakeStripeHandler)
+    server.daemon_threads = True
+    server.sessions = {}
+    server.lock = threading.Lock()
+    server.counter = itertools.count(1)
+    server.run_id = uuid.uuid4().hex[:8]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def signed_webhook(session_id, secret):
+    """Body and Stripe-Signature header for a checkout.session.completed event"""
+    payload = json.dumps({
+        'id': f'evt_{session_id}',
+        'object': 'event',
+        'type': 'checkout.session.completed',
+        'data': {'object': {'id': session_id, 'object': 'checkout.session', 'payment_status': 'paid'}},
+    })
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+    return payload, f't={timestamp},v1={signature}'
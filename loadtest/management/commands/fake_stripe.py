@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from loadtest.fake_stripe import start_fake_stripe
+
+
+class Command(BaseCommand):
+    help = 'Run the local Stripe Checkout stand-in until interrupted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=12111)
+
+    def handle(self, *args, **options):
+        server = start_fake_stripe(options['host'], options['port'])
+        host, port = server.server_address[:2]
+        self.stdout.write(f'Fake Stripe listening on http://{host}:{port}')
+        self.stdout.write(f'Start the site with STRIPE_API_BASE=http://{host}:{port} and any STRIPE_SECRET_KEY')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
@@ -0,0 +1,85 @@
+import itertools
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from loadtest.fake_stripe import start_fake_stripe
+from loadtest.scenarios import Stats, VirtualUser
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive concurrent user journeys (signup/login, explore, restaurant detail, '
+        'add to cart, checkout, webhook) against a running server and report '
+        'throughput, error rate and latency percentiles per step. Start the server '
+        'under test with RATE_LIMIT_ENABLED=0: every virtual user shares one IP.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--users', default='10',
+                            help='Concurrent virtual users; a comma separated list runs one stage per value, e.g. 10,50,100')
+        parser.add_argument('--iterations', type=int, default=5, help='Journeys per virtual user')
+        parser.add_argument('--ramp-up', type=float, default=0, help='Seconds over which users are started')
+        parser.add_argument('--webhook-secret', default=None,
+                            help='Defaults to STRIPE_WEBHOOK_SECRET; must match the server under test')
+        parser.add_argument('--stripe-port', type=int, default=None,
+                            help='Also start the fake Stripe server on this port')
+
+    def handle(self, *args, **options):
+        secret = options['webhook_secret'] or getattr(settings, 'STRIPE_WEBHOOK_SECRET', None)
+        if not secret:
+            raise CommandError('A webhook secret is required (--webhook-secret or STRIPE_WEBHOOK_SECRET).')
+
+        if options['stripe_port']:
+            server = start_fake_stripe(port=options['stripe_port'])
+            self.stdout.write(f'Fake Stripe listening on http://127.0.0.1:{server.server_address[1]}')
+
+        try:
+            stages = [int(n) for n in options['users'].split(',')]
+        except ValueError:
+            raise CommandError('--users must be a number or a comma separated list of numbers.')
+
+        run_id = uuid.uuid4().hex[:6]
+        for stage, users in enumerate(stages, 1):
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'Stage {stage}: {users} user(s) x {options["iterations"]} journey(s)'
+            ))
+            stats = self.run_stage(options, users, secret, f'lt{run_id}s{stage}')
+            self.print_report(stats)
+
+    def run_stage(self, options, users, secret, prefix):
+        stats = Stats()
+        delay = options['ramp_up'] / users if users else 0
+        counter = itertools.count()
+
+        def run_user(index):
+            time.sleep(index * delay)
+            user = VirtualUser(options['base_url'], f'{prefix}u{index}', stats, secret)
+            for _ in range(options['iterations']):
+                if user.journey():
+                    next(counter)
+
+        with ThreadPoolExecutor(max_workers=users) as pool:
+            list(pool.map(run_user, range(users)))
+        stats.stop()
+        stats.completed = next(counter)
+        return stats
+
+    def print_report(self, stats):
+        elapsed, rows = stats.report()
+        total = sum(row['requests'] for row in rows)
+        self.stdout.write(
+            f'{stats.completed} journeys completed in {elapsed:.1f}s, '
+            f'{total} steps ({total / elapsed if elapsed else 0:.1f} steps/s)'
+        )
+        self.stdout.write(f'{"step":<18}{"count":>7}{"rps":>8}{"errors":>8}{"p50 ms":>9}{"p90 ms":>9}{"p99 ms":>9}{"max ms":>9}')
+        for row in rows:
+            line = (
+                f'{row["step"]:<18}{row["requests"]:>7}{row["rps"]:>8.1f}{row["error_rate"]:>8.1%}'
+                f'{row["p50"]:>9.1f}{row["p90"]:>9.1f}{row["p99"]:>9.1f}{row["max"]:>9.1f}'
+            )
+            self.stdout.write(self.style.ERROR(line) if row['error_rate'] else line)
@@ -0,0 +1,46 @@
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+
+from loadtest.slow_clients import run_target, summarize
+
+
+class Command(BaseCommand):
+    help = (
+        'Open many concurrent slow-client connections against one or more running '
+        'servers (e.g. a 1-worker WSGI and a 1-worker ASGI deployment) and compare '
+        'how many complete and how long they take.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True,
+                            help='name=base URL, e.g. wsgi=http://127.0.0.1:8000; repeat to compare servers')
+        parser.add_argument('--path', default='/explore/?sort=price', help='Page to request (a query string skips the prerendered copy)')
+        parser.add_argument('--connections', type=int, default=100)
+        parser.add_argument('--send-time', type=float, default=2.0, help='Seconds each client takes to send its request')
+        parser.add_argument('--chunks', type=int, default=10, help='Pieces the request is sent in')
+        parser.add_argument('--timeout', type=float, default=60.0, help='Seconds before a connection counts as failed')
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['target']:
+            name, sep, base_url = target.partition('=')
+            if not sep or not base_url.startswith('http://'):
+                raise CommandError(f'--target must look like name=http://host:port, not "{target}".')
+            targets.append((name, base_url.rstrip('/') + options['path']))
+
+        self.stdout.write(
+            f'{options["connections"]} connection(s) per target, each sending its request over '
+            f'{options["send_time"]:g}s, to {options["path"]}'
+        )
+        self.stdout.write(f'{"target":<12}{"ok":>6}{"errors":>8}{"wall s":>9}{"rps":>8}{"p50 ms":>10}{"p90 ms":>10}{"max ms":>10}')
+        for name, url in targets:
+            elapsed, results = asyncio.run(run_target(
+                url, options['connections'], options['send_time'], options['chunks'], options['timeout'],
+            ))
+            row = summarize(elapsed, results)
+            line = (
+                f'{name:<12}{row["ok"]:>6}{row["errors"]:>8}{row["elapsed"]:>9.1f}{row["rps"]:>8.1f}'
+                f'{row["p50"]:>10.0f}{row["p90"]:>10.0f}{row["max"]:>10.0f}'
+            )
+            self.stdout.write(self.style.ERROR(line) if row['errors'] else line)
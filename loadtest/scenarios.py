@@ -0,0 +1,198 @@
+"""
+User journeys for the load test.
+
+Each virtual user has its own cookie jar and walks the order funnel:
+signup/login, explore, restaurant detail, add to cart, checkout against the
+fake Stripe server, and the payment webhook. Every step is timed.
+"""
+import http.cookiejar
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode, urljoin
+
+from .fake_stripe import signed_webhook
+
+
+STEPS = ('signup', 'login', 'explore', 'restaurant_detail', 'add_to_cart', 'checkout', 'webhook')
+
+DISH_RE = re.compile(r'data-dish-id="(\d+)"')
+DISH_LINK_RE = re.compile(r'href="/dish/(\d+)/"')
+RESTAURANT_RE = re.compile(r'href="/restaurant/(\d+)/"')
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class StepFailed(Exception):
+    pass
+
+
+class Stats:
+    """Thread-safe per-step latency and error collection"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {step: [] for step in STEPS}
+        self.errors = {step: 0 for step in STEPS}
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def record(self, step, seconds, ok):
+        with self.lock:
+            self.latencies[step].append(seconds)
+            if not ok:
+                self.errors[step] += 1
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    def report(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        rows = []
+        for step in STEPS:
+            values = sorted(self.latencies[step])
+            if not values:
+                continue
+            pick = lambda pct: values[min(int(len(values) * pct), len(values) - 1)] * 1000
+            rows.append({
+                'step': step,
+                'requests': len(values),
+                'rps': len(values) / elapsed if elapsed else 0,
+                'error_rate': self.errors[step] / len(values),
+                'p50': pick(0.50),
+                'p90': pick(0.90),
+                'p99': pick(0.99),
+                'max': values[-1] * 1000,
+            })
+        return elapsed, rows
+
+
+class VirtualUser:
+    def __init__(self, base_url, name, stats, webhook_secret, password='Qx7!mealmate-bench'):
+        self.base_url = base_url
+        self.name = name
+        self.stats = stats
+        self.webhook_secret = webhook_secret
+        self.password = password
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), NoRedirect,
+        )
+        self.signed_up = False
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def request(self, path, data=None, headers=None):
+        """Return (status, body, location) without following redirects"""
+        url = urljoin(self.base_url, path)
+        headers = dict(headers or {})
+        body = None
+        if data is not None:
+            headers.setdefault('Content-Type', 'application/x-www-form-urlencoded')
+            headers.setdefault('X-CSRFToken', self.csrf_token())
+            headers.setdefault('Referer', url)
+            body = data.encode() if isinstance(data, str) else urlencode(data).encode()
+        req = urllib.request.Request(url, data=body, headers=headers, method='POST' if body is not None else 'GET')
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                return response.status, response.read().decode('utf-8', 'replace'), None
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode('utf-8', 'replace'), e.headers.get('Location')
+
+    def step(self, name, func):
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = func()
+            ok = True
+            return result
+        except (StepFailed, OSError):
+            raise StepFailed(name)
+        finally:
+            self.stats.record(name, time.perf_counter() - start, ok)
+
+    def expect(self, response, *codes):
+        if response[0] not in codes:
+            raise StepFailed(f'HTTP {response[0]}')
+        return response
+
+    # -- journey steps --------------------------------------------------
+
+    def signup(self):
+        self.expect(self.request('/accounts/signup/'), 200)
+        self.expect(self.request('/accounts/signup/', {
+            'csrfmiddlewaretoken': self.csrf_token(),
+            'username': self.name,
+            'email': f'{self.name}@example.com',
+            'password1': self.password,
+            'password2': self.password,
+            'role': 'user',
+        }), 302)
+        self.signed_up = True
+
+    def login(self):
+        self.cookies.clear()
+        self.expect(self.request('/accounts/login/'), 200)
+        self.expect(self.request('/accounts/login/', {
+            'csrfmiddlewaretoken': self.csrf_token(),
+            'username': self.name,
+            'password': self.password,
+        }), 302)
+
+    def explore(self):
+        body = self.expect(self.request('/explore/'), 200)[1]
+        return DISH_RE.findall(body), RESTAURANT_RE.findall(body)
+
+    def restaurant_detail(self, restaurant_id):
+        body = self.expect(self.request(f'/restaurant/{restaurant_id}/'), 200)[1]
+        return DISH_LINK_RE.findall(body)
+
+    def add_to_cart(self, dish_id):
+        self.expect(self.request(
+            f'/cart/add/{dish_id}/?ajax=1',
+            {'quantity': 1, 'csrfmiddlewaretoken': self.csrf_token()},
+            {'X-Requested-With': 'XMLHttpRequest'},
+        ), 200)
+
+    def checkout(self):
+        status, _, location = self.expect(self.request('/checkout/create/'), 302, 303)
+        if not location or '/pay/' not in location:
+            raise StepFailed('checkout did not redirect to the payment page')
+        return location.rsplit('/', 1)[-1]
+
+    def webhook(self, session_id):
+        payload, signature = signed_webhook(session_id, self.webhook_secret)
+        self.expect(self.request('/webhooks/stripe/', payload, {
+            'Content-Type': 'application/json',
+            'Stripe-Signature': signature,
+        }), 200)
+
+    def journey(self):
+        """One pass through the funnel; stops at the first failed step"""
+        try:
+            if self.signed_up:
+                self.step('login', self.login)
+            else:
+                self.step('signup', self.signup)
+            dishes, restaurants = self.step('explore', self.explore)
+            if restaurants:
+                dishes = self.step('restaurant_detail', lambda: self.restaurant_detail(random.choice(restaurants))) or dishes
+            if not dishes:
+                return False
+            for dish_id in random.sample(dishes, min(len(dishes), random.randint(1, 3))):
+                self.step('add_to_cart', lambda: self.add_to_cart(dish_id))
+            session_id = self.step('checkout', self.checkout)
+            self.step('webhook', lambda: self.webhook(session_id))
+            return True
+        except StepFailed:
+            return False
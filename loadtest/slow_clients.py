@@ -0,0 +1,70 @@
+"""
+Many slow clients against one server.
+
+Every connection trickles its request out over ``send_time`` seconds, the
+way a phone on a weak network does, then reads the whole response. A
+synchronous WSGI worker is tied up by each connection until it finishes;
+an ASGI server parks it as a coroutine, so one worker keeps up with all of
+them. Plain asyncio sockets keep the client itself from being the limit.
+"""
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+
+async def slow_request(url, send_time, chunks, timeout):
+    """(ok, seconds from connect to the last response byte, status)"""
+    parts = urlsplit(url)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    request = (
+        f'GET {path} HTTP/1.1\r\n'
+        f'Host: {parts.netloc}\r\n'
+        'User-Agent: mealmate-slowclients\r\n'
+        'Accept: text/html\r\n'
+        'Connection: close\r\n\r\n'
+    ).encode()
+    step = max(len(request) // chunks, 1)
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(parts.hostname, parts.port or 80), timeout,
+        )
+        try:
+            for offset in range(0, len(request), step):
+                writer.write(request[offset:offset + step])
+                await writer.drain()
+                await asyncio.sleep(send_time / chunks)
+            response = await asyncio.wait_for(reader.read(), timeout)
+        finally:
+            writer.close()
+    except (OSError, asyncio.TimeoutError):
+        return False, time.perf_counter() - start, None
+    status_line = response.split(b'\r\n', 1)[0].split()
+    status = int(status_line[1]) if len(status_line) > 1 and status_line[1].isdigit() else None
+    return status == 200, time.perf_counter() - start, status
+
+
+async def run_target(url, connections, send_time, chunks, timeout):
+    """Open all connections at once; returns (wall seconds, [(ok, seconds, status), ...])"""
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        slow_request(url, send_time, chunks, timeout) for _ in range(connections)
+    ))
+    return time.perf_counter() - start, results
+
+
+def summarize(elapsed, results):
+    values = sorted(seconds for ok, seconds, _ in results if ok)
+    pick = lambda pct: values[min(int(len(values) * pct), len(values) - 1)] * 1000 if values else 0
+    return {
+        'connections': len(results),
+        'ok': len(values),
+        'errors': len(results) - len(values),
+        'elapsed': elapsed,
+        'rps': len(values) / elapsed if elapsed else 0,
+        'p50': pick(0.50),
+        'p90': pick(0.90),
+        'max': values[-1] * 1000 if values else 0,
+    }
@@ -1,5 +1,57 @@
-from django.contrib import admin
-from .models import Restaurant, Dish, Cuisine, Cart, CartItem, Order, OrderItem, Review
+from decimal import Decimal
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.contrib.auth.models import User
+from django.db.models import Count, DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce, Round
+from django.shortcuts import redirect
+from django.utils.html import format_html_join
+from django.utils.safestring import mark_safe
+from .signals import refresh_catalog
+from .models import Restaurant, Dish, Cuisine, Cart, CartItem, Order, OrderItem, Review, LeaderboardEntry, ArchivedOrder
+
+
+class RestaurantActionForm(ActionForm):
+    owner = forms.ModelChoiceField(
+        queryset=User.objects.filter(profile__role='staff').order_by('username'),
+        required=False,
+        label='New owner',
+    )
+
+
+class DishActionForm(ActionForm):
+    percent = forms.DecimalField(
+        required=False,
+        min_value=Decimal('-99'),
+        max_digits=5,
+        decimal_places=2,
+        label='Change price by %',
+    )
+
+
+def action_form_value(modeladmin, request, name):
+    """Cleaned value of an extra action bar field, or None if missing or invalid"""
+    form = modeladmin.action_form(request.POST)
+    form.fields['action'].choices = modeladmin.get_action_choices(request)
+    if not form.is_valid():
+        return None
+    return form.cleaned_data[name]
+
+
+@admin.action(description='Mark selected as featured')
+def make_featured(modeladmin, request, queryset):
+    updated = queryset.update(featured=True)
+    refresh_catalog()  # update() skips the model signals
+    modeladmin.message_user(request, f'{updated} marked as featured.', messages.SUCCESS)
+
+
+@admin.action(description='Remove selected from featured')
+def make_unfeatured(modeladmin, request, queryset):
+    updated = queryset.update(featured=False)
+    refresh_catalog()
+    modeladmin.message_user(request, f'{updated} removed from featured.', messages.SUCCESS)
 
 
 @admin.register(Cuisine)
@@ -10,8 +62,11 @@ class CuisineAdmin(admin.ModelAdmin):
 
 @admin.register(Restaurant)
 class RestaurantAdmin(admin.ModelAdmin):
-    list_display = ('name', 'owner', 'opening_time', 'closing_time', 'created_at', 'display_cuisines', 'display_image')
-    list_filter = ('created_at', 'cuisines')
+    list_display = ('name', 'owner', 'featured', 'opening_time', 'closing_time', 'created_at', 'display_cuisines', 'display_image')
+    list_filter = ('featured', 'created_at', 'cuisines')
+    list_select_related = ('owner',)
+    actions = [make_featured, make_unfeatured, 'reassign_owner']
+    action_form = RestaurantActionForm
     search_fields = ('name', 'description', 'owner__username')
     readonly_fields = ('created_at', 'updated_at', 'display_image')
     filter_horizontal = ('cuisines',)
@@ -28,9 +83,21 @@ class RestaurantAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('cuisines')
+
     def display_cuisines(self, obj):
         return ", ".join([cuisine.name for cuisine in obj.cuisines.all()])
     display_cuisines.short_description = 'Cuisines'
+
+    @admin.action(description='Reassign selected to the chosen owner')
+    def reassign_owner(self, request, queryset):
+        owner = action_form_value(self, request, 'owner')
+        if owner is None:
+            self.message_user(request, 'Choose a staff user as the new owner.', messages.ERROR)
+            return
+        updated = queryset.update(owner=owner)
+        self.message_user(request, f'{updated} restaurant(s) now owned by {owner.username}.', messages.SUCCESS)
     
     def display_image(self, obj):
         if obj.image:
@@ -42,8 +109,11 @@ class RestaurantAdmin(admin.ModelAdmin):
 
 @admin.register(Dish)
 class DishAdmin(admin.ModelAdmin):
-    list_display = ('name', 'restaurant', 'price', 'created_at', 'display_image')
-    list_filter = ('restaurant', 'created_at')
+    list_display = ('name', 'restaurant', 'price', 'featured', 'created_at', 'display_image')
+    list_filter = ('featured', 'restaurant', 'created_at')
+    list_select_related = ('restaurant',)
+    actions = [make_featured, make_unfeatured, 'reprice']
+    action_form = DishActionForm
     search_fields = ('name', 'description', 'restaurant__name')
     readonly_fields = ('created_at', 'updated_at', 'display_image')
     
@@ -66,6 +136,17 @@ class DishAdmin(admin.ModelAdmin):
     display_image.allow_tags = True
     display_image.short_description = 'Image Preview'
 
+    @admin.action(description='Change price of selected %(verbose_name_plural)s by the given %%')
+    def reprice(self, request, queryset):
+        percent = action_form_value(self, request, 'percent')
+        if percent is None:
+            self.message_user(request, 'Enter a percentage (e.g. 10 or -15).', messages.ERROR)
+            return
+        factor = Value(1 + percent / 100, output_field=DecimalField(max_digits=8, decimal_places=4))
+        updated = queryset.update(price=Round(F('price') * factor, 2))
+        refresh_catalog()
+        self.message_user(request, f'Repriced {updated} dish(es) by {percent}%.', messages.SUCCESS)
+
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
@@ -73,14 +154,27 @@ class CartAdmin(admin.ModelAdmin):
     list_filter = ('created_at', 'updated_at')
     search_fields = ('user__username', 'user__email')
     readonly_fields = ('created_at', 'updated_at')
-    
+    list_select_related = ('user',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            item_count=Count('items'),
+            total=Coalesce(
+                Sum(F('items__dish__price') * F('items__quantity')),
+                Value(0),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+
     def get_item_count(self, obj):
-        return obj.items.count()
+        return obj.item_count
     get_item_count.short_description = 'Items'
-    
+    get_item_count.admin_order_field = 'item_count'
+
     def get_total(self, obj):
-        return f"${obj.get_total():.2f}"
+        return f"${obj.total:.2f}"
     get_total.short_description = 'Total'
+    get_total.admin_order_field = 'total'
 
 
 @admin.register(CartItem)
@@ -89,6 +183,7 @@ class CartItemAdmin(admin.ModelAdmin):
     list_filter = ('created_at', 'cart__user')
     search_fields = ('dish__name', 'cart__user__username')
     readonly_fields = ('created_at', 'updated_at')
+    list_select_related = ('dish__restaurant', 'cart__user')
     
     def get_subtotal(self, obj):
         return f"${obj.get_subtotal():.2f}"
@@ -113,6 +208,7 @@ class OrderAdmin(admin.ModelAdmin):
     list_filter = ('payment_status', 'created_at')
     search_fields = ('user__username', 'user__email', 'stripe_session_id', 'id')
     readonly_fields = ('created_at', 'updated_at')
+    list_select_related = ('user',)
     inlines = [OrderItemInline]
     
     fieldsets = (
@@ -124,13 +220,44 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
 
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        # Links to an order that has since been archived still land on it
+        if object_id.isdigit() and not Order.objects.filter(pk=object_id).exists():
+            if ArchivedOrder.objects.filter(pk=object_id).exists():
+                return redirect('admin:main_archivedorder_change', object_id)
+        return super().change_view(request, object_id, form_url, extra_context)
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'total_price', 'payment_status', 'created_at', 'archived_at')
+    list_filter = ('payment_status', 'created_at')
+    search_fields = ('user__username', 'user__email', 'stripe_session_id', 'id')
+    list_select_related = ('user',)
+    fields = ('id', 'user', 'total_price', 'payment_status', 'stripe_session_id', 'display_items', 'created_at', 'updated_at', 'archived_at')
+    readonly_fields = fields
+
+    @admin.display(description='Items')
+    def display_items(self, obj):
+        return format_html_join(
+            mark_safe('<br>'), '{} x {} @ ₹{}',
+            ((item.quantity, item.dish_name, item.price) for item in obj.get_line_items()),
+        )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
-    list_display = ('id', 'order', 'dish', 'quantity', 'price', 'get_subtotal')
+    list_display = ('id', 'order', 'dish_name', 'quantity', 'price', 'get_subtotal')
     list_filter = ('order__payment_status', 'order__created_at')
-    search_fields = ('order__id', 'dish__name', 'order__user__username')
+    search_fields = ('order__id', 'dish_name', 'order__user__username')
     readonly_fields = ('get_subtotal',)
+    list_select_related = ('order__user',)
     
     def get_subtotal(self, obj):
         return f"${obj.get_subtotal():.2f}"
@@ -143,8 +270,20 @@ class ReviewAdmin(admin.ModelAdmin):
     list_filter = ('rating', 'created_at', 'restaurant')
     search_fields = ('user__username', 'restaurant__name', 'comment')
     readonly_fields = ('created_at',)
+    list_select_related = ('user', 'restaurant')
     
     def has_comment(self, obj):
         return bool(obj.comment)
     has_comment.boolean = True
     has_comment.short_description = 'Has Comment'
+
+
+@admin.register(LeaderboardEntry)
+class LeaderboardEntryAdmin(admin.ModelAdmin):
+    list_display = ('board', 'rank', 'restaurant', 'score', 'computed_at')
+    list_filter = ('board',)
+    list_select_related = ('restaurant',)
+    readonly_fields = ('board', 'rank', 'restaurant', 'score', 'computed_at')
+
+    def has_add_permission(self, request):
+        return False
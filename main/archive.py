@@ -0,0 +1,77 @@
+"""
+Moving old, finished orders out of the live ``Order``/``OrderItem`` tables.
+
+``archive_orders()`` copies orders in a final status (``ORDER_ARCHIVE_STATUSES``)
+older than ``ORDER_ARCHIVE_AFTER_DAYS`` into ``ArchivedOrder`` rows, one per
+order with its items packed into a JSON list, and deletes the originals in
+the same transaction, a batch of ids at a time. A batch interrupted half way
+rolls back whole and is redone by the next run. Archived orders keep their
+id; ``user_orders()`` and the exports in main.exports read both tables.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedOrder, Order, OrderItem
+
+
+def archive_cutoff(now=None):
+    days = getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 180)
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def archivable_orders(before=None):
+    statuses = getattr(settings, 'ORDER_ARCHIVE_STATUSES', ('PAID', 'FAILED', 'CANCELLED'))
+    return Order.objects.filter(payment_status__in=statuses, created_at__lt=before or archive_cutoff())
+
+
+def _archive_batch(ids):
+    packed = {pk: [] for pk in ids}
+    for order_id, dish_id, dish_name, quantity, price in (
+        OrderItem.objects.filter(order_id__in=ids).order_by('id')
+        .values_list('order_id', 'dish_id', 'dish_name', 'quantity', 'price')
+    ):
+        packed[order_id].append([dish_id, dish_name, quantity, str(price)])
+
+    archived = [
+        ArchivedOrder(
+            id=order.id,
+            user_id=order.user_id,
+            total_price=order.total_price,
+            payment_status=order.payment_status,
+            stripe_session_id=order.stripe_session_id,
+            items=packed[order.id],
+            created_at=order.created_at,
+            updated_at=order.updated_at,
+        )
+        for order in Order.objects.filter(pk__in=ids)
+    ]
+    # No ignore_conflicts: a skipped insert must abort the batch, not lose the order
+    ArchivedOrder.objects.bulk_create(archived)
+    OrderItem.objects.filter(order_id__in=ids).delete()
+    Order.objects.filter(pk__in=ids).delete()
+    return len(archived)
+
+
+def archive_orders(before=None, batch_size=None, max_batches=None):
+    """Archive eligible orders oldest first; yields the number moved per batch"""
+    batch_size = batch_size or getattr(settings, 'ORDER_ARCHIVE_BATCH_SIZE', 500)
+    candidates = archivable_orders(before).order_by('id').values_list('id', flat=True)
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            ids = list(candidates[:batch_size])
+            if not ids:
+                return
+            moved = _archive_batch(ids)
+        batches += 1
+        yield moved
+
+
+def user_orders(user):
+    """Live and archived orders of ``user``, newest first; both have get_line_items()"""
+    live = list(Order.objects.filter(user=user).prefetch_related('items').order_by('-created_at'))
+    archived = list(ArchivedOrder.objects.filter(user=user).order_by('-created_at'))
+    return sorted(live + archived, key=lambda order: order.created_at, reverse=True)
@@ -0,0 +1,96 @@
+"""
+Async versions of the read-only catalog pages.
+
+Used in place of the views in main.views when ``ASYNC_VIEWS`` is on (see
+the deployment notes in restaurant_project/asgi.py). They load data with the
+async ORM, start independent queries together with ``asyncio.gather`` and
+render in a worker thread, so under an ASGI server a request waiting on the
+database or a slow client holds a coroutine rather than a whole worker.
+
+Django runs async ORM calls on one shared thread per event loop, so the
+gathered queries overlap with each other's Python work and with other
+requests, not with each other on the database.
+"""
+import asyncio
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.http import Http404
+from django.shortcuts import render
+
+from .catalog import parse_catalog_filters, search_catalog
+from .leaderboards import leaderboard_restaurants
+from .models import Dish, Restaurant, Review
+from .reviews import decode_cursor, rating_summary, review_page
+from .templating import render_hot
+from .views import explore_context, reviews_context
+
+
+async def _get_or_404(queryset, **lookup):
+    try:
+        return await queryset.aget(**lookup)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+
+
+async def _auser(request):
+    # Templates read request.user, which does not share request.auser()'s cache
+    request.user = await request.auser()
+    return request.user
+
+
+async def _list(queryset):
+    return [obj async for obj in queryset]
+
+
+async def explore(request):
+    filters = parse_catalog_filters(request.GET)
+    featured_restaurants, featured_dishes, catalog, boards = await asyncio.gather(
+        _list(Restaurant.objects.filter(featured=True)[:10]),
+        _list(Dish.objects.filter(featured=True)[:10]),
+        sync_to_async(search_catalog)(filters),
+        sync_to_async(leaderboard_restaurants)(),
+    )
+    context = explore_context(featured_restaurants, featured_dishes, filters, catalog, boards)
+    return await sync_to_async(render_hot)(request, 'main/explore.html', context)
+
+
+@login_required
+async def restaurant_detail(request, restaurant_id):
+    user = await _auser(request)
+    restaurant = await _get_or_404(Restaurant.objects, pk=restaurant_id)
+    dishes, has_reviewed = await asyncio.gather(
+        _list(restaurant.dishes.all()),
+        Review.objects.filter(restaurant=restaurant, user_id=user.id).aexists(),
+    )
+    context = {
+        'restaurant': restaurant,
+        'dishes': dishes,
+        'can_edit': user.is_superuser or restaurant.owner_id == user.id,
+        'has_reviewed': has_reviewed,
+    }
+    return await sync_to_async(render_hot)(request, 'main/restaurant_detail.html', context)
+
+
+async def dish_detail(request, dish_id):
+    dish = await _get_or_404(Dish.objects.select_related('restaurant'), pk=dish_id)
+    other_dishes = await _list(Dish.objects.filter(restaurant_id=dish.restaurant_id).exclude(pk=dish.id)[:6])
+    context = {
+        'dish': dish,
+        'other_dishes': other_dishes,
+        'idempotency_key': uuid.uuid4().hex,
+    }
+    return await sync_to_async(render)(request, 'main/dish_detail.html', context)
+
+
+async def restaurant_reviews(request, restaurant_id):
+    user = await _auser(request)
+    restaurant = await _get_or_404(Restaurant.objects, pk=restaurant_id)
+    cursor = decode_cursor(request.GET.get('after'))
+    (reviews, next_cursor), summary = await asyncio.gather(
+        sync_to_async(review_page)(restaurant, cursor),
+        sync_to_async(rating_summary)(restaurant, user),
+    )
+    context = reviews_context(restaurant, cursor, reviews, next_cursor, summary)
+    return await sync_to_async(render)(request, 'main/restaurant_reviews.html', context)
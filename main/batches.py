@@ -0,0 +1,19 @@
+"""Working through large querysets in short transactions."""
+from django.db import transaction
+
+
+def in_batches(queryset, action, batch_size):
+    """
+    Apply ``action`` to ``queryset`` in pk batches of ``batch_size``, one
+    transaction each, until nothing matches; returns the rows handled.
+    ``action`` gets a queryset of the batch's pks on the model's base manager
+    and must make them stop matching (delete or update them).
+    """
+    total = 0
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return total
+            action(queryset.model._base_manager.filter(pk__in=ids))
+        total += len(ids)
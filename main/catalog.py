@@ -0,0 +1,251 @@
+"""
+Explore page filtering, sorting, facets and pagination.
+
+``parse_catalog_filters()`` turns the query string into normalized filters
+whose ``key`` is the same for every spelling of the same request, and
+``search_catalog()`` caches its results under that key. Each facet (dishes
+per cuisine, per price bucket and per restaurant) is one grouped query that
+applies every filter except its own, so the counts show what picking another
+value would return.
+"""
+import hashlib
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, Exists, F, IntegerField, OuterRef, Q, When
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from .models import Dish, Restaurant
+
+
+CATALOG_PAGE_SIZE = 24
+
+SORTS = {
+    'name': ('name', 'id'),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+    'rating': ('-restaurant__average_rating', 'name', 'id'),
+}
+SORT_CHOICES = [
+    ('name', 'Name'),
+    ('price', 'Price: low to high'),
+    ('-price', 'Price: high to low'),
+    ('rating', 'Restaurant rating'),
+]
+
+# (min, max) in rupees; max is exclusive, None means no upper bound
+PRICE_BUCKETS = [(0, 200), (200, 500), (500, 1000), (1000, None)]
+
+VERSION_KEY = 'catalog:version'
+
+
+def _format_price(price):
+    low, high = price
+    return f'{"" if low is None else low}-{"" if high is None else high}'
+
+
+def _parse_price(value):
+    """'200-500', '200-' or '-500' -> (min, max); None for anything else"""
+    if value.count('-') != 1:
+        return None
+    low, high = value.split('-')
+    try:
+        low = Decimal(low) if low else None
+        high = Decimal(high) if high else None
+    except InvalidOperation:
+        return None
+    if low is None and high is None or any(bound is not None and not bound.is_finite() for bound in (low, high)):
+        return None
+    return _normalize(low), _normalize(high)
+
+
+def _normalize(bound):
+    """200.00 and 200 give the same key"""
+    if bound is None or bound != bound.to_integral_value():
+        return bound
+    return int(bound)
+
+
+def catalog_price_value(filters):
+    """The price filter as it appears in the query string, or ''"""
+    return _format_price(filters['price']) if filters['price'] else ''
+
+
+def _ids(values):
+    return sorted({int(part) for value in values for part in value.split(',') if part.strip().isdigit()})
+
+
+def parse_catalog_filters(params):
+    """Normalized filters from a QueryDict; unknown or malformed values are dropped"""
+    restaurant = params.get('restaurant', '')
+    page = params.get('page', '')
+    sort = params.get('sort', 'name')
+    filters = {
+        'cuisine': _ids(params.getlist('cuisine')),
+        'price': _parse_price(params.get('price', '')),
+        'restaurant': int(restaurant) if restaurant.isdigit() else None,
+        'open_now': params.get('open_now') in ('1', 'true', 'on'),
+        'sort': sort if sort in SORTS else 'name',
+        'page': max(int(page), 1) if page.isdigit() else 1,
+    }
+    filters['key'] = hashlib.md5(catalog_querystring(filters).encode()).hexdigest()
+    return filters
+
+
+def catalog_querystring(filters, **changes):
+    """Canonical query string for ``filters`` with ``changes`` applied"""
+    filters = dict(filters, **changes)
+    params = [('cuisine', cuisine_id) for cuisine_id in filters['cuisine']]
+    if filters['price']:
+        params.append(('price', _format_price(filters['price'])))
+    if filters['restaurant']:
+        params.append(('restaurant', filters['restaurant']))
+    if filters['open_now']:
+        params.append(('open_now', 1))
+    if filters['sort'] != 'name':
+        params.append(('sort', filters['sort']))
+    if filters['page'] != 1:
+        params.append(('page', filters['page']))
+    return urlencode(params)
+
+
+def open_now_q(now=None):
+    """Dishes whose restaurant is open at ``now``, including past-midnight hours"""
+    current = timezone.localtime(now).time()
+    closing = F('restaurant__closing_time')
+    same_day = Q(restaurant__opening_time__lte=closing) & Q(
+        restaurant__opening_time__lte=current, restaurant__closing_time__gt=current,
+    )
+    overnight = Q(restaurant__opening_time__gt=closing) & (
+        Q(restaurant__opening_time__lte=current) | Q(restaurant__closing_time__gt=current)
+    )
+    return same_day | overnight
+
+
+def _filter_q(filters, exclude=None, now=None):
+    q = Q()
+    if filters['cuisine'] and exclude != 'cuisine':
+        # EXISTS rather than a join so dishes are not repeated per cuisine
+        q &= Q(Exists(Restaurant.cuisines.through.objects.filter(
+            restaurant_id=OuterRef('restaurant_id'), cuisine_id__in=filters['cuisine'],
+        )))
+    if filters['price'] and exclude != 'price':
+        low, high = filters['price']
+        if low is not None:
+            q &= Q(price__gte=low)
+        if high is not None:
+            q &= Q(price__lt=high)
+    if filters['restaurant'] and exclude != 'restaurant':
+        q &= Q(restaurant_id=filters['restaurant'])
+    if filters['open_now']:
+        q &= open_now_q(now)
+    return q
+
+
+def _cuisine_facet(filters, now):
+    rows = (
+        Dish.objects.filter(_filter_q(filters, 'cuisine', now))
+        .values('restaurant__cuisines__id', 'restaurant__cuisines__name')
+        .annotate(count=Count('id'))
+        .order_by('restaurant__cuisines__name')
+    )
+    return [
+        {
+            'id': row['restaurant__cuisines__id'],
+            'name': row['restaurant__cuisines__name'],
+            'count': row['count'],
+        }
+        for row in rows
+        # Restaurants without cuisines come back as one NULL group
+        if row['restaurant__cuisines__id'] is not None
+    ]
+
+
+def _price_facet(filters, now):
+    bucket = Case(
+        *[
+            When(Q(price__gte=low) & (Q(price__lt=high) if high is not None else Q()), then=index)
+            for index, (low, high) in enumerate(PRICE_BUCKETS)
+        ],
+        output_field=IntegerField(),
+    )
+    counts = dict(
+        Dish.objects.filter(_filter_q(filters, 'price', now))
+        .annotate(bucket=bucket)
+        .values('bucket')
+        .annotate(count=Count('id'))
+        .order_by()
+        .values_list('bucket', 'count')
+    )
+    return [
+        {
+            'value': _format_price((low, high)),
+            'label': f'₹{low}–₹{high}' if high is not None else f'₹{low}+',
+            'count': counts.get(index, 0),
+        }
+        for index, (low, high) in enumerate(PRICE_BUCKETS)
+    ]
+
+
+def _restaurant_facet(filters, now):
+    rows = (
+        Dish.objects.filter(_filter_q(filters, 'restaurant', now))
+        .values('restaurant_id', 'restaurant__name')
+        .annotate(count=Count('id'))
+        .order_by('restaurant__name')
+    )
+    return [
+        {'id': row['restaurant_id'], 'name': row['restaurant__name'], 'count': row['count']}
+        for row in rows
+    ]
+
+
+def _compute(filters, now):
+    dishes = Dish.objects.filter(_filter_q(filters, now=now))
+    total = dishes.count()
+    offset = (filters['page'] - 1) * CATALOG_PAGE_SIZE
+    ids = list(dishes.order_by(*SORTS[filters['sort']]).values_list('id', flat=True)[offset:offset + CATALOG_PAGE_SIZE])
+    return {
+        'ids': ids,
+        'total': total,
+        'facets': {
+            'cuisine': _cuisine_facet(filters, now),
+            'price': _price_facet(filters, now),
+            'restaurant': _restaurant_facet(filters, now),
+        },
+    }
+
+
+def invalidate_catalog_cache():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
+
+
+def search_catalog(filters, now=None):
+    """
+    Page of dishes plus facets for ``filters``. Ids and counts are cached
+    per filter key; the dishes themselves are always loaded fresh.
+    """
+    now = now or timezone.now()
+    key = f'catalog:{cache.get_or_set(VERSION_KEY, 1, None)}:{filters["key"]}'
+    if filters['open_now']:
+        # Opening hours change the answer minute by minute
+        key += timezone.localtime(now).strftime(':%H%M')
+    result = cache.get(key)
+    if result is None:
+        result = _compute(filters, now)
+        cache.set(key, result, getattr(settings, 'CATALOG_CACHE_TTL', 60))
+
+    by_id = Dish.objects.select_related('restaurant').in_bulk(result['ids'])
+    pages = max((result['total'] + CATALOG_PAGE_SIZE - 1) // CATALOG_PAGE_SIZE, 1)
+    return {
+        'dishes': [by_id[pk] for pk in result['ids'] if pk in by_id],
+        'total': result['total'],
+        'page': filters['page'],
+        'pages': pages,
+        'facets': result['facets'],
+    }
@@ -0,0 +1,72 @@
+"""
+Template context for every page.
+
+The navbar needs the user's role and how many items are in their cart. Both
+come from one query, cached per user for ``USER_SUMMARY_CACHE_TTL`` seconds
+and dropped by main.signals whenever a CartItem or Profile of theirs is
+saved or a dish in their cart is deleted; code that deletes cart items
+calls ``invalidate_user_summaries()``.
+On a cache hit the navbar costs no queries, and nothing is loaded for
+templates that do not use ``user_summary``.
+
+Summaries live in the ``USER_SUMMARY_CACHE`` alias. Invalidation only
+reaches the processes sharing that cache: with the default local-memory
+cache each worker keeps its own copy, and the others show the old role and
+cart count until their copy expires. Point it at a shared cache (e.g. Redis)
+when running more than one worker.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Sum
+from django.utils.functional import SimpleLazyObject
+
+
+ANONYMOUS = {'role': None, 'cart_items': 0}
+
+
+def _cache():
+    return caches[getattr(settings, 'USER_SUMMARY_CACHE', 'default')]
+
+
+def _key(user_id):
+    return f'user_summary:{user_id}'
+
+
+def user_summary(user):
+    """{'role': ..., 'cart_items': ...} for ``user``, from the cache when possible"""
+    if not user.is_authenticated:
+        return ANONYMOUS
+    summary = _cache().get(_key(user.pk))
+    if summary is None:
+        role, cart_items = (
+            User.objects.filter(pk=user.pk)
+            .annotate(cart_items=Sum('cart__items__quantity'))
+            .values_list('profile__role', 'cart_items')
+            .first()
+        ) or (None, None)
+        summary = {'role': role, 'cart_items': cart_items or 0}
+        _cache().set(_key(user.pk), summary, getattr(settings, 'USER_SUMMARY_CACHE_TTL', 300))
+    return summary
+
+
+def invalidate_user_summaries(user_ids):
+    keys = [_key(user_id) for user_id in set(user_ids) if user_id is not None]
+    if keys:
+        # After the commit, or another request could cache the old numbers again
+        transaction.on_commit(lambda: _cache().delete_many(keys))
+
+
+def invalidate_user_summary(user_id):
+    invalidate_user_summaries([user_id])
+
+
+def _request_summary(request):
+    if not hasattr(request, '_user_summary'):
+        request._user_summary = user_summary(request.user)
+    return request._user_summary
+
+
+def navbar(request):
+    return {'user_summary': SimpleLazyObject(lambda: _request_summary(request))}
@@ -0,0 +1,96 @@
+import threading
+import time
+
+from django.db.models import Q
+
+from .models import Cuisine
+
+
+# Other processes cannot signal us when they change cuisines, so the cache is
+# also rebuilt after this many seconds.
+CUISINE_CACHE_TTL = 300
+
+_lock = threading.Lock()
+_cache = {'by_key': None, 'choices': None, 'loaded_at': 0.0}
+
+
+def normalize_cuisine_name(name):
+    """Display form used when creating a cuisine ("north indian" -> "North indian")"""
+    return name.strip().capitalize()
+
+
+def cuisine_key(name):
+    return Cuisine.make_key(name)
+
+
+def _load():
+    by_key = {}
+    choices = []
+    for pk, name, key in Cuisine.objects.order_by('name').values_list('id', 'name', 'key'):
+        if key is not None:
+            by_key[key] = pk
+        choices.append((pk, name))
+    with _lock:
+        _cache['by_key'] = by_key
+        _cache['choices'] = choices
+        _cache['loaded_at'] = time.monotonic()
+    return by_key, choices
+
+
+def _cached():
+    with _lock:
+        by_key, choices = _cache['by_key'], _cache['choices']
+        fresh = time.monotonic() - _cache['loaded_at'] < CUISINE_CACHE_TTL
+    if by_key is None or not fresh:
+        return _load()
+    return by_key, choices
+
+
+def invalidate_cuisine_cache():
+    with _lock:
+        _cache['by_key'] = None
+        _cache['choices'] = None
+
+
+def cuisine_choices():
+    """(id, name) pairs for every cuisine, ordered by name"""
+    return _cached()[1]
+
+
+def parse_cuisine_names(value):
+    """Split a comma separated string into unique names, keeping the first spelling"""
+    names = {}
+    for name in (value or '').split(','):
+        if name.strip():
+            names.setdefault(cuisine_key(name), normalize_cuisine_name(name))
+    return names
+
+
+def resolve_cuisines(value):
+    """Return cuisine ids for a comma separated string, creating missing ones in bulk"""
+    names = parse_cuisine_names(value)
+    if not names:
+        return []
+
+    by_key = _cached()[0]
+    cached = {key: by_key[key] for key in names if key in by_key}
+    # Another process may have deleted or renamed a cached cuisine, so the
+    # cached ids are checked in the same query that looks up the rest
+    rows = list(
+        Cuisine.objects.filter(Q(pk__in=cached.values()) | Q(key__in=[key for key in names if key not in cached]))
+        .values_list('key', 'id')
+    )
+    ids = {key: pk for key, pk in rows if key in names}
+    stale = any(ids.get(key) != pk for key, pk in cached.items())
+
+    # bulk_create skips save(), so the key is set here
+    to_create = [Cuisine(name=names[key], key=key) for key in names if key not in ids]
+    if to_create:
+        Cuisine.objects.bulk_create(to_create, ignore_conflicts=True)
+        # ignore_conflicts means pks are not set on every backend
+        ids.update(Cuisine.objects.filter(key__in=[c.key for c in to_create]).values_list('key', 'id'))
+    if to_create or stale:
+        # bulk_create does not send post_save, and other processes do not signal us
+        invalidate_cuisine_cache()
+
+    return [ids[key] for key in names if key in ids]
@@ -0,0 +1,212 @@
+import csv
+import heapq
+import json
+from datetime import datetime, time, timedelta
+from itertools import islice
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import ArchivedOrder, Dish, Order, OrderItem
+
+
+# Rows are fetched from the database in chunks of this size so an export of
+# any length keeps a constant memory footprint.
+EXPORT_CHUNK_SIZE = 2000
+
+ORDER_FIELDS = (
+    'id', 'user__username', 'user__email', 'total_price',
+    'payment_status', 'stripe_session_id', 'created_at', 'updated_at',
+)
+
+ORDER_HEADER = (
+    'order_id', 'username', 'email', 'total_price',
+    'payment_status', 'stripe_session_id', 'created_at', 'updated_at',
+)
+
+ITEM_FIELDS = (
+    'order_id', 'order__user__username', 'order__payment_status', 'order__created_at',
+    'id', 'dish_id', 'dish_name', 'dish__restaurant_id', 'dish__restaurant__name',
+    'quantity', 'price',
+)
+
+ITEM_HEADER = (
+    'order_id', 'username', 'payment_status', 'order_created_at',
+    'item_id', 'dish_id', 'dish_name', 'restaurant_id', 'restaurant_name',
+    'quantity', 'price',
+)
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_LEVELS = ('items', 'orders')
+
+
+class ExportError(ValueError):
+    """Raised when export filters are invalid"""
+
+
+def _parse_day(value, name):
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise ExportError(f'Invalid {name} date "{value}", expected YYYY-MM-DD.')
+    return day
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def parse_filters(params):
+    """Validate export filters from a QueryDict (or any mapping)"""
+    filters = {}
+
+    start = params.get('start')
+    if start:
+        filters['start'] = _parse_day(start, 'start')
+
+    end = params.get('end')
+    if end:
+        filters['end'] = _parse_day(end, 'end')
+
+    restaurant = params.get('restaurant')
+    if restaurant:
+        try:
+            filters['restaurant'] = int(restaurant)
+        except (TypeError, ValueError):
+            raise ExportError(f'Invalid restaurant id "{restaurant}".')
+
+    status = params.get('status')
+    if status:
+        status = status.upper()
+        if status not in dict(Order.PAYMENT_STATUS_CHOICES):
+            raise ExportError(f'Invalid status "{status}".')
+        filters['status'] = status
+
+    return filters
+
+
+def _apply_filters(queryset, filters, prefix=''):
+    if 'start' in filters:
+        queryset = queryset.filter(**{f'{prefix}created_at__gte': _day_start(filters['start'])})
+    if 'end' in filters:
+        # The end date is inclusive
+        queryset = queryset.filter(**{f'{prefix}created_at__lt': _day_start(filters['end'] + timedelta(days=1))})
+    if 'status' in filters:
+        queryset = queryset.filter(**{f'{prefix}payment_status': filters['status']})
+    return queryset
+
+
+def _chunks(rows):
+    while chunk := list(islice(rows, EXPORT_CHUNK_SIZE)):
+        yield chunk
+
+
+def _archived_orders(filters):
+    orders = _apply_filters(ArchivedOrder.objects.all(), filters).order_by('created_at', 'id')
+    return orders.values_list(*ORDER_FIELDS, 'items').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def _dish_restaurants(dish_ids):
+    """{dish_id: (restaurant_id, restaurant_name, owner_id)}; purged dishes are missing"""
+    dishes = Dish.all_objects.filter(pk__in=dish_ids).values_list(
+        'id', 'restaurant_id', 'restaurant__name', 'restaurant__owner_id',
+    )
+    return {pk: rest for pk, *rest in dishes}
+
+
+def _archived_item_rows(user, filters):
+    owner_only = user is not None and not user.is_superuser
+    for chunk in _chunks(_archived_orders(filters)):
+        restaurants = _dish_restaurants({item[0] for *_, items in chunk for item in items if item[0]})
+        for order_id, username, _, _, status, _, created_at, _, items in chunk:
+            for dish_id, dish_name, quantity, price in items:
+                restaurant_id, restaurant_name, owner_id = restaurants.get(dish_id, (None, None, None))
+                # Same rules as the live query: items of purged dishes match no restaurant
+                if owner_only and owner_id != user.id:
+                    continue
+                if 'restaurant' in filters and restaurant_id != filters['restaurant']:
+                    continue
+                # Archived items keep no id of their own
+                yield (order_id, username, status, created_at, None, dish_id, dish_name,
+                       restaurant_id, restaurant_name, quantity, price)
+
+
+def _archived_order_rows(filters):
+    for chunk in _chunks(_archived_orders(filters)):
+        if 'restaurant' in filters:
+            restaurants = _dish_restaurants({item[0] for *_, items in chunk for item in items if item[0]})
+        for *row, items in chunk:
+            if 'restaurant' in filters and not any(
+                restaurants.get(item[0], (None,))[0] == filters['restaurant'] for item in items
+            ):
+                continue
+            yield tuple(row)
+
+
+def order_item_rows(user, filters):
+    """Line-item rows visible to ``user``, live and archived; owners only see their own restaurants"""
+    items = _apply_filters(OrderItem.objects.all(), filters, prefix='order__')
+    if user is not None and not user.is_superuser:
+        items = items.filter(dish__restaurant__owner=user)
+    if 'restaurant' in filters:
+        items = items.filter(dish__restaurant_id=filters['restaurant'])
+    items = items.order_by('order__created_at', 'order_id', 'id')
+    live = items.values_list(*ITEM_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    return heapq.merge(live, _archived_item_rows(user, filters), key=lambda row: (row[3], row[0]))
+
+
+def order_rows(filters):
+    """Order-level rows, live and archived, used by superuser exports"""
+    orders = _apply_filters(Order.objects.all(), filters)
+    if 'restaurant' in filters:
+        orders = orders.filter(items__dish__restaurant_id=filters['restaurant']).distinct()
+    orders = orders.order_by('created_at', 'id')
+    live = orders.values_list(*ORDER_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    return heapq.merge(live, _archived_order_rows(filters), key=lambda row: (row[6], row[0]))
+
+
+class Echo:
+    """File-like object whose write() just hands the value back, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def stream_csv(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_jsonl(header, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(header, row)), default=_json_value) + '\n'
+
+
+def stream_export(user, filters, export_format='csv', level='items'):
+    """Return (filename, content_type, iterator of text chunks) for an export"""
+    if export_format not in EXPORT_FORMATS:
+        raise ExportError(f'Invalid format "{export_format}".')
+    if level not in EXPORT_LEVELS:
+        raise ExportError(f'Invalid level "{level}".')
+
+    if level == 'orders':
+        if user is not None and not user.is_superuser:
+            raise ExportError('Only superusers can export whole orders.')
+        header, rows = ORDER_HEADER, order_rows(filters)
+    else:
+        header, rows = ITEM_HEADER, order_item_rows(user, filters)
+
+    stamp = timezone.localdate().isoformat()
+    if export_format == 'jsonl':
+        return f'{level}-{stamp}.jsonl', 'application/x-ndjson', stream_jsonl(header, rows)
+    return f'{level}-{stamp}.csv', 'text/csv', stream_csv(header, rows)
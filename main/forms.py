@@ -1,5 +1,6 @@
 from django import forms
 from .models import Restaurant, Dish, Cuisine
+from .cuisines import cuisine_choices
 
 
 class RestaurantForm(forms.ModelForm):
@@ -44,6 +45,9 @@ class RestaurantForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # Render checkboxes from the cached (id, name) list; validation still
+        # goes through the queryset
+        self.fields['cuisines'].choices = cuisine_choices()
         if self.instance and self.instance.pk:
             self.fields['cuisines'].initial = self.instance.cuisines.all()
 
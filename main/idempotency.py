@@ -0,0 +1,114 @@
+"""
+Idempotency keys for state-changing endpoints.
+
+A client sends the same ``Idempotency-Key`` header (or ``idempotency_key``
+form/query parameter, for plain links and forms) on every retry of one
+action. The first request runs the view and its response is stored; retries
+get that response back without running the view again, so a double-click
+or a flaky network cannot add an item twice or open a second Stripe
+session. Keys belong to a user and expire after ``IDEMPOTENCY_KEY_TTL``
+seconds.
+"""
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .batches import in_batches
+from .models import IdempotencyKey
+
+
+HEADER = 'Idempotency-Key'
+PARAM = 'idempotency_key'
+MAX_KEY_LENGTH = 255
+
+# Response headers worth replaying; cookies and the like are left out
+REPLAY_HEADERS = ('Content-Type', 'Location')
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 3600))
+
+
+def _fingerprint(request):
+    return hashlib.sha256(f'{request.method} {request.path}'.encode()).hexdigest()
+
+
+def request_key(request):
+    return (request.headers.get(HEADER) or request.POST.get(PARAM) or request.GET.get(PARAM) or '').strip()
+
+
+def expired_keys(now=None):
+    return IdempotencyKey.objects.filter(created_at__lt=(now or timezone.now()) - _ttl())
+
+
+def purge_expired(now=None, batch_size=1000):
+    """Delete expired keys a batch at a time; returns how many were removed"""
+    return in_batches(expired_keys(now), lambda batch: batch.delete(), batch_size)
+
+
+def _claim(request, key, fingerprint):
+    """Our new record, or the existing one for this key"""
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(user=request.user, key=key, fingerprint=fingerprint), True
+    except IntegrityError:
+        pass
+    record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+    if record is not None and record.created_at < timezone.now() - _ttl():
+        # Expired; let this request start over under the same key
+        record.delete()
+        return _claim(request, key, fingerprint)
+    return record, False
+
+
+def _replay(record):
+    response = HttpResponse(bytes(record.body), status=record.status_code)
+    for name, value in record.headers.items():
+        response[name] = value
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view_func):
+    """Replay the stored response when a request repeats an idempotency key"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        key = request_key(request)
+        if not key or not request.user.is_authenticated:
+            return view_func(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return JsonResponse({'error': f'{HEADER} is longer than {MAX_KEY_LENGTH} characters.'}, status=400)
+
+        fingerprint = _fingerprint(request)
+        record, created = _claim(request, key, fingerprint)
+        if not created:
+            if record is not None and record.fingerprint != fingerprint:
+                return JsonResponse({'error': f'{HEADER} was already used for a different request.'}, status=422)
+            if record is None or record.status_code is None:
+                # The first request is still running (or just failed)
+                response = JsonResponse({'error': 'The original request is still being processed.'}, status=409)
+                response['Retry-After'] = '1'
+                return response
+            return _replay(record)
+
+        try:
+            response = view_func(request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+        if response.status_code >= 500 or response.streaming:
+            # Let the client retry failures for real
+            record.delete()
+            return response
+
+        record.status_code = response.status_code
+        record.headers = {name: response[name] for name in REPLAY_HEADERS if response.has_header(name)}
+        record.body = response.content
+        record.save(update_fields=['status_code', 'headers', 'body'])
+        return response
+    return wrapper
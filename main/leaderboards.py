@@ -0,0 +1,97 @@
+"""
+Computed restaurant leaderboards.
+
+``recompute()`` (run periodically by ``manage.py recompute_leaderboards``)
+scores every restaurant in bulk and stores the ranked ids as
+``LeaderboardEntry`` rows; ``leaderboard_restaurants()`` reads all boards
+back with one query.
+
+Top rated is a Bayesian average: each restaurant's ratings are blended
+with ``prior_weight`` virtual reviews at the site-wide mean, so two 5★
+reviews do not outrank two hundred 4.8★ ones. Trending is paid order
+volume where every unit counts half as much per ``half_life`` of age.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import LeaderboardEntry, OrderItem, Review
+
+
+def top_rated_scores(prior_weight=None):
+    """{restaurant_id: bayesian average}"""
+    rows = list(Review.objects.filter(restaurant__deleted_at__isnull=True).values('restaurant_id').annotate(n=Count('id'), total=Sum('rating')).order_by())
+    if not rows:
+        return {}
+    reviews = sum(row['n'] for row in rows)
+    mean = sum(row['total'] for row in rows) / reviews
+    if prior_weight is None:
+        prior_weight = getattr(settings, 'LEADERBOARD_PRIOR_WEIGHT', None)
+    if prior_weight is None:
+        # Default prior: as many virtual reviews as the average restaurant has
+        prior_weight = reviews / len(rows)
+    return {
+        row['restaurant_id']: (prior_weight * mean + row['total']) / (prior_weight + row['n'])
+        for row in rows
+    }
+
+
+def trending_scores(now=None, window=None, half_life=None):
+    """{restaurant_id: time-decayed units sold} over the recent window"""
+    now = now or timezone.now()
+    window = window or timedelta(days=getattr(settings, 'LEADERBOARD_TRENDING_WINDOW_DAYS', 14))
+    half_life = half_life or timedelta(hours=getattr(settings, 'LEADERBOARD_TRENDING_HALF_LIFE_HOURS', 48))
+
+    # Hourly buckets keep the row count bounded however busy the site is
+    buckets = (
+        OrderItem.objects
+        .filter(order__payment_status='PAID', order__created_at__gte=now - window)
+        .filter(dish__isnull=False, dish__restaurant__deleted_at__isnull=True)
+        .annotate(hour=TruncHour('order__created_at'))
+        .values('dish__restaurant_id', 'hour')
+        .annotate(units=Sum('quantity'))
+        .order_by()
+    )
+    scores = {}
+    for row in buckets:
+        age = max((now - row['hour']) / half_life, 0)
+        restaurant_id = row['dish__restaurant_id']
+        scores[restaurant_id] = scores.get(restaurant_id, 0) + row['units'] * 0.5 ** age
+    return scores
+
+
+def _ranked(scores, size):
+    # Ties go to the older restaurant (lower id) so ranks are stable
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:size]
+
+
+def recompute(size=None, now=None):
+    """Rebuild every board; returns {board: number of entries}"""
+    size = size or getattr(settings, 'LEADERBOARD_SIZE', 10)
+    now = now or timezone.now()
+    boards = {
+        LeaderboardEntry.TOP_RATED: _ranked(top_rated_scores(), size),
+        LeaderboardEntry.TRENDING: _ranked(trending_scores(now), size),
+    }
+    entries = [
+        LeaderboardEntry(board=board, rank=rank, restaurant_id=restaurant_id, score=score, computed_at=now)
+        for board, ranked in boards.items()
+        for rank, (restaurant_id, score) in enumerate(ranked, 1)
+    ]
+    # Readers see either the old or the new boards, never a mix
+    with transaction.atomic():
+        LeaderboardEntry.objects.filter(board__in=boards).delete()
+        LeaderboardEntry.objects.bulk_create(entries)
+    return {board: len(ranked) for board, ranked in boards.items()}
+
+
+def leaderboard_restaurants():
+    """{board: [restaurant, ...]} in rank order, from a single query"""
+    boards = {board: [] for board, _ in LeaderboardEntry.BOARD_CHOICES}
+    for entry in LeaderboardEntry.objects.filter(restaurant__deleted_at__isnull=True).select_related('restaurant'):
+        boards[entry.board].append(entry.restaurant)
+    return boards
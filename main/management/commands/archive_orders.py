@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main.archive import archivable_orders, archive_cutoff, archive_orders
+
+
+class Command(BaseCommand):
+    help = 'Move old finished orders into the compact archive table, in resumable batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Archive orders older than this (default ORDER_ARCHIVE_AFTER_DAYS or 180)')
+        parser.add_argument('--batch-size', type=int, default=None, help='Orders per transaction (default ORDER_ARCHIVE_BATCH_SIZE or 500)')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches; rerun to continue')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the eligible orders')
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days']) if options['days'] is not None else archive_cutoff()
+        if options['dry_run']:
+            self.stdout.write(f'{archivable_orders(before).count()} order(s) older than {before:%Y-%m-%d} can be archived.')
+            return
+
+        total = 0
+        for batch, moved in enumerate(archive_orders(before, options['batch_size'], options['max_batches']), 1):
+            total += moved
+            self.stdout.write(f'Batch {batch}: {moved} order(s) archived')
+        remaining = archivable_orders(before).count()
+        self.stdout.write(f'Archived {total} order(s); {remaining} eligible order(s) left.')
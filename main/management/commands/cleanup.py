@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from main.cleanup import run_cleanup
+
+
+class Command(BaseCommand):
+    help = 'Delete abandoned carts, expired sessions and idempotency keys, and cancel stale pending orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows per transaction (default CLEANUP_BATCH_SIZE or 1000)')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be cleaned up')
+
+    def handle(self, *args, **options):
+        report = run_cleanup(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        verb = 'would be cleaned up' if options['dry_run'] else 'cleaned up'
+        for step, count in report.items():
+            self.stdout.write(f'{step}: {count} {verb}')
@@ -0,0 +1,70 @@
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from main.storage import BLOB_DIR, IMAGE_FIELDS, blob_name, content_hash, references
+
+
+class Command(BaseCommand):
+    help = 'Move existing restaurant/dish images into content-addressed blobs, sharing identical files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+        parser.add_argument('--keep-originals', action='store_true', help='Leave the old files in place')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        blobs = {}
+        originals = set()
+        missing = moved = 0
+
+        for label, field in IMAGE_FIELDS:
+            model = apps.get_model(label)
+            rows = (
+                model._base_manager
+                .exclude(**{f'{field}__isnull': True})
+                .exclude(**{field: ''})
+                .exclude(**{f'{field}__startswith': BLOB_DIR + '/'})
+                .order_by('pk')
+            )
+            last_pk = 0
+            while True:
+                batch = list(rows.filter(pk__gt=last_pk).values_list('pk', field)[:options['batch_size']])
+                if not batch:
+                    break
+                last_pk = batch[-1][0]
+                for pk, name in batch:
+                    if not default_storage.exists(name):
+                        missing += 1
+                        self.stderr.write(f'{label} {pk}: {name} is missing, left as is')
+                        continue
+                    with default_storage.open(name) as content:
+                        target = blob_name(content_hash(content), name)
+                        if target not in blobs:
+                            # Only blobs this run creates take up new space
+                            blobs[target] = 0 if default_storage.exists(target) else content.size
+                        if not dry_run:
+                            default_storage.save(name, content)
+                    originals.add(name)
+                    moved += 1
+                    if not dry_run:
+                        # update() rather than save(): no signals, and the row only moves if unchanged
+                        model._base_manager.filter(pk=pk, **{field: name}).update(**{field: target})
+
+        removed = reclaimed = 0
+        if not options['keep_originals']:
+            for name in sorted(originals):
+                size = default_storage.size(name)
+                if dry_run or not references(name):
+                    if not dry_run:
+                        default_storage.delete(name)
+                    removed += 1
+                    reclaimed += size
+            reclaimed -= sum(blobs.values())
+
+        prefix = 'Would move' if dry_run else 'Moved'
+        self.stdout.write(
+            f'{prefix} {moved} image(s) from {len(originals)} file(s) into {len(blobs)} blob(s); '
+            f'{removed} original(s) removed, {max(reclaimed, 0)} bytes reclaimed, {missing} missing.'
+        )
@@ -0,0 +1,39 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from main.exports import EXPORT_FORMATS, EXPORT_LEVELS, ExportError, parse_filters, stream_export
+
+
+class Command(BaseCommand):
+    help = 'Stream orders or order items as CSV / JSON lines to stdout or a file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--level', choices=EXPORT_LEVELS, default='items')
+        parser.add_argument('--start', help='First day to include (YYYY-MM-DD)')
+        parser.add_argument('--end', help='Last day to include (YYYY-MM-DD)')
+        parser.add_argument('--restaurant', help='Restaurant id')
+        parser.add_argument('--status', help='Payment status, e.g. PAID')
+        parser.add_argument('--owner', help='Only export items from restaurants owned by this username')
+        parser.add_argument('--output', '-o', help='Write to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['owner']:
+            try:
+                user = User.objects.get(username=options['owner'])
+            except User.DoesNotExist:
+                raise CommandError(f'User "{options["owner"]}" does not exist.')
+
+        try:
+            filters = parse_filters(options)
+            _, _, rows = stream_export(user, filters, options['format'], options['level'])
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as fh:
+                fh.writelines(rows)
+        else:
+            for chunk in rows:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,59 @@
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+LINE_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+# Imported by what a worker or management command does on startup
+STARTUP_CODE = (
+    'import django; django.setup(); '
+    'from django.urls import get_resolver; get_resolver().url_patterns'
+)
+
+# Heavy optional packages that should only load when used
+WATCHED = ('stripe', 'jinja2', 'brotli', 'PIL')
+
+
+class Command(BaseCommand):
+    help = 'Report process startup time per module using python -X importtime'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help='Modules to list, slowest cumulative first')
+        parser.add_argument('--code', default=STARTUP_CODE, help='Python code to time (default: django.setup() and the URLconf)')
+
+    def handle(self, *args, **options):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', options['code']],
+            capture_output=True, text=True, cwd=settings.BASE_DIR,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE},
+        )
+        if result.returncode:
+            raise CommandError(f'Timed code failed:\n{result.stderr[-2000:]}')
+
+        modules = {}
+        total = 0
+        for line in result.stderr.splitlines():
+            match = LINE_RE.match(line)
+            if not match:
+                continue
+            own, cumulative, indent, name = match.groups()
+            modules[name] = (int(own), int(cumulative))
+            if len(indent) == 1:
+                # Top-level imports; their cumulative times add up to the whole run
+                total += int(cumulative)
+
+        self.stdout.write(f'Imported {len(modules)} module(s) in {total / 1000:.1f} ms')
+        self.stdout.write(f'{"cumulative ms":>14} {"self ms":>9}  module')
+        ranked = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)
+        for name, (own, cumulative) in ranked[:options['top']]:
+            self.stdout.write(f'{cumulative / 1000:>14.1f} {own / 1000:>9.1f}  {name}')
+        for package in WATCHED:
+            if package in modules:
+                self.stdout.write(f'{package}: loaded at startup ({modules[package][1] / 1000:.1f} ms)')
+            else:
+                self.stdout.write(f'{package}: not loaded')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.prerender import PRERENDER_PATHS, prerender, prerender_root, remove
+
+
+class Command(BaseCommand):
+    help = 'Write the anonymous home, about and explore pages as static (and precompressed) HTML'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help=f'Pages to render (default: {" ".join(PRERENDER_PATHS)})')
+        parser.add_argument('--clear', action='store_true', help='Delete the static copies instead')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or PRERENDER_PATHS
+        unknown = set(paths) - set(PRERENDER_PATHS)
+        if unknown:
+            raise CommandError(f'Not a prerendered page: {", ".join(sorted(unknown))}')
+        if options['clear']:
+            remove(paths)
+            self.stdout.write(f'Removed {len(paths)} page(s) from {prerender_root()}')
+            return
+        for path, size in prerender(paths).items():
+            self.stdout.write(f'{path}: {size} bytes')
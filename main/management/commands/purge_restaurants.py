@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import Restaurant
+from main.purge import purge_restaurant, restore_restaurant
+
+
+class Command(BaseCommand):
+    help = 'Purge soft-deleted restaurants in bounded batches (normally done by the task worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows per transaction (default PURGE_BATCH_SIZE or 500)')
+        parser.add_argument('--restore', type=int, metavar='ID', help='Undelete this restaurant instead, if it is not purged yet')
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            restaurant = Restaurant.all_objects.filter(pk=options['restore'], deleted_at__isnull=False).first()
+            if restaurant is None:
+                raise CommandError(f'No soft-deleted restaurant #{options["restore"]}; it may already be purged.')
+            restore_restaurant(restaurant)
+            self.stdout.write(f'Restored {restaurant.name} (#{restaurant.id})')
+            return
+
+        pending = Restaurant.all_objects.filter(deleted_at__isnull=False).order_by('deleted_at')
+        for restaurant_id, name in pending.values_list('id', 'name'):
+            counts = purge_restaurant(restaurant_id, batch_size=options['batch_size'])
+            summary = ', '.join(f'{count} {what}' for what, count in counts.items())
+            self.stdout.write(f'{name} (#{restaurant_id}): {summary or "nothing left"}')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from main.leaderboards import recompute
+from main.prerender import invalidate_prerendered
+
+
+class Command(BaseCommand):
+    help = 'Recompute the top rated and trending restaurant leaderboards (run periodically, e.g. from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=None, help='Entries per board (default LEADERBOARD_SIZE or 10)')
+
+    def handle(self, *args, **options):
+        for board, count in recompute(size=options['size']).items():
+            self.stdout.write(f'{board}: {count} restaurant(s)')
+        # Explore shows the boards
+        invalidate_prerendered()
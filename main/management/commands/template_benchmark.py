@@ -0,0 +1,50 @@
+import time
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.template import engines
+from django.test import RequestFactory
+
+from main.models import Restaurant
+from main.templating import sample_contexts
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the hot listing templates with the Django and the Jinja2 engine on '
+        'the current data (read-only; parity is checked by the test suite).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Renders per template and engine')
+
+    def handle(self, *args, **options):
+        if 'jinja2' not in engines:
+            raise CommandError('The jinja2 template engine is not configured; install jinja2.')
+        # The largest menu and the smallest, as the detail pages to time
+        restaurants = list(Restaurant.objects.annotate(menu=Count('dishes')).order_by('-menu', 'id'))
+        if not restaurants:
+            raise CommandError('No restaurants to render; load some data first.')
+
+        request = RequestFactory().get('/')
+        request.user = User.objects.filter(is_superuser=True).first() or AnonymousUser()
+        self.stdout.write(f'{"template":32} {"cards":>6} {"django ms":>10} {"jinja2 ms":>10} {"speedup":>8}')
+        seen = set()
+        for template_name, context in sample_contexts(restaurants):
+            if template_name in seen:
+                continue
+            seen.add(template_name)
+            cards = len(context.get('all_dishes') or context.get('restaurants') or context['dishes'])
+            timings = []
+            for alias in ('django', 'jinja2'):
+                template = engines[alias].get_template(template_name)
+                runs = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    template.render(context, request)
+                    runs.append(time.perf_counter() - start)
+                timings.append(min(runs) * 1000)
+            self.stdout.write(
+                f'{template_name:32} {cards:>6} {timings[0]:>10.1f} {timings[1]:>10.1f} {timings[0] / timings[1]:>7.1f}x'
+            )
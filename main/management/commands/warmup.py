@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = (
+        'Readiness check: run the warm-up steps (templates, URLs, database, catalog) '
+        'and fail if any breaks. Workers warm themselves with WARMUP_ON_START=1.'
+    )
+
+    def handle(self, *args, **options):
+        try:
+            timings = warm_up()
+        except Exception as e:
+            # Non-zero exit lets a deploy stop before sending traffic to a broken release
+            raise CommandError(f'Warm-up failed: {e!r}')
+        for step, result, seconds in timings:
+            self.stdout.write(f'{step}: {result} ({seconds * 1000:.1f} ms)')
+        self.stdout.write(f'Warm in {sum(seconds for _, _, seconds in timings) * 1000:.1f} ms')
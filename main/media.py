@@ -0,0 +1,152 @@
+"""
+Serving uploaded restaurant and dish images.
+
+With ``MEDIA_ACCEL`` set the view only checks the path and answers with an
+empty response carrying ``X-Accel-Redirect`` (nginx) or ``X-Sendfile``
+(Apache mod_xsendfile, lighttpd); the front server then sends the bytes
+itself. nginx needs an internal location for ``MEDIA_ACCEL_PREFIX``::
+
+    location /protected-media/ {
+        internal;
+        alias /srv/mealmate/media/;
+    }
+
+Without it Django sends the file: a ``FileResponse`` on the open file, which
+WSGI servers such as gunicorn pass to ``sendfile()``, or a bounded stream for
+a single ``Range``. Either way responses carry ``ETag``, ``Last-Modified``
+and a long ``Cache-Control`` so browsers and proxies rarely come back.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .storage import is_blob
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+ACCEL_HEADERS = {
+    'x-accel-redirect': 'X-Accel-Redirect',
+    'x-sendfile': 'X-Sendfile',
+}
+
+
+class RangeFile:
+    """Read-only view of ``length`` bytes of ``file`` starting at ``start``"""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single satisfiable byte range, else None"""
+    match = RANGE_RE.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
+def _etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return etag in (tag.strip() for tag in if_none_match.split(',')) or if_none_match.strip() == '*'
+    since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return since is not None and int(mtime) <= since
+
+
+def _cache_headers(response, etag, stat, path):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    cache_control = f'public, max-age={getattr(settings, "MEDIA_CACHE_MAX_AGE", 30 * 24 * 3600)}'
+    if is_blob(path):
+        # A blob's name is its content hash, so its bytes can never change
+        cache_control += ', immutable'
+    response['Cache-Control'] = cache_control
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """Send one file from MEDIA_ROOT, or hand it to the front server"""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Invalid media path.')
+    try:
+        stat = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404('Media file not found.')
+    if not os.path.isfile(full_path):
+        raise Http404('Media file not found.')
+
+    etag = _etag(stat)
+    if _not_modified(request, etag, stat.st_mtime):
+        return _cache_headers(HttpResponseNotModified(), etag, stat, path)
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+
+    accel = ACCEL_HEADERS.get((getattr(settings, 'MEDIA_ACCEL', None) or '').lower())
+    if accel:
+        response = HttpResponse(content_type=content_type)
+        if accel == 'X-Accel-Redirect':
+            response[accel] = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/') + path
+        else:
+            response[accel] = full_path
+        # The front server handles Range and Content-Length for the real body
+        return _cache_headers(response, etag, stat, path)
+
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and (if_range is None or if_range == etag):
+        byte_range = parse_range(range_header, stat.st_size)
+        if byte_range is None and RANGE_RE.match(range_header.strip()):
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(RangeFile(file, start, end - start + 1), content_type=content_type, status=206)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Accept-Ranges'] = 'bytes'
+    return _cache_headers(response, etag, stat, path)
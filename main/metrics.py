@@ -0,0 +1,258 @@
+"""
+Prometheus-style counters and histograms.
+
+Values live in process memory. When ``METRICS_DIR`` is set every process
+also writes its values to ``<METRICS_DIR>/metrics-<pid>.json`` at most once
+per ``METRICS_FLUSH_INTERVAL`` seconds; a change that comes sooner is written
+by a timer when the interval is up, so the last values before a worker goes
+idle are not lost. ``/metrics`` adds up the files of all processes, so the
+numbers are right under multi-process servers.
+A process removes its file when it exits, and files of processes that are no
+longer running are skipped and deleted, so recycled workers do not pile up;
+Prometheus reads the drop as a counter reset.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'http_request_duration_seconds': ('histogram', 'Request latency by route name'),
+    'cart_operations_total': ('counter', 'Cart add/increment/decrement calls'),
+    'checkout_sessions_total': ('counter', 'Stripe checkout sessions by outcome'),
+    'stripe_webhook_events_total': ('counter', 'Stripe webhook events by type and outcome'),
+    'orders': ('gauge', 'Orders by payment status'),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_last_flush = 0.0
+# (pid, threading.Timer) of the pending flush, if any
+_flush_timer = None
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def inc(name, amount=1, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+    _maybe_flush()
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {'buckets': list(buckets), 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(hist['buckets']):
+            if value <= bound:
+                hist['counts'][i] += 1
+        hist['sum'] += value
+        hist['count'] += 1
+    _maybe_flush()
+
+
+def _snapshot():
+    with _lock:
+        return {
+            'counters': [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            'histograms': [
+                [name, list(labels), dict(hist, counts=list(hist['counts']))]
+                for (name, labels), hist in _histograms.items()
+            ],
+        }
+
+
+def flush():
+    """Write this process's values to METRICS_DIR"""
+    global _last_flush
+    directory = _metrics_dir()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(_snapshot(), fh)
+    # Atomic, so readers never see a half written file
+    os.replace(tmp, _own_file(directory))
+    _last_flush = time.monotonic()
+
+
+def _maybe_flush():
+    global _flush_timer
+    if not _metrics_dir():
+        return
+    wait = getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0) - (time.monotonic() - _last_flush)
+    if wait <= 0:
+        flush()
+        return
+    with _lock:
+        # A timer inherited through fork never fires in this process
+        if _flush_timer is not None and _flush_timer[0] == os.getpid():
+            return
+        timer = threading.Timer(wait, _timed_flush)
+        timer.daemon = True
+        _flush_timer = (os.getpid(), timer)
+    timer.start()
+
+
+def _timed_flush():
+    global _flush_timer
+    with _lock:
+        _flush_timer = None
+    flush()
+
+
+def _own_file(directory):
+    return os.path.join(directory, f'metrics-{os.getpid()}.json')
+
+
+def _remove_own_file():
+    directory = _metrics_dir()
+    if directory:
+        try:
+            os.remove(_own_file(directory))
+        except FileNotFoundError:
+            pass
+
+
+atexit.register(_remove_own_file)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running, under another user
+        return True
+    return True
+
+
+def _collect():
+    """Merge all process files, or just this process when METRICS_DIR is unset"""
+    directory = _metrics_dir()
+    if not directory:
+        snapshots = [_snapshot()]
+    else:
+        flush()
+        snapshots = []
+        for filename in os.listdir(directory):
+            pid = filename[len('metrics-'):-len('.json')]
+            if not (filename.startswith('metrics-') and filename.endswith('.json') and pid.isdigit()):
+                continue
+            path = os.path.join(directory, filename)
+            if not _alive(int(pid)):
+                # Left by a worker that died without running its atexit hook
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            try:
+                with open(path) as fh:
+                    snapshots.append(json.load(fh))
+            except (OSError, ValueError):
+                continue
+
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, hist in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, {'buckets': hist['buckets'], 'counts': [0] * len(hist['buckets']), 'sum': 0.0, 'count': 0})
+            merged['counts'] = [a + b for a, b in zip(merged['counts'], hist['counts'])]
+            merged['sum'] += hist['sum']
+            merged['count'] += hist['count']
+    return counters, histograms
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def render(gauges=None):
+    """Text exposition format; ``gauges`` maps (name, labels) to values computed at scrape time"""
+    counters, histograms = _collect()
+    samples = {}
+    for (name, labels), value in counters.items():
+        samples.setdefault(name, []).append(f'{name}{_format_labels(labels)} {value}')
+    for (name, labels), value in (gauges or {}).items():
+        samples.setdefault(name, []).append(f'{name}{_format_labels(labels)} {value}')
+    for (name, labels), hist in histograms.items():
+        lines = samples.setdefault(name, [])
+        for bound, count in zip(hist['buckets'], hist['counts']):
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", str(bound)),))} {count}')
+        lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {hist["count"]}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {hist["sum"]}')
+        lines.append(f'{name}_count{_format_labels(labels)} {hist["count"]}')
+
+    output = []
+    for name in sorted(samples):
+        kind, description = HELP.get(name, ('untyped', name))
+        output.append(f'# HELP {name} {description}')
+        output.append(f'# TYPE {name} {kind}')
+        output.extend(samples[name])
+    return '\n'.join(output) + '\n'
+
+
+class MetricsMiddleware:
+    """Observe request latency per URL name"""
+    # Async-capable so ASGI requests to async views stay on the event loop
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        return self.record(request, response, start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        return self.record(request, response, start)
+
+    def record(self, request, response, start):
+        match = getattr(request, 'resolver_match', None)
+        if match is not None and match.view_name:
+            observe(
+                'http_request_duration_seconds',
+                time.perf_counter() - start,
+                route=match.view_name,
+                method=request.method,
+                status=response.status_code,
+            )
+        return response
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-19 09:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_review'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['restaurant', '-created_at', '-id'], name='review_restaurant_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-19 09:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_review_restaurant_recent_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(choices=[('top_rated', 'Top Rated'), ('trending', 'Trending')], max_length=20)),
+                ('rank', models.PositiveIntegerField()),
+                ('score', models.FloatField()),
+                ('computed_at', models.DateTimeField()),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entries', to='main.restaurant')),
+            ],
+            options={
+                'verbose_name_plural': 'Leaderboard entries',
+                'ordering': ['board', 'rank'],
+                'unique_together': {('board', 'rank')},
+            },
+        ),
+    ]
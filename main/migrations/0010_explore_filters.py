@@ -0,0 +1,47 @@
+# Generated by Django 6.0 on 2026-10-19 10:05
+
+from django.db import migrations, models
+from django.db.models import Avg, Count
+
+
+def backfill_ratings(apps, schema_editor):
+    Restaurant = apps.get_model('main', 'Restaurant')
+    Review = apps.get_model('main', 'Review')
+    stats = Review.objects.values('restaurant_id').annotate(average=Avg('rating'), total=Count('id')).order_by()
+    for row in stats:
+        Restaurant.objects.filter(pk=row['restaurant_id']).update(
+            average_rating=row['average'], review_count=row['total'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='average_rating',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['-average_rating', 'id'], name='restaurant_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dish',
+            index=models.Index(fields=['price', 'id'], name='dish_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dish',
+            index=models.Index(fields=['restaurant', 'price'], name='dish_restaurant_price_idx'),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
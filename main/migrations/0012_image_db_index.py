@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-19 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='restaurant',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, null=True, upload_to='restaurants/'),
+        ),
+        migrations.AlterField(
+            model_name='dish',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, null=True, upload_to='dishes/'),
+        ),
+    ]
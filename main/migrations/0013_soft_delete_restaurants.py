@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-19 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def snapshot_dish_names(apps, schema_editor):
+    Dish = apps.get_model('main', 'Dish')
+    OrderItem = apps.get_model('main', 'OrderItem')
+    OrderItem.objects.update(dish_name=Subquery(Dish.objects.filter(pk=OuterRef('dish_id')).values('name')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_image_db_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='dish_name',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.RunPython(snapshot_dish_names, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='dish',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='main.dish'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-19 18:40
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_restaurant_deleted_at(apps, schema_editor):
+    Dish = apps.get_model('main', 'Dish')
+    Restaurant = apps.get_model('main', 'Restaurant')
+    Dish.objects.filter(restaurant__deleted_at__isnull=False).update(
+        deleted_at=Subquery(Restaurant.objects.filter(pk=OuterRef('restaurant_id')).values('deleted_at')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_archivedorder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dish',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(copy_restaurant_deleted_at, migrations.RunPython.noop),
+    ]
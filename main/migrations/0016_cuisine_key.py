@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-19 21:05
+
+from django.db import migrations, models
+
+
+def fill_keys(apps, schema_editor):
+    Cuisine = apps.get_model('main', 'Cuisine')
+    seen = set()
+    cuisines = []
+    for cuisine in Cuisine.objects.order_by('name', 'id'):
+        key = cuisine.name.strip().lower()
+        # Later case variants keep a null key; the first spelling owns the name
+        if key not in seen:
+            seen.add(key)
+            cuisine.key = key
+            cuisines.append(cuisine)
+    Cuisine.objects.bulk_update(cuisines, ['key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_dish_deleted_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cuisine',
+            name='key',
+            field=models.CharField(editable=False, max_length=100, null=True, unique=True),
+        ),
+        migrations.RunPython(fill_keys, migrations.RunPython.noop),
+    ]
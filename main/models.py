@@ -1,10 +1,18 @@
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import F, Sum
 from django.contrib.auth.models import User
 from django.utils import timezone
 
 
 class Cuisine(models.Model):
     name = models.CharField(max_length=100, unique=True)
+    # The name lower-cased in Python; SQLite's LOWER() only folds ASCII, so
+    # case-insensitive matching happens on this column. Null for case
+    # variants that existed before it was added.
+    key = models.CharField(max_length=100, unique=True, null=True, editable=False)
     
     class Meta:
         ordering = ['name']
@@ -12,6 +20,36 @@ class Cuisine(models.Model):
     def __str__(self):
         return self.name
 
+    @staticmethod
+    def make_key(name):
+        return name.strip().lower()
+
+    def clean(self):
+        if self.name and Cuisine.objects.filter(key=self.make_key(self.name)).exclude(pk=self.pk).exists():
+            raise ValidationError({'name': 'A cuisine with this name already exists.'})
+
+    def save(self, *args, **kwargs):
+        self.key = self.make_key(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'key'}
+        super().save(*args, **kwargs)
+
+
+class RestaurantManager(models.Manager):
+    """Hides soft-deleted restaurants (see main.purge)"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+class DishManager(models.Manager):
+    """Hides the dishes of soft-deleted restaurants"""
+
+    def get_queryset(self):
+        # Dish.deleted_at copies the restaurant's, so no join is needed
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 
 class Restaurant(models.Model):
     name = models.CharField(max_length=200)
@@ -19,16 +57,28 @@ class Restaurant(models.Model):
     opening_time = models.TimeField()
     closing_time = models.TimeField()
     iframe_location = models.TextField(help_text="Embedded map iframe code", blank=True)
-    image = models.ImageField(upload_to='restaurants/', blank=True, null=True)
+    # Content-addressed (main.storage); indexed for blob reference counts
+    image = models.ImageField(upload_to='restaurants/', blank=True, null=True, db_index=True)
     cuisines = models.ManyToManyField(Cuisine, related_name='restaurants')
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='restaurants')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     featured = models.BooleanField(default=False)
     location = models.CharField(max_length=255, blank=True)
+    # Kept in sync with reviews by main.signals, so listings can sort by rating
+    average_rating = models.FloatField(default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    # Set when the owner deletes the restaurant; the rows go in a background purge
+    deleted_at = models.DateTimeField(blank=True, null=True, db_index=True)
+
+    objects = RestaurantManager()
+    all_objects = models.Manager()
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-average_rating', 'id'], name='restaurant_rating_idx'),
+        ]
     
     def __str__(self):
         return self.name
@@ -55,14 +105,23 @@ class Dish(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
-    image = models.ImageField(upload_to='dishes/', blank=True, null=True)
+    image = models.ImageField(upload_to='dishes/', blank=True, null=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     featured = models.BooleanField(default=False)
+    # Set together with Restaurant.deleted_at by main.purge
+    deleted_at = models.DateTimeField(blank=True, null=True, db_index=True)
+
+    objects = DishManager()
+    all_objects = models.Manager()
     
     class Meta:
         ordering = ['name']
         verbose_name_plural = 'Dishes'
+        indexes = [
+            models.Index(fields=['price', 'id'], name='dish_price_idx'),
+            models.Index(fields=['restaurant', 'price'], name='dish_restaurant_price_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} - {self.restaurant.name}"
@@ -78,7 +137,8 @@ class Cart(models.Model):
     
     def get_total(self):
         """Calculate total price of all items in cart"""
-        return sum(item.get_subtotal() for item in self.items.all())
+        result = self.items.aggregate(total=Sum(F('dish__price') * F('quantity')))
+        return result['total'] or 0
 
 
 class CartItem(models.Model):
@@ -130,10 +190,15 @@ class Order(models.Model):
         }
         return status_classes.get(self.payment_status, '')
 
+    def get_line_items(self):
+        return self.items.all()
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
-    dish = models.ForeignKey(Dish, on_delete=models.CASCADE)
+    # Cleared when the dish is purged; dish_name and price keep the history
+    dish = models.ForeignKey(Dish, on_delete=models.SET_NULL, blank=True, null=True)
+    dish_name = models.CharField(max_length=200, blank=True)
     quantity = models.IntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)  # Store price at time of order
     
@@ -141,13 +206,55 @@ class OrderItem(models.Model):
         ordering = ['id']
     
     def __str__(self):
-        return f"{self.quantity} x {self.dish.name} in Order #{self.order.id}"
+        return f"{self.quantity} x {self.dish_name} in Order #{self.order_id}"
     
     def get_subtotal(self):
         """Calculate subtotal for this item"""
         return self.price * self.quantity
 
 
+class ArchivedLineItem:
+    """One line of an archived order, shaped like an OrderItem for templates"""
+
+    def __init__(self, dish_id, dish_name, quantity, price):
+        self.dish_id = dish_id
+        self.dish_name = dish_name
+        self.quantity = quantity
+        self.price = Decimal(price)
+
+    def get_subtotal(self):
+        return self.price * self.quantity
+
+
+class ArchivedOrder(models.Model):
+    """
+    A finished order moved out of the live tables by main.archive. It keeps
+    the original id, and its items are packed into one JSON list of
+    [dish_id, dish_name, quantity, price] rows.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    payment_status = models.CharField(max_length=20, choices=Order.PAYMENT_STATUS_CHOICES)
+    stripe_session_id = models.CharField(max_length=255, blank=True, null=True)
+    items = models.JSONField(default=list)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='archived_order_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order #{self.id} - {self.user.username} - ${self.total_price} (archived)"
+
+    def get_line_items(self):
+        return [ArchivedLineItem(*row) for row in self.items]
+
+
 class Review(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews')
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='reviews')
@@ -158,6 +265,51 @@ class Review(models.Model):
     class Meta:
         ordering = ['-created_at']
         unique_together = ['user', 'restaurant']  # One review per user per restaurant
+        indexes = [
+            # Keyset pagination of a restaurant's reviews, newest first
+            models.Index(fields=['restaurant', '-created_at', '-id'], name='review_restaurant_recent_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.user.username} - {self.restaurant.name} - {self.rating}★"
\ No newline at end of file
+        return f"{self.user.username} - {self.restaurant.name} - {self.rating}★"
+
+class LeaderboardEntry(models.Model):
+    """One ranked row of a computed leaderboard (see main.leaderboards)"""
+    TOP_RATED = 'top_rated'
+    TRENDING = 'trending'
+    BOARD_CHOICES = [
+        (TOP_RATED, 'Top Rated'),
+        (TRENDING, 'Trending'),
+    ]
+
+    board = models.CharField(max_length=20, choices=BOARD_CHOICES)
+    rank = models.PositiveIntegerField()
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='leaderboard_entries')
+    score = models.FloatField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['board', 'rank']
+        unique_together = ['board', 'rank']
+        verbose_name_plural = 'Leaderboard entries'
+
+    def __str__(self):
+        return f"{self.get_board_display()} #{self.rank} - {self.restaurant_id}"
+
+
+class IdempotencyKey(models.Model):
+    """First response to a client-keyed request, replayed for retries (see main.idempotency)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    # Null while the first request is still being processed
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    headers = models.JSONField(default=dict, blank=True)
+    body = models.BinaryField(blank=True, default=b'')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ['user', 'key']
+
+    def __str__(self):
+        return f"{self.key} ({self.user_id})"
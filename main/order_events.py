@@ -0,0 +1,140 @@
+"""
+Order status push for Server-Sent Events.
+
+Order saves are published to an in-process broker that wakes the matching
+SSE connections. Workers in other processes never see those in-process
+events, so every open stream also polls the database for its user's orders
+when it has been idle for ``ORDER_EVENTS_POLL_INTERVAL`` seconds. A
+connection is a single coroutine and a small queue, so it needs to be served
+by the ASGI application (restaurant_project/asgi.py); the stream is only
+offered when ``ORDER_EVENTS_STREAM`` is on.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from .models import Order
+
+
+TERMINAL_STATUSES = ('PAID', 'FAILED', 'CANCELLED')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class OrderStatusBroker:
+    """Fan order events out to the asyncio queues subscribed for a user"""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers[user_id].add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id, set())
+            subscribers.difference_update({s for s in subscribers if s[1] is queue})
+            if not subscribers:
+                self._subscribers.pop(user_id, None)
+
+    def publish(self, user_id, event):
+        """Thread safe; usually called from a sync view running in a worker thread"""
+        with self._lock:
+            targets = list(self._subscribers.get(user_id, ()))
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(_put, queue, event)
+            except RuntimeError:
+                # Event loop already closed
+                pass
+
+
+def _put(queue, event):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        # A slow client falls back to the database poll
+        pass
+
+
+broker = OrderStatusBroker()
+
+
+def publish_order(order):
+    broker.publish(order.user_id, {
+        'id': order.id,
+        'payment_status': order.payment_status,
+        'updated_at': order.updated_at,
+    })
+
+
+def _format(event):
+    data = dict(event, updated_at=event['updated_at'].isoformat())
+    return f'event: status\nid: {event["id"]}\ndata: {json.dumps(data)}\n\n'
+
+
+async def _orders(user_id, order_id=None, since=None, limit=20):
+    orders = Order.objects.filter(user_id=user_id)
+    if order_id is not None:
+        orders = orders.filter(pk=order_id)
+    if since is not None:
+        orders = orders.filter(updated_at__gt=since)
+    orders = orders.order_by('-updated_at').values('id', 'payment_status', 'updated_at')[:limit]
+    return [order async for order in orders]
+
+
+async def order_status_events(user_id, order_id=None):
+    """
+    Yield SSE frames for the user's orders (or a single order). Starts with
+    a snapshot, then sends a frame whenever an order's status changes. The
+    stream ends when a watched order reaches a final status or after
+    ``ORDER_EVENTS_MAX_AGE`` seconds; browsers reconnect on their own.
+    """
+    poll_interval = _setting('ORDER_EVENTS_POLL_INTERVAL', 15)
+    deadline = time.monotonic() + _setting('ORDER_EVENTS_MAX_AGE', 300)
+
+    queue = broker.subscribe(user_id)
+    sent = {}
+    last_seen = None
+
+    def fresh(events):
+        nonlocal last_seen
+        for event in events:
+            if order_id is not None and event['id'] != order_id:
+                continue
+            if last_seen is None or event['updated_at'] > last_seen:
+                last_seen = event['updated_at']
+            if sent.get(event['id']) != event['payment_status']:
+                sent[event['id']] = event['payment_status']
+                yield event
+
+    def finished():
+        return order_id is not None and sent.get(order_id) in TERMINAL_STATUSES
+
+    try:
+        yield f'retry: {poll_interval * 1000}\n\n'
+        for event in fresh(reversed(await _orders(user_id, order_id))):
+            yield _format(event)
+
+        while not finished() and time.monotonic() < deadline:
+            try:
+                events = [await asyncio.wait_for(queue.get(), timeout=poll_interval)]
+            except asyncio.TimeoutError:
+                # Catch changes made by other worker processes
+                events = reversed(await _orders(user_id, order_id, since=last_seen))
+                yield ': keepalive\n\n'
+            for event in fresh(events):
+                yield _format(event)
+    finally:
+        broker.unsubscribe(user_id, queue)
@@ -0,0 +1,66 @@
+"""
+Payment gateway.
+
+The Stripe SDK is a large import, so it is loaded and configured on the
+first payment call instead of when main.views is imported; management
+commands, tests and workers that never take a payment do not pay for it.
+Callers only deal with this module and its two exceptions.
+"""
+import importlib.util
+import threading
+
+from django.conf import settings
+
+
+_lock = threading.Lock()
+_stripe = None
+
+
+class PaymentError(Exception):
+    """The payment provider rejected or failed a request"""
+
+
+class InvalidSignature(Exception):
+    """A webhook payload was not signed with our secret"""
+
+
+def is_installed():
+    # find_spec does not import the package
+    return importlib.util.find_spec('stripe') is not None
+
+
+def is_configured():
+    return bool(getattr(settings, 'STRIPE_SECRET_KEY', None))
+
+
+def sdk():
+    """The configured stripe module, imported on first use"""
+    global _stripe
+    if _stripe is None:
+        with _lock:
+            if _stripe is None:
+                import stripe
+                stripe.api_key = getattr(settings, 'STRIPE_SECRET_KEY', None)
+                # Lets the load test point checkout at a local Stripe stand-in
+                if getattr(settings, 'STRIPE_API_BASE', None):
+                    stripe.api_base = settings.STRIPE_API_BASE
+                _stripe = stripe
+    return _stripe
+
+
+def create_checkout_session(**params):
+    """Create a Stripe Checkout Session; returns the session object"""
+    stripe = sdk()
+    try:
+        return stripe.checkout.Session.create(**params)
+    except stripe.error.StripeError as e:
+        raise PaymentError(str(e)) from e
+
+
+def construct_event(payload, signature, secret):
+    """Verified webhook event; ValueError for a malformed payload"""
+    stripe = sdk()
+    try:
+        return stripe.Webhook.construct_event(payload, signature, secret)
+    except stripe.error.SignatureVerificationError as e:
+        raise InvalidSignature(str(e)) from e
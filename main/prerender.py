@@ -0,0 +1,205 @@
+"""
+Static copies of the pages every logged-out visitor sees the same way.
+
+``manage.py prerender_pages`` renders the home, about and unfiltered explore
+pages as an anonymous user and writes them under ``PRERENDER_ROOT`` as
+``<path>/index.html`` plus ``.gz`` (and ``.br`` with the brotli package)
+variants. ``PrerenderMiddleware`` answers matching requests from those files
+before the rest of the stack runs. A front server can skip Django entirely,
+e.g. with nginx::
+
+    location ~ ^/(about/|explore/)?$ {
+        if ($args) { break; }
+        if ($http_cookie ~* "sessionid|messages") { break; }
+        root /srv/mealmate/prerendered;
+        gzip_static on;
+        try_files $uri/index.html @django;
+    }
+
+Catalog edits delete the explore copy at once (so Django serves it live) and
+queue a regeneration through the task queue; ``invalidate_prerendered()``
+does the same for any page.
+"""
+import gzip
+import os
+import tempfile
+from pathlib import Path
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.urls import resolve
+from django.utils.http import http_date
+
+from tasks.models import Task
+from tasks.queue import enqueue, task
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+PRERENDER_PATHS = ('/', '/about/', '/explore/')
+
+# Pages that show catalog data and go stale when it changes
+CATALOG_PATHS = ('/explore/',)
+
+# Preferred first when the client accepts several
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def prerender_root():
+    return Path(getattr(settings, 'PRERENDER_ROOT', settings.BASE_DIR / 'prerendered'))
+
+
+def page_file(path):
+    return prerender_root() / path.strip('/') / 'index.html'
+
+
+def render_anonymous(path):
+    """The page's HTML as a logged-out visitor without a session gets it"""
+    from django.test import RequestFactory
+
+    request = RequestFactory().get(path)
+    request.user = AnonymousUser()
+    match = resolve(path)
+    view = match.func
+    if iscoroutinefunction(view):
+        # ASYNC_VIEWS routes the catalog pages to main.async_views
+        view = async_to_sync(view)
+    response = view(request, *match.args, **match.kwargs)
+    if response.status_code != 200:
+        raise ValueError(f'{path} answered {response.status_code}, not 200.')
+    return response.content
+
+
+def _write(target, content):
+    # Write then rename so the middleware never serves a half written file
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=target.parent, prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as handle:
+        handle.write(content)
+    os.replace(tmp, target)
+
+
+def prerender(paths=PRERENDER_PATHS):
+    """Render and write ``paths``; returns {path: bytes of HTML written}"""
+    written = {}
+    for path in paths:
+        content = render_anonymous(path)
+        target = page_file(path)
+        # Compressed variants first: the plain file is what marks a page as ready
+        _write(target.with_name('index.html.gz'), gzip.compress(content, 9, mtime=0))
+        if brotli is not None:
+            _write(target.with_name('index.html.br'), brotli.compress(content))
+        _write(target, content)
+        written[path] = len(content)
+    return written
+
+
+def remove(paths=PRERENDER_PATHS):
+    for path in paths:
+        target = page_file(path)
+        for name in ('index.html', 'index.html.gz', 'index.html.br'):
+            target.with_name(name).unlink(missing_ok=True)
+
+
+@task
+def regenerate(paths):
+    prerender(paths)
+
+
+def invalidate_prerendered(paths=CATALOG_PATHS):
+    """Stop serving stale copies now and rebuild them after the commit"""
+    if not getattr(settings, 'PRERENDER_ENABLED', True):
+        return
+    remove(paths)
+
+    def schedule():
+        # Many edits in a row (an admin bulk action) still mean one rebuild
+        pending = Task.objects.filter(name=regenerate.task_name, status='QUEUED', args=[list(paths)])
+        if not pending.exists():
+            enqueue(regenerate, list(paths), delay=getattr(settings, 'PRERENDER_DELAY', 5))
+    transaction.on_commit(schedule)
+
+
+class PrerenderMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PRERENDER_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.paths = frozenset(PRERENDER_PATHS)
+        # Any of these cookies may change the page (logged in, pending messages)
+        self.cookies = (settings.SESSION_COOKIE_NAME, getattr(settings, 'MESSAGE_COOKIE_NAME', 'messages'))
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.serve(request)
+        if response is None:
+            response = self.get_response(request)
+        return response
+
+    async def __acall__(self, request):
+        # The files are small and local, so reading them inline is fine
+        response = self.serve(request)
+        if response is None:
+            response = await self.get_response(request)
+        return response
+
+    def serve(self, request):
+        if (
+            request.method not in ('GET', 'HEAD')
+            or request.path_info not in self.paths
+            or request.META.get('QUERY_STRING')
+            or any(name in request.COOKIES for name in self.cookies)
+        ):
+            return None
+        return self.serve_file(request)
+
+    def serve_file(self, request):
+        target = page_file(request.path_info)
+        if not target.exists():
+            return None
+        accepted = request.headers.get('Accept-Encoding', '')
+        encoding = None
+        for name, suffix in ENCODINGS:
+            variant = target.with_name(target.name + suffix)
+            if name in accepted and variant.exists():
+                target, encoding = variant, name
+                break
+        try:
+            stat = target.stat()
+            content = target.read_bytes()
+        except FileNotFoundError:
+            # Removed by an invalidation since the check above
+            return None
+
+        # Each encoding is its own representation with its own tag
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type='text/html; charset=utf-8')
+            response['Content-Length'] = len(content)
+            if encoding:
+                response['Content-Encoding'] = encoding
+            if request.method == 'HEAD':
+                response.content = b''
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Vary'] = 'Accept-Encoding, Cookie'
+        response['X-Prerendered'] = '1'
+        # What SecurityMiddleware and XFrameOptionsMiddleware would have added
+        response['X-Frame-Options'] = getattr(settings, 'X_FRAME_OPTIONS', 'DENY')
+        response['X-Content-Type-Options'] = 'nosniff'
+        return response
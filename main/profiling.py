@@ -0,0 +1,188 @@
+"""
+Per-request profiling.
+
+``ProfilingMiddleware`` counts and times SQL queries through
+``connection.execute_wrapper``, times template rendering and the view, and
+reports the numbers in a ``Server-Timing`` header. A sample of requests is
+kept in an in-process ring buffer that the staff performance page reads.
+
+Only sampled requests and requests that ask for timings (every request when
+DEBUG, otherwise a staff request sending ``X-Server-Timing: 1``) are
+measured; the rest pass straight through. On by default only when DEBUG.
+"""
+import random
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.template.backends.django import Template
+
+
+TIMING_HEADER = 'X-Server-Timing'
+
+_current = ContextVar('profiling_record', default=None)
+_lock = threading.Lock()
+_samples = deque(maxlen=getattr(settings, 'PROFILING_BUFFER_SIZE', 500))
+
+
+def _timed_render(render):
+    def wrapper(self, *args, **kwargs):
+        record = _current.get()
+        if record is None:
+            return render(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            record['template_time'] += time.perf_counter() - start
+    wrapper.profiled = True
+    return wrapper
+
+
+def _install_template_timer(template_class=Template):
+    if not getattr(template_class.render, 'profiled', False):
+        template_class.render = _timed_render(template_class.render)
+
+
+def install_jinja2_timer():
+    """Time Jinja2 renders too; called by main.templating when that engine is built"""
+    if getattr(settings, 'PROFILING_ENABLED', settings.DEBUG):
+        # Importing the backend imports jinja2, so only once the engine is in use
+        from django.template.backends.jinja2 import Template as Jinja2Template
+        _install_template_timer(Jinja2Template)
+
+
+class QueryRecorder:
+    """execute_wrapper callable counting queries and identical SQL shapes"""
+
+    def __init__(self, record):
+        self.record = record
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record['query_time'] += time.perf_counter() - start
+            self.record['queries'] += 1
+            # Parameters are passed separately, so the SQL text is the shape
+            self.record['shapes'][sql] += 1
+
+
+def samples():
+    with _lock:
+        return list(_samples)
+
+
+def clear_samples():
+    with _lock:
+        _samples.clear()
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 1.0)
+        _install_template_timer()
+
+    def __call__(self, request):
+        sampled = random.random() < self.sample_rate
+        wants_timing = settings.DEBUG or TIMING_HEADER in request.headers
+        if not (sampled or wants_timing):
+            return self.get_response(request)
+
+        record = {
+            'queries': 0,
+            'query_time': 0.0,
+            'template_time': 0.0,
+            'shapes': Counter(),
+        }
+        token = _current.set(record)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(QueryRecorder(record)):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+
+        duplicates = {sql: count for sql, count in record['shapes'].items() if count > 1}
+        view_time = max(total - record['template_time'], 0)
+
+        # The user is only looked at here: it costs a session and user query on pages that never need them
+        if wants_timing and (settings.DEBUG or getattr(request, 'user', None) is not None and request.user.is_staff):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={_ms(record["query_time"])};desc="{record["queries"]} queries"',
+                f'dup;desc="{sum(duplicates.values())} duplicate queries"',
+                f'tpl;dur={_ms(record["template_time"])}',
+                f'view;dur={_ms(view_time)}',
+                f'total;dur={_ms(total)}',
+            ])
+
+        if sampled:
+            match = getattr(request, 'resolver_match', None)
+            with _lock:
+                _samples.append({
+                    'route': match.view_name if match else request.path,
+                    'path': request.path,
+                    'method': request.method,
+                    'status': response.status_code,
+                    'total_ms': _ms(total),
+                    'view_ms': _ms(view_time),
+                    'template_ms': _ms(record['template_time']),
+                    'query_ms': _ms(record['query_time']),
+                    'queries': record['queries'],
+                    'duplicates': duplicates,
+                    'at': time.time(),
+                })
+        return response
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct), len(values) - 1)]
+
+
+def route_summary(limit=20):
+    """Routes ordered by their slowest p95 total time"""
+    by_route = {}
+    for sample in samples():
+        by_route.setdefault(sample['route'], []).append(sample)
+
+    rows = []
+    for route, items in by_route.items():
+        totals = [s['total_ms'] for s in items]
+        rows.append({
+            'route': route,
+            'count': len(items),
+            'avg_ms': round(sum(totals) / len(totals), 2),
+            'p95_ms': _percentile(totals, 0.95),
+            'max_ms': max(totals),
+            'avg_queries': round(sum(s['queries'] for s in items) / len(items), 1),
+            'avg_query_ms': round(sum(s['query_ms'] for s in items) / len(items), 2),
+            'avg_template_ms': round(sum(s['template_ms'] for s in items) / len(items), 2),
+        })
+    rows.sort(key=lambda row: row['p95_ms'], reverse=True)
+    return rows[:limit]
+
+
+def n_plus_one_summary(limit=20):
+    """SQL shapes repeated inside one request, worst first"""
+    worst = {}
+    for sample in samples():
+        for sql, count in sample['duplicates'].items():
+            key = (sample['route'], sql)
+            if key not in worst or count > worst[key]['repeats']:
+                worst[key] = {'route': sample['route'], 'sql': sql, 'repeats': count, 'path': sample['path']}
+    rows = sorted(worst.values(), key=lambda row: row['repeats'], reverse=True)
+    return rows[:limit]
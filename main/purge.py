@@ -0,0 +1,81 @@
+"""
+Deleting restaurants without locking up the site.
+
+``soft_delete_restaurant()`` sets ``deleted_at`` on the restaurant and its
+dishes, so the default managers stop returning them at once, and takes the
+dishes out of every cart so they cannot be bought. ``purge_restaurant``
+(a queued task, also run by ``manage.py purge_restaurants``) then removes
+what hangs off it in transactions of at most ``PURGE_BATCH_SIZE`` rows:
+cart items, reviews and dishes, then the restaurant itself. Order items
+keep their history through the ``dish_name``/``price`` snapshot and only
+lose the link to the purged dish. Rerunning a purge carries on where an
+interrupted one stopped.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from tasks.queue import enqueue, task
+
+from .batches import in_batches
+from .context_processors import invalidate_user_summaries
+from .models import CartItem, Dish, LeaderboardEntry, OrderItem, Restaurant, Review
+from .signals import catalog_upkeep_muted, refresh_catalog
+
+
+def _batch_size():
+    return getattr(settings, 'PURGE_BATCH_SIZE', 500)
+
+
+def soft_delete_restaurant(restaurant):
+    """Hide the restaurant now and queue the purge of its rows"""
+    with transaction.atomic():
+        restaurant.deleted_at = timezone.now()
+        restaurant.save(update_fields=['deleted_at'])
+        Dish.all_objects.filter(restaurant=restaurant).update(deleted_at=restaurant.deleted_at)
+        _delete_cart_items(CartItem.objects.filter(dish__restaurant=restaurant))
+        LeaderboardEntry.objects.filter(restaurant=restaurant).delete()
+        transaction.on_commit(lambda: enqueue(purge_restaurant, restaurant.id))
+
+
+def restore_restaurant(restaurant):
+    """Undo soft_delete_restaurant() if the purge has not run yet"""
+    with transaction.atomic():
+        restaurant.deleted_at = None
+        restaurant.save(update_fields=['deleted_at'])
+        Dish.all_objects.filter(restaurant=restaurant).update(deleted_at=None)
+
+
+def _delete(queryset):
+    queryset.delete()
+
+
+def _delete_cart_items(queryset):
+    invalidate_user_summaries(queryset.values_list('cart__user_id', flat=True))
+    queryset.delete()
+
+
+def _unlink(queryset):
+    queryset.update(dish=None)
+
+
+@task
+def purge_restaurant(restaurant_id, batch_size=None):
+    """Remove a soft-deleted restaurant and its rows; returns {what: rows}"""
+    restaurant = Restaurant.all_objects.filter(pk=restaurant_id, deleted_at__isnull=False).first()
+    if restaurant is None:
+        # Already purged, or restored before the purge ran
+        return {}
+    batch_size = batch_size or _batch_size()
+    dishes = Dish.all_objects.filter(restaurant_id=restaurant_id)
+    with catalog_upkeep_muted():
+        counts = {
+            'cart items': in_batches(CartItem.objects.filter(dish__in=dishes), _delete_cart_items, batch_size),
+            'order items kept': in_batches(OrderItem.objects.filter(dish__in=dishes), _unlink, batch_size),
+            'reviews': in_batches(Review.objects.filter(restaurant_id=restaurant_id), _delete, batch_size),
+            'dishes': in_batches(dishes, _delete, batch_size),
+        }
+        LeaderboardEntry.objects.filter(restaurant_id=restaurant_id).delete()
+        restaurant.delete()
+    refresh_catalog()
+    return counts
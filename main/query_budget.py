@@ -0,0 +1,125 @@
+"""
+Query budgets.
+
+``@query_budget(n)`` declares the most queries a view may run; only
+SELECT, INSERT, UPDATE and DELETE count, not the transaction statements
+around them. In development it also flags SQL that runs again and again
+with different parameters (the usual N+1 shape) and names the template line
+that caused it. Tests use ``QueryBudget`` directly as a context manager.
+
+``QUERY_BUDGET_MODE`` controls what the view decorator does on a violation:
+'raise', 'log' or 'off' (defaults to 'log' when DEBUG, otherwise 'off').
+"""
+import logging
+import sys
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+from django.template.base import Node
+
+
+logger = logging.getLogger(__name__)
+
+DATA_STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in 'raise' mode when a budget is broken"""
+
+
+def _template_line():
+    """Template name and line of the innermost node being rendered, if any"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        node = frame.f_locals.get('self')
+        if isinstance(node, Node) and getattr(node, 'token', None) is not None:
+            origin = getattr(node, 'origin', None)
+            name = getattr(origin, 'template_name', None) or getattr(origin, 'name', '?')
+            return f'{name}:{node.token.lineno}'
+        frame = frame.f_back
+    return None
+
+
+def _default_mode():
+    return getattr(settings, 'QUERY_BUDGET_MODE', 'log' if settings.DEBUG else 'off')
+
+
+class QueryBudget:
+    """
+    Context manager counting the queries run on the default connection.
+
+        with QueryBudget(5):
+            client.get(url)
+    """
+
+    def __init__(self, max_queries, repeat_threshold=None, mode='raise', label=None):
+        self.max_queries = max_queries
+        self.repeat_threshold = repeat_threshold or getattr(settings, 'QUERY_BUDGET_REPEAT_THRESHOLD', 3)
+        self.mode = mode
+        self.label = label or 'block'
+        self.count = 0
+        self.shapes = {}
+        self.origins = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip()[:6].upper() not in DATA_STATEMENTS:
+            # BEGIN, SAVEPOINT and friends come with every atomic() block and
+            # count neither towards the budget nor as repeats
+            return execute(sql, params, many, context)
+        self.count += 1
+        # Parameters are separate from the SQL, so equal text means equal shape
+        seen = self.shapes.get(sql, 0) + 1
+        self.shapes[sql] = seen
+        if seen == self.repeat_threshold:
+            self.origins[sql] = _template_line()
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._wrapper.__exit__(exc_type, exc, tb)
+        if exc_type is None:
+            self.check()
+        return False
+
+    def problems(self):
+        found = []
+        if self.count > self.max_queries:
+            found.append(f'{self.label} ran {self.count} queries, budget is {self.max_queries}')
+        for sql, seen in self.shapes.items():
+            if seen >= self.repeat_threshold:
+                where = self.origins.get(sql)
+                where = f' (from {where})' if where else ''
+                found.append(f'{self.label} repeated the same query {seen} times{where}: {sql[:200]}')
+        return found
+
+    def check(self):
+        if self.mode == 'off':
+            return
+        problems = self.problems()
+        if not problems:
+            return
+        if self.mode == 'raise':
+            raise QueryBudgetExceeded('\n'.join(problems))
+        for problem in problems:
+            logger.warning(problem)
+
+
+def query_budget(max_queries, repeat_threshold=None):
+    """Declare the query budget of a view; the budget is kept on ``view.query_budget``"""
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            mode = _default_mode()
+            if mode == 'off':
+                return view_func(request, *args, **kwargs)
+            budget = QueryBudget(max_queries, repeat_threshold, mode=mode, label=view_func.__name__)
+            with budget:
+                return view_func(request, *args, **kwargs)
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
@@ -0,0 +1,248 @@
+"""
+Token-bucket rate limiting.
+
+Each limit is a bucket holding up to ``burst`` tokens that refills at
+``rate`` (e.g. '30/m'); a request takes one token or is answered with
+``429 Too Many Requests`` and a ``Retry-After`` header. Buckets are kept per
+user, per client IP or per route:
+
+    @rate_limit('30/m', key='user')
+    def add_to_cart(request, dish_id): ...
+
+``RateLimitMiddleware`` applies the ``RATE_LIMITS`` setting to views by URL
+name, for views we would rather not touch (or third-party ones); a request to
+any other view costs one dict lookup.
+
+Buckets live in a dict in this process by default, which is exact per worker
+and needs no I/O. Set ``RATE_LIMIT_CACHE`` to a cache alias shared by all
+workers (e.g. Redis) to make the limits global; updates there are a read
+then a write, so concurrent workers may let a few extra requests through.
+"""
+import math
+import re
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+
+
+RATE_RE = re.compile(r'^(\d+)/(\d*)([smhd])$')
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+KEYS = ('user', 'ip', 'route')
+
+
+def parse_rate(rate):
+    """'30/m' -> (30, 60.0); the period may carry a count, e.g. '5/10s'"""
+    match = RATE_RE.match(rate.replace(' ', ''))
+    if not match:
+        raise ValueError(f'Invalid rate {rate!r}; expected e.g. "10/s", "30/m" or "5/10s".')
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * float(PERIODS[unit])
+
+
+def take(state, now, per_second, burst):
+    """
+    Take one token from a bucket in ``state`` ((tokens, stamp) or None for
+    a full bucket). Returns the new state and 0, or the state and the seconds
+    until a token is available.
+    """
+    tokens, stamp = state if state is not None else (burst, now)
+    tokens = min(burst, tokens + max(now - stamp, 0) * per_second)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / per_second
+
+
+class LocalBuckets:
+    """Buckets in a dict of this process"""
+
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self, max_buckets=None):
+        self.max_buckets = max_buckets or getattr(settings, 'RATE_LIMIT_MAX_BUCKETS', 100_000)
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def hit(self, key, per_second, burst):
+        now = self.clock()
+        with self.lock:
+            entry = self.buckets.get(key)
+            state, wait = take(entry and entry[:2], now, per_second, burst)
+            # A bucket is as good as absent once it has refilled
+            self.buckets[key] = (*state, now + (burst - state[0]) / per_second)
+            if len(self.buckets) > self.max_buckets:
+                self._prune(now)
+        return wait
+
+    def _prune(self, now):
+        self.buckets = {key: entry for key, entry in self.buckets.items() if entry[2] > now}
+        if len(self.buckets) > self.max_buckets:
+            # Every bucket is busy; forgetting them all errs on the side of letting clients in
+            self.buckets.clear()
+
+
+class CacheBuckets:
+    """Buckets in a Django cache shared between workers"""
+
+    clock = staticmethod(time.time)
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def hit(self, key, per_second, burst):
+        now = self.clock()
+        key = f'ratelimit:{key}'
+        state, wait = take(self.cache.get(key), now, per_second, burst)
+        self.cache.set(key, state, math.ceil(burst / per_second) + 1)
+        return wait
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                alias = getattr(settings, 'RATE_LIMIT_CACHE', None)
+                _store = CacheBuckets(alias) if alias else LocalBuckets()
+    return _store
+
+
+def client_ip(request):
+    # Behind a proxy, RATE_LIMIT_IP_HEADER names the META key it sets (e.g. HTTP_X_REAL_IP)
+    header = getattr(settings, 'RATE_LIMIT_IP_HEADER', None)
+    if header and request.META.get(header):
+        return request.META[header].split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class Limit:
+    """One rate limit: ``rate`` refill, ``burst`` capacity, bucket per ``key``"""
+
+    def __init__(self, rate, key='user', burst=None, methods=None, scope=None):
+        if not callable(key) and key not in KEYS:
+            raise ValueError(f'Rate limit key must be one of {", ".join(KEYS)} or a callable, not {key!r}.')
+        count, period = parse_rate(rate)
+        self.rate = rate
+        self.per_second = count / period
+        self.burst = burst or count
+        self.key = key
+        self.methods = {method.upper() for method in methods} if methods else None
+        self.scope = scope
+
+    def applies(self, request):
+        return self.methods is None or request.method in self.methods
+
+    def bucket(self, request):
+        scope = self.scope
+        if callable(self.key):
+            return f'{scope}:{self.key(request)}'
+        if self.key == 'route':
+            return scope
+        if self.key == 'user' and request.user.is_authenticated:
+            return f'{scope}:u{request.user.pk}'
+        # 'ip', and 'user' for anonymous requests
+        return f'{scope}:ip{client_ip(request)}'
+
+    def check(self, request):
+        """Seconds to wait before retrying, or 0 if the request may go ahead"""
+        return store().hit(self.bucket(request), self.per_second, self.burst)
+
+
+def enabled():
+    return getattr(settings, 'RATE_LIMIT_ENABLED', True)
+
+
+def too_many_requests(request, wait):
+    retry_after = max(math.ceil(wait), 1)
+    message = f'Too many requests. Try again in {retry_after} second(s).'
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or 'json' in request.headers.get('Accept', ''):
+        response = JsonResponse({'success': False, 'error': message}, status=429)
+    else:
+        response = HttpResponse(message, status=429, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def rate_limit(rate, key='user', burst=None, methods=None, scope=None):
+    """Limit a view to ``rate`` requests per ``key``; 429 with Retry-After beyond it"""
+    def decorator(view_func):
+        limit = Limit(rate, key, burst, methods, scope or f'{view_func.__module__}.{view_func.__name__}')
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if enabled() and limit.applies(request):
+                wait = limit.check(request)
+                if wait:
+                    return too_many_requests(request, wait)
+            return view_func(request, *args, **kwargs)
+        wrapper.rate_limit = limit
+        return wrapper
+    return decorator
+
+
+def _configured_limits():
+    """{url name: [Limit, ...]} from RATE_LIMITS"""
+    limits = {}
+    for view_name, rules in getattr(settings, 'RATE_LIMITS', {}).items():
+        if isinstance(rules, dict):
+            rules = [rules]
+        limits[view_name] = [Limit(scope=view_name, **rule) for rule in rules]
+    return limits
+
+
+class RateLimitMiddleware:
+    """
+    Apply ``RATE_LIMITS`` by URL name, e.g.::
+
+        RATE_LIMITS = {'main:stripe_webhook': {'rate': '50/s', 'key': 'ip'}}
+
+    Must come after AuthenticationMiddleware when a limit is keyed by user.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limits = _configured_limits()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            self.process_view = self._aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def _limits_for(self, request):
+        match = request.resolver_match
+        limits = self.limits.get(match.view_name) if match is not None else None
+        if not limits or not enabled():
+            return None
+        return [limit for limit in limits if limit.applies(request)] or None
+
+    def _check(self, request, limits):
+        wait = max(limit.check(request) for limit in limits)
+        return too_many_requests(request, wait) if wait else None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        limits = self._limits_for(request)
+        return self._check(request, limits) if limits else None
+
+    async def _aprocess_view(self, request, view_func, view_args, view_kwargs):
+        # Views without a limit never leave the event loop
+        limits = self._limits_for(request)
+        if not limits:
+            return None
+        # request.user and a shared cache both do blocking I/O
+        return await sync_to_async(self._check)(request, limits)
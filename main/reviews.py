@@ -0,0 +1,78 @@
+"""
+Review listing helpers.
+
+Reviews are paged newest first with a keyset cursor on (created_at, id), so
+a page costs the same no matter how deep it is. The rating summary (average,
+total, 1-5 star histogram and the current user's own review) comes from one
+conditional-aggregation query.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Avg, Count, Max, Q
+
+from .models import Review
+
+
+REVIEWS_PAGE_SIZE = 20
+
+
+def encode_cursor(review):
+    raw = f'{review.created_at.isoformat()}|{review.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    """(created_at, id) from a cursor, or None when it is missing or malformed"""
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode()
+        created_at, pk = raw.split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def review_page(restaurant, cursor=None, limit=REVIEWS_PAGE_SIZE):
+    """One page of reviews older than ``cursor`` and the cursor of the next page"""
+    reviews = Review.objects.filter(restaurant=restaurant).select_related('user').order_by('-created_at', '-id')
+    if cursor is not None:
+        created_at, pk = cursor
+        reviews = reviews.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    # One extra row tells us whether there is another page
+    page = list(reviews[:limit + 1])
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_cursor
+
+
+def rating_summary(restaurant, user=None):
+    """Average, total, star histogram and the user's own review in one query"""
+    user_id = user.id if user is not None and user.is_authenticated else None
+    aggregates = {
+        'average': Avg('rating'),
+        'total': Count('id'),
+        'own_review_id': Max('id', filter=Q(user_id=user_id)),
+        'own_rating': Max('rating', filter=Q(user_id=user_id)),
+    }
+    for stars in range(1, 6):
+        aggregates[f'stars_{stars}'] = Count('id', filter=Q(rating=stars))
+    row = Review.objects.filter(restaurant=restaurant).aggregate(**aggregates)
+
+    total = row['total']
+    histogram = [
+        {
+            'stars': stars,
+            'count': row[f'stars_{stars}'],
+            'percent': round(row[f'stars_{stars}'] * 100 / total) if total else 0,
+        }
+        for stars in range(5, 0, -1)
+    ]
+    return {
+        'average': row['average'] or 0,
+        'total': total,
+        'histogram': histogram,
+        'own_review_id': row['own_review_id'],
+        'own_rating': row['own_rating'],
+    }
@@ -0,0 +1,126 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Avg, Count
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+
+from accounts.models import Profile
+
+from .catalog import invalidate_catalog_cache
+from .context_processors import invalidate_user_summaries, invalidate_user_summary
+from .cuisines import invalidate_cuisine_cache
+from .models import Cart, CartItem, Cuisine, Dish, Order, Restaurant, Review
+from .order_events import publish_order
+from .prerender import invalidate_prerendered
+from .storage import release
+
+
+_muted = threading.local()
+
+
+@contextmanager
+def catalog_upkeep_muted():
+    """Skip per-row catalog and rating upkeep, e.g. while purging a hidden restaurant"""
+    previous = getattr(_muted, 'active', False)
+    _muted.active = True
+    try:
+        yield
+    finally:
+        _muted.active = previous
+
+
+def refresh_catalog():
+    """Drop cached explore results and the static explore page"""
+    if getattr(_muted, 'active', False):
+        return
+    invalidate_catalog_cache()
+    invalidate_prerendered()
+
+
+@receiver(post_save, sender=Cuisine)
+@receiver(post_delete, sender=Cuisine)
+def cuisine_changed(sender, **kwargs):
+    invalidate_cuisine_cache()
+    refresh_catalog()
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, **kwargs):
+    # Only tell listeners once the new status is visible to other connections
+    transaction.on_commit(lambda: publish_order(instance))
+
+
+@receiver(post_save, sender=Dish)
+@receiver(post_delete, sender=Dish)
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+@receiver(m2m_changed, sender=Restaurant.cuisines.through)
+def catalog_changed(sender, **kwargs):
+    refresh_catalog()
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def review_changed(sender, instance, **kwargs):
+    if getattr(_muted, 'active', False):
+        return
+    stats = Review.objects.filter(restaurant_id=instance.restaurant_id).aggregate(average=Avg('rating'), total=Count('id'))
+    Restaurant.objects.filter(pk=instance.restaurant_id).update(
+        average_rating=stats['average'] or 0, review_count=stats['total'],
+    )
+    refresh_catalog()
+
+
+@receiver(pre_save, sender=Restaurant)
+@receiver(pre_save, sender=Dish)
+def remember_image(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is None or update_fields is not None and 'image' not in update_fields:
+        return
+    # The base manager, so saving a soft-deleted row still sees its image
+    instance._previous_image = sender._base_manager.filter(pk=instance.pk).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_save, sender=Dish)
+def image_replaced(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_image', None)
+    if previous and previous != instance.image.name:
+        transaction.on_commit(lambda: release(previous))
+
+
+@receiver(post_delete, sender=Restaurant)
+@receiver(post_delete, sender=Dish)
+def image_deleted(sender, instance, **kwargs):
+    name = instance.image.name
+    if name:
+        # Only once the row is really gone, or a rollback would leave it pointing at nothing
+        transaction.on_commit(lambda: release(name))
+
+
+# Save only: a post_delete receiver would stop Django from fast-deleting cart
+# items in bulk, so code deleting them calls invalidate_user_summaries() itself
+@receiver(post_save, sender=CartItem)
+def cart_item_saved(sender, instance, **kwargs):
+    if CartItem.cart.is_cached(instance):
+        user_id = instance.cart.user_id
+    else:
+        user_id = Cart.objects.filter(pk=instance.cart_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        invalidate_user_summary(user_id)
+
+
+@receiver(pre_delete, sender=Dish)
+def dish_deleted(sender, instance, **kwargs):
+    # Its cart items go with it in a fast delete that sends no signals. A purge
+    # (muted) has already emptied the carts itself
+    if getattr(_muted, 'active', False):
+        return
+    invalidate_user_summaries(CartItem.objects.filter(dish=instance).values_list('cart__user_id', flat=True))
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def profile_changed(sender, instance, **kwargs):
+    invalidate_user_summary(instance.user_id)
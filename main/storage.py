@@ -0,0 +1,86 @@
+"""
+Content-addressed storage for uploaded images.
+
+Every file is stored once under ``blobs/<aa>/<sha256><ext>``, whatever
+``upload_to`` the field asks for, so the same logo uploaded for ten
+restaurants is one file on disk with one URL that can be cached forever.
+A blob's references are the ``Restaurant.image`` and ``Dish.image`` values
+naming it (both indexed); ``release()`` deletes it once none are left, which
+main.signals calls after a row is deleted or its image replaced.
+``manage.py dedupe_media`` moves existing uploads over.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage, default_storage
+
+
+BLOB_DIR = 'blobs'
+
+# (app_label.Model, field) pairs whose values are blob references
+IMAGE_FIELDS = (
+    ('main.Restaurant', 'image'),
+    ('main.Dish', 'image'),
+)
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def blob_name(digest, name):
+    ext = posixpath.splitext(name)[1].lower()
+    return f'{BLOB_DIR}/{digest[:2]}/{digest}{ext}'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_DIR + '/')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def _save(self, name, content):
+        name = blob_name(content_hash(content), name)
+        if self.exists(name):
+            return name
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        # Identical concurrent uploads write identical bytes; the rename makes either win cleanly
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as handle:
+            for chunk in content.chunks():
+                handle.write(chunk)
+        if self.file_permissions_mode is not None:
+            os.chmod(tmp, self.file_permissions_mode)
+        os.replace(tmp, full_path)
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # The final name comes from the content, so never rename for collisions
+        return name
+
+
+def references(name):
+    """How many image fields currently point at ``name``"""
+    total = 0
+    for label, field in IMAGE_FIELDS:
+        # _base_manager: soft-deleted rows still own their images until purged
+        total += apps.get_model(label)._base_manager.filter(**{field: name}).count()
+    return total
+
+
+def release(name, storage=None):
+    """Delete the blob ``name`` if nothing references it; True if deleted"""
+    storage = storage or default_storage
+    if not is_blob(name) or references(name):
+        return False
+    storage.delete(name)
+    return True
@@ -0,0 +1,108 @@
+"""
+Optional Jinja2 rendering for the card-heavy listing pages.
+
+The templates under ``jinja2/`` mirror their Django counterparts in
+``templates/`` and must produce the same HTML (``TemplateParityTests`` in
+main/tests.py checks it; ``manage.py template_benchmark`` times both).
+``HOT_TEMPLATE_ENGINE = 'jinja2'`` switches the hot pages over; without the
+jinja2 package they stay on Django.
+"""
+from django.conf import settings
+from django.http import QueryDict
+from django.shortcuts import render
+from django.template import defaultfilters, engines
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils.formats import localize
+from django.utils.html import conditional_escape
+from django.utils.timezone import template_localtime
+
+from .catalog import SORT_CHOICES, catalog_price_value, parse_catalog_filters, search_catalog
+from .models import Cuisine, Dish, Restaurant
+from .profiling import install_jinja2_timer
+
+
+HOT_TEMPLATES = (
+    'main/explore.html',
+    'main/staff_dashboard.html',
+    'main/admin_restaurants.html',
+    'main/restaurant_detail.html',
+)
+
+
+def url(viewname, *args, **kwargs):
+    return reverse(viewname, args=args or None, kwargs=kwargs or None)
+
+
+def finalize(value):
+    """Print values the way Django's ``{{ }}`` does: local time, localized, escaped"""
+    if isinstance(value, str):
+        return conditional_escape(value)
+    return conditional_escape(localize(template_localtime(value)))
+
+
+def environment(**options):
+    # Imported here, when the engine is first used, so startup does not pay for it
+    import jinja2
+
+    install_jinja2_timer()
+    # Missing attributes render as '' the way Django templates treat them
+    options['undefined'] = jinja2.ChainableUndefined
+    # Django keeps the newline at the end of a template; so must we for parity
+    options.setdefault('keep_trailing_newline', True)
+    env = jinja2.Environment(finalize=finalize, **options)
+    env.globals.update({'static': static, 'url': url})
+    env.filters.update({
+        'floatformat': defaultfilters.floatformat,
+        'pluralize': defaultfilters.pluralize,
+    })
+    return env
+
+
+def hot_engine():
+    """Engine alias used for the hot listing pages"""
+    name = getattr(settings, 'HOT_TEMPLATE_ENGINE', 'django')
+    if name != 'django' and name in engines:
+        return name
+    return None
+
+
+def render_hot(request, template_name, context):
+    return render(request, template_name, context, using=hot_engine())
+
+
+def sample_contexts(restaurants):
+    """
+    (template, context) pairs for every hot template, shaped like the views
+    build them, for the parity tests and the benchmark. The first and last
+    of ``restaurants`` get a detail page each.
+    """
+    listing = list(Restaurant.objects.prefetch_related('cuisines'))
+    cuisine = Cuisine.objects.first()
+    cuisine_query = f'cuisine={cuisine.id}&' if cuisine else ''
+    for query in ('', f'{cuisine_query}price=0-200&open_now=1&sort=-price&page=2', 'page=999'):
+        filters = parse_catalog_filters(QueryDict(query))
+        catalog = search_catalog(filters)
+        yield 'main/explore.html', {
+            'featured_restaurants': list(Restaurant.objects.filter(featured=True)[:10]),
+            'featured_dishes': list(Dish.objects.filter(featured=True)[:10]),
+            'all_dishes': catalog['dishes'],
+            'catalog': catalog,
+            'filters': filters,
+            'price_value': catalog_price_value(filters),
+            'sort_choices': SORT_CHOICES,
+            'pagination': {'previous': '?page=1', 'next': '?page=3'} if filters['page'] == 2 else {},
+            'leaderboards': [{'title': 'Top Rated', 'restaurants': listing[:10]}],
+        }
+    yield 'main/staff_dashboard.html', {'restaurants': listing}
+    yield 'main/admin_restaurants.html', {'restaurants': listing}
+    for restaurant in (restaurants[0], restaurants[-1]):
+        dishes = restaurant.dishes.all()
+        list(dishes)  # evaluate once; both engines then reuse the cache
+        for can_edit in (True, False):
+            yield 'main/restaurant_detail.html', {
+                'restaurant': restaurant,
+                'dishes': dishes,
+                'can_edit': can_edit,
+                'has_reviewed': not can_edit,
+            }
@@ -1,3 +1,1136 @@
-from django.test import TestCase
+import asyncio
+import csv
+import difflib
+import gzip
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import unittest
+import uuid
+from datetime import time as clock, timedelta
+from decimal import Decimal
+from types import ModuleType, SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.template import engines
+from django.http import Http404, HttpResponse, JsonResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from django.utils import timezone
+from loadtest.fake_stripe import signed_webhook
+from restaurant_project import urls as project_urls
+from tasks.models import Task
+
+from . import archive, async_views, cleanup, exports, idempotency, media, metrics, payments, prerender, ratelimit, views
+from . import urls as main_urls
+from .context_processors import user_summary
+from .cuisines import invalidate_cuisine_cache, resolve_cuisines
+from .idempotency import idempotent
+from .models import ArchivedOrder, Cart, CartItem, Cuisine, Dish, IdempotencyKey, Order, OrderItem, Restaurant, Review
+from .order_events import publish_order
+from .purge import purge_restaurant, restore_restaurant, soft_delete_restaurant
+from .query_budget import QueryBudget
+from .templating import HOT_TEMPLATES, sample_contexts
+
+
+# Names that exercise escaping (Django and Jinja2 escape quotes differently)
+TRICKY_NAMES = ['O\'Brien\'s <Grill> & "Bar"', 'Café Ünïcode', 'Plain']
+
+
+def create_catalog(cards, owners):
+    """``cards`` restaurants and as many dishes, all on the first restaurant"""
+    cuisines = [Cuisine.objects.create(name=f'Test cuisine {i}') for i in range(6)]
+    restaurants = Restaurant.objects.bulk_create([
+        Restaurant(
+            name=f'{TRICKY_NAMES[i % len(TRICKY_NAMES)]} {i}',
+            description='' if i % 2 else 'Tasty <b>food</b> & more',
+            opening_time=clock(12, 0) if i % 3 == 0 else clock(9, 30),
+            closing_time=clock(0, 0) if i % 3 == 0 else clock(22, 15),
+            iframe_location='<iframe src="https://maps.example/?q=1&amp;z=2"></iframe>' if i == 0 else '',
+            image=f'restaurants/photo {i}.jpg' if i % 2 else None,
+            owner=owners[i % len(owners)],
+            featured=i < 12,
+            location='' if i % 4 == 0 else 'MG Road, Bengaluru',
+        )
+        for i in range(cards)
+    ])
+    Restaurant.cuisines.through.objects.bulk_create([
+        Restaurant.cuisines.through(restaurant_id=restaurant.id, cuisine_id=cuisine.id)
+        for i, restaurant in enumerate(restaurants)
+        for cuisine in cuisines[:i % (len(cuisines) + 1)]
+    ])
+    # One restaurant with the whole menu, so its detail page is a large one
+    Dish.objects.bulk_create([
+        Dish(
+            restaurant=restaurants[0],
+            name=f'{TRICKY_NAMES[i % len(TRICKY_NAMES)]} dish {i}',
+            description='',
+            price=Decimal('1234.50') if i % 5 == 0 else Decimal('99.00'),
+            image=f'dishes/dish {i}.jpg' if i % 2 else None,
+            featured=i < 12,
+        )
+        for i in range(cards)
+    ])
+    return restaurants
+
+
+@unittest.skipUnless('jinja2' in engines, 'jinja2 is not installed')
+class TemplateParityTests(TestCase):
+    """The Jinja2 twins of the hot templates render the same HTML as Django"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer')
+        cls.staff = User.objects.create_user('staff')
+        cls.staff.profile.role = 'staff'
+        cls.staff.profile.save()
+        cls.superuser = User.objects.create_superuser('admin')
+        cls.restaurants = create_catalog(30, [cls.superuser, cls.staff])
+
+    def assertSameHTML(self, expected, actual):
+        if expected != actual:
+            diff = difflib.unified_diff(expected.splitlines(), actual.splitlines(), 'django', 'jinja2', lineterm='', n=1)
+            self.fail('\n'.join(list(diff)[:40]))
+
+    def test_hot_templates_match(self):
+        rendered = set()
+        for user in (AnonymousUser(), self.customer, self.staff, self.superuser):
+            request = RequestFactory().get('/')
+            request.user = user
+            for template_name, context in sample_contexts(self.restaurants):
+                rendered.add(template_name)
+                with self.subTest(template=template_name, user=str(user)):
+                    self.assertSameHTML(
+                        engines['django'].get_template(template_name).render(context, request),
+                        engines['jinja2'].get_template(template_name).render(context, request),
+                    )
+        self.assertEqual(rendered, set(HOT_TEMPLATES))
+
+
+class QueryBudgetTests(TestCase):
+    """Views stay within their declared budgets as the data grows"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.customer = User.objects.create_user('customer')
+        cls.restaurants = create_catalog(30, [cls.owner])
+        for restaurant in cls.restaurants[1:6]:
+            Dish.objects.create(restaurant=restaurant, name=f'Dish of {restaurant.pk}', price=Decimal('50.00'))
+        cart = Cart.objects.create(user=cls.customer)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, dish=dish, quantity=2) for dish in Dish.objects.all()[:15]
+        ])
+        Review.objects.bulk_create([
+            Review(user=user, restaurant=cls.restaurants[0], rating=4, comment='Good')
+            for user in User.objects.bulk_create([User(username=f'reviewer{i}') for i in range(8)])
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.customer)
+
+    def within_budget(self, view, url, method='get', status=200, **kwargs):
+        # The view's own budget, plus the session and user lookups around it
+        with override_settings(QUERY_BUDGET_MODE='raise'), QueryBudget(view.query_budget + 2, label=url):
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def get_within_budget(self, view, url):
+        return self.within_budget(view, url)
+
+    def post_within_budget(self, view, url, status=200, **kwargs):
+        return self.within_budget(view, url, 'post', status, HTTP_X_REQUESTED_WITH='XMLHttpRequest', **kwargs)
+
+    def test_transaction_statements_are_free(self):
+        with QueryBudget(1) as budget, transaction.atomic(), transaction.atomic():
+            Dish.objects.count()
+        self.assertEqual(budget.count, 1)
+
+    def test_cart(self):
+        self.get_within_budget(views.cart_page, reverse('main:cart_page'))
+
+    def test_explore(self):
+        self.get_within_budget(views.explore, reverse('main:explore'))
+
+    def test_restaurant_detail(self):
+        self.get_within_budget(views.restaurant_detail, reverse('main:restaurant_detail', args=[self.restaurants[0].pk]))
+
+    def test_add_to_cart(self):
+        new_dish = Dish.objects.create(restaurant=self.restaurants[0], name='New', price=Decimal('10.00'))
+        # A new cart and item with a quantity is the longest path
+        self.client.force_login(self.owner)
+        for dish in (new_dish, new_dish):
+            self.post_within_budget(views.add_to_cart, reverse('main:add_to_cart', args=[dish.pk]),
+                                    data={'quantity': 2}, HTTP_IDEMPOTENCY_KEY=uuid.uuid4().hex)
+
+    def test_increment_and_decrement(self):
+        item = CartItem.objects.filter(cart__user=self.customer).first()
+        for view in (views.increment_item, views.decrement_item, views.decrement_item, views.decrement_item):
+            self.post_within_budget(view, reverse(f'main:{view.__name__}', args=[item.pk]),
+                                    HTTP_IDEMPOTENCY_KEY=uuid.uuid4().hex)
+        self.assertFalse(CartItem.objects.filter(pk=item.pk).exists())
+
+    @override_settings(STRIPE_SECRET_KEY='sk_test', STRIPE_WEBHOOK_SECRET='whsec_test')
+    def test_checkout_and_webhook(self):
+        checkout = reverse('main:create_checkout_session')
+        with mock.patch('main.payments.create_checkout_session', side_effect=payments.PaymentError('declined')):
+            self.within_budget(views.create_checkout_session, checkout, 'post', 302, data={'idempotency_key': 'fails'})
+        session = SimpleNamespace(id='cs_test_1', url='https://checkout.stripe.test/cs_test_1')
+        with mock.patch('main.payments.create_checkout_session', return_value=session):
+            self.within_budget(views.create_checkout_session, checkout, 'post', 302, data={'idempotency_key': 'works'})
+
+        self.client.logout()
+        body, signature = signed_webhook(session.id, 'whsec_test')
+        self.within_budget(views.stripe_webhook, reverse('main:stripe_webhook'), 'post', data=body,
+                           content_type='application/json', HTTP_STRIPE_SIGNATURE=signature)
+        self.assertEqual(Order.objects.get().payment_status, 'PAID')
+        self.assertEqual(OrderItem.objects.count(), 15)
+
+
+class ResolveCuisinesTests(TestCase):
+    def test_cuisine_deleted_by_another_process(self):
+        thai = Cuisine.objects.create(name='Thai')
+        self.assertEqual(resolve_cuisines('thai'), [thai.pk])
+        # Another process gets no signal, so our cache still holds the id
+        with mock.patch('main.signals.invalidate_cuisine_cache'):
+            thai.delete()
+
+        ids = resolve_cuisines('Thai, Greek')
+
+        self.assertNotIn(thai.pk, ids)
+        self.assertEqual(ids, [Cuisine.objects.get(name='Thai').pk, Cuisine.objects.get(name='Greek').pk])
+
+    def test_case_variants_beyond_ascii(self):
+        egyptian = Cuisine.objects.create(name='Égyptienne')
+        self.assertEqual(resolve_cuisines('égyptienne, ÉGYPTIENNE'), [egyptian.pk])
+        invalidate_cuisine_cache()
+        # Not from the cache this time
+        self.assertEqual(resolve_cuisines('ÉgyptiennE'), [egyptian.pk])
+        self.assertEqual(Cuisine.objects.count(), 1)
+
+    def test_admin_form_rejects_case_variant(self):
+        Cuisine.objects.create(name='Égyptienne')
+        with self.assertRaises(ValidationError):
+            Cuisine(name='égyptienne').full_clean()
+
+
+# The read-only pages main.async_views serves when ASYNC_VIEWS is on
+CATALOG_PAGES = ('explore', 'restaurant_detail', 'dish_detail', 'restaurant_reviews')
+
+# Tokens that differ on every render
+VOLATILE = re.compile(r'(?<=csrfmiddlewaretoken" value=")[^"]*|\b[0-9a-f]{32}\b')
+
+
+def catalog_urlconf(catalog):
+    """The project's URLconf with the catalog pages served from ``catalog``"""
+    main_patterns = [
+        path(str(pattern.pattern), getattr(catalog, pattern.name), name=pattern.name)
+        if pattern.name in CATALOG_PAGES else pattern
+        for pattern in main_urls.urlpatterns
+    ]
+    urlconf = ModuleType(f'{catalog.__name__}_urls')
+    urlconf.urlpatterns = [
+        path('', include((main_patterns, 'main'))) if getattr(pattern, 'urlconf_name', None) is main_urls else pattern
+        for pattern in project_urls.urlpatterns
+    ]
+    return urlconf
+
+
+class AsyncViewParityTests(TestCase):
+    """main.async_views render the same HTML as their counterparts in main.views"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.customer = User.objects.create_user('customer')
+        cls.restaurants = create_catalog(30, [cls.owner])
+        reviewers = User.objects.bulk_create([User(username=f'reviewer{i}') for i in range(25)])
+        Review.objects.bulk_create([
+            Review(user=user, restaurant=cls.restaurants[0], rating=i % 5 + 1, comment=TRICKY_NAMES[i % len(TRICKY_NAMES)])
+            for i, user in enumerate(reviewers)
+        ])
+        Review.objects.create(user=cls.customer, restaurant=cls.restaurants[0], rating=5)
+
+    def urls(self):
+        restaurant = self.restaurants[0]
+        dish = restaurant.dishes.first()
+        return [
+            reverse('main:explore'),
+            reverse('main:explore') + '?sort=price_asc&q=dish',
+            reverse('main:restaurant_detail', args=[restaurant.pk]),
+            reverse('main:restaurant_detail', args=[self.restaurants[1].pk]),
+            reverse('main:dish_detail', args=[dish.pk]),
+            reverse('main:restaurant_reviews', args=[restaurant.pk]),
+            reverse('main:restaurant_reviews', args=[self.restaurants[1].pk]),
+        ]
+
+    def get_sync(self, url):
+        with override_settings(ROOT_URLCONF=catalog_urlconf(views)):
+            response = self.client.get(url)
+        return response.status_code, VOLATILE.sub('', response.content.decode())
+
+    async def get_async(self, url):
+        with override_settings(ROOT_URLCONF=catalog_urlconf(async_views)):
+            response = await self.async_client.get(url)
+        return response.status_code, VOLATILE.sub('', response.content.decode())
+
+    async def test_pages_match(self):
+        for user in (None, self.customer):
+            if user is not None:
+                await self.async_client.aforce_login(user)
+                await sync_to_async(self.client.force_login)(user)
+            for url in await sync_to_async(self.urls)():
+                with self.subTest(url=url, user=str(user)):
+                    expected = await sync_to_async(self.get_sync)(url)
+                    self.assertEqual(expected, await self.get_async(url))
+
+    async def test_missing_pages(self):
+        await self.async_client.aforce_login(self.customer)
+        with override_settings(ROOT_URLCONF=catalog_urlconf(async_views)):
+            for name in ('restaurant_detail', 'restaurant_reviews'):
+                response = await self.async_client.get(reverse(f'main:{name}', args=[0]))
+                self.assertEqual(response.status_code, 404)
+
+
+class UserSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.customer = User.objects.create_user('customer')
+        cls.restaurant = create_catalog(1, [cls.owner])[0]
+        cls.dish = cls.restaurant.dishes.get()
+        cls.cart = Cart.objects.create(user=cls.customer)
+
+    def setUp(self):
+        caches[settings.USER_SUMMARY_CACHE].clear()
+
+    def test_miss_then_hit(self):
+        CartItem.objects.create(cart=self.cart, dish=self.dish, quantity=3)
+        with self.assertNumQueries(1):
+            self.assertEqual(user_summary(self.customer), {'role': 'user', 'cart_items': 3})
+        with self.assertNumQueries(0):
+            self.assertEqual(user_summary(self.customer)['cart_items'], 3)
+
+    def test_anonymous(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(user_summary(AnonymousUser()), {'role': None, 'cart_items': 0})
+
+    def test_cart_item_save_invalidates(self):
+        user_summary(self.customer)
+        with self.captureOnCommitCallbacks(execute=True):
+            CartItem.objects.create(cart=self.cart, dish=self.dish, quantity=2)
+        self.assertEqual(user_summary(self.customer)['cart_items'], 2)
+
+    def test_profile_save_invalidates(self):
+        user_summary(self.customer)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.customer.profile.role = 'staff'
+            self.customer.profile.save()
+        self.assertEqual(user_summary(self.customer)['role'], 'staff')
+
+    def test_dish_delete_invalidates(self):
+        CartItem.objects.create(cart=self.cart, dish=self.dish, quantity=8)
+        self.assertEqual(user_summary(self.customer)['cart_items'], 8)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dish.delete()
+        self.assertEqual(user_summary(self.customer)['cart_items'], 0)
+
+    def test_delete_dish_view_updates_badge(self):
+        CartItem.objects.create(cart=self.cart, dish=self.dish, quantity=8)
+        self.client.force_login(self.customer)
+        self.assertContains(self.client.get(reverse('main:cart_page')), '<span class="cart-badge">8</span>')
+        self.client.force_login(self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('main:delete_dish', args=[self.dish.pk]))
+        self.client.force_login(self.customer)
+        self.assertNotContains(self.client.get(reverse('main:cart_page')), 'cart-badge')
+
+
+class IdempotencyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('customer')
+
+    def setUp(self):
+        self.calls = 0
+
+    def view(self, request):
+        self.calls += 1
+        return JsonResponse({'call': self.calls}, status=self.status)
+
+    def post(self, path='/cart/add/1/', key='key-1', status=200, user=None):
+        self.status = status
+        request = RequestFactory().post(path, HTTP_IDEMPOTENCY_KEY=key)
+        request.user = user or self.user
+        return idempotent(self.view)(request)
+
+    def test_first_response_is_replayed(self):
+        first = self.post()
+        replay = self.post()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual((replay.status_code, replay.content), (first.status_code, first.content))
+        self.assertEqual(replay['Content-Type'], 'application/json')
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertFalse(first.has_header('Idempotent-Replayed'))
+
+    def test_keys_belong_to_one_user(self):
+        self.post()
+        self.post(user=User.objects.create_user('other'))
+        self.assertEqual(self.calls, 2)
+
+    def test_key_reused_for_another_request(self):
+        self.post('/cart/add/1/')
+        response = self.post('/cart/add/2/')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.calls, 1)
+
+    def test_first_request_still_running(self):
+        fingerprint = idempotency._fingerprint(RequestFactory().post('/cart/add/1/'))
+        IdempotencyKey.objects.create(user=self.user, key='key-1', fingerprint=fingerprint)
+        response = self.post()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.calls, 0)
+
+    def test_server_error_releases_key(self):
+        self.assertEqual(self.post(status=503).status_code, 503)
+        self.assertEqual(self.post().status_code, 200)
+        self.assertEqual(self.calls, 2)
+
+    def test_exception_releases_key(self):
+        with mock.patch.object(self, 'view', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.post()
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_expired_key_runs_again(self):
+        self.post()
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL + 1))
+        self.assertEqual(json.loads(self.post().content), {'call': 2})
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+        self.assertEqual(idempotency.purge_expired(), 0)
+
+    def test_purge_expired(self):
+        self.post(key='old')
+        self.post(key='new')
+        IdempotencyKey.objects.filter(key='old').update(created_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(idempotency.purge_expired(batch_size=1), 1)
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['new'])
+
+    def test_add_to_cart_twice_with_one_key(self):
+        dish = create_catalog(1, [self.user])[0].dishes.get()
+        self.client.force_login(self.user)
+        url = reverse('main:add_to_cart', args=[dish.pk])
+        for _ in range(2):
+            response = self.client.post(url, HTTP_IDEMPOTENCY_KEY='add-1', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+
+    def test_without_key_or_login(self):
+        self.post(key='')
+        self.post(key='')
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.post(key='x' * 256).status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class PrerenderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.restaurants = create_catalog(3, [cls.owner])
+
+    def setUp(self):
+        self.assertNotEqual(prerender.prerender_root(), settings.BASE_DIR / 'prerendered')
+        prerender.prerender()
+        self.addCleanup(prerender.remove)
+
+    def test_served_from_file(self):
+        response = self.client.get('/explore/')
+        self.assertEqual(response['X-Prerendered'], '1')
+        self.assertEqual(response.content, prerender.page_file('/explore/').read_bytes())
+        self.assertEqual(self.client.head('/about/')['X-Prerendered'], '1')
+
+    def test_bypassed(self):
+        self.client.cookies['messages'] = 'pending'
+        self.assertFalse(self.client.get('/explore/').has_header('X-Prerendered'))
+        del self.client.cookies['messages']
+        for response in (
+            self.client.get('/explore/?sort=price_asc'),
+            self.client.post('/about/'),
+            self.client.get('/cart/'),
+        ):
+            self.assertFalse(response.has_header('X-Prerendered'))
+        self.client.force_login(self.owner)
+        self.assertFalse(self.client.get('/').has_header('X-Prerendered'))
+
+    def test_not_modified(self):
+        etag = self.client.get('/about/')['ETag']
+        response = self.client.get('/about/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get('/about/', HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_gzip(self):
+        plain = self.client.get('/explore/')
+        compressed = self.client.get('/explore/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertNotEqual(compressed['ETag'], plain['ETag'])
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+
+    def test_catalog_change_removes_explore_copy(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Dish.objects.create(restaurant=self.restaurants[0], name='New', price=Decimal('10.00'))
+        self.assertFalse(prerender.page_file('/explore/').exists())
+        self.assertTrue(prerender.page_file('/about/').exists())
+        self.assertFalse(self.client.get('/explore/').has_header('X-Prerendered'))
+        self.assertEqual(Task.objects.get(name=prerender.regenerate.task_name).args, [['/explore/']])
+
+
+@override_settings(ORDER_EVENTS_STREAM=True, ORDER_EVENTS_POLL_INTERVAL=30)
+class OrderStatusStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer')
+        cls.order = Order.objects.create(user=cls.customer, total_price=Decimal('99.00'), stripe_session_id='cs_1')
+        cls.other = Order.objects.create(user=cls.customer, total_price=Decimal('10.00'))
+
+    async def next_frame(self, frames):
+        return await asyncio.wait_for(anext(frames), timeout=5)
+
+    async def test_snapshot_then_paid_then_end(self):
+        await self.async_client.aforce_login(self.customer)
+        response = await self.async_client.get(reverse('main:order_status_stream'), {'order': self.order.pk})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        frames = aiter(response.streaming_content)
+
+        self.assertEqual(await self.next_frame(frames), b'retry: 30000\n\n')
+        snapshot = await self.next_frame(frames)
+        self.assertIn(b'event: status', snapshot)
+        self.assertIn(f'"id": {self.order.pk}, "payment_status": "PENDING"'.encode(), snapshot)
+
+        # What the post_save receiver does once the webhook commits
+        order = await Order.objects.aget(pk=self.order.pk)
+        order.payment_status = 'PAID'
+        await order.asave()
+        publish_order(order)
+        self.assertIn(b'"payment_status": "PAID"', await self.next_frame(frames))
+
+        with self.assertRaises(StopAsyncIteration):
+            await self.next_frame(frames)
+
+    async def test_needs_login(self):
+        response = await self.async_client.get(reverse('main:order_status_stream'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_success_page_uses_the_stream(self):
+        self.client.force_login(self.customer)
+        response = self.client.get(reverse('main:checkout_success'), {'session_id': 'cs_1'})
+        self.assertContains(response, 'new EventSource(')
+        self.assertNotContains(response, 'http-equiv="refresh"')
+
+    @override_settings(ORDER_EVENTS_STREAM=False)
+    def test_without_asgi_the_page_reloads(self):
+        self.client.force_login(self.customer)
+        response = self.client.get(reverse('main:checkout_success'), {'session_id': 'cs_1'})
+        self.assertContains(response, '<meta http-equiv="refresh" content="5">')
+        self.assertNotContains(response, 'EventSource(')
+        self.assertEqual(self.client.get(reverse('main:order_status_stream')).status_code, 204)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        buckets = ratelimit.LocalBuckets()
+        buckets.clock = self.clock
+        patcher = mock.patch.object(ratelimit, '_store', buckets)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request(self, ip='10.0.0.1', **headers):
+        request = RequestFactory().post('/cart/add/1/', REMOTE_ADDR=ip, **headers)
+        request.user = AnonymousUser()
+        return request
+
+    def test_parse_rate(self):
+        self.assertEqual(ratelimit.parse_rate('30/m'), (30, 60.0))
+        self.assertEqual(ratelimit.parse_rate('5 / 10s'), (5, 10.0))
+        with self.assertRaises(ValueError):
+            ratelimit.parse_rate('30 per minute')
+
+    def test_burst_then_refill(self):
+        limit = ratelimit.Limit('60/m', key='ip', burst=3, scope='test')
+        request = self.request()
+        self.assertEqual([limit.check(request) for _ in range(3)], [0, 0, 0])
+        # Empty: one token a second
+        self.assertAlmostEqual(limit.check(request), 1.0)
+        self.clock.now += 0.5
+        self.assertAlmostEqual(limit.check(request), 0.5)
+        self.clock.now += 0.5
+        self.assertEqual(limit.check(request), 0)
+        # Refills up to the burst, not beyond
+        self.clock.now += 3600
+        self.assertEqual([limit.check(request) for _ in range(3)], [0, 0, 0])
+        self.assertGreater(limit.check(request), 0)
+
+    def test_buckets_per_key(self):
+        limit = ratelimit.Limit('1/m', key='ip', scope='test')
+        self.assertEqual(limit.check(self.request('10.0.0.1')), 0)
+        self.assertGreater(limit.check(self.request('10.0.0.1')), 0)
+        self.assertEqual(limit.check(self.request('10.0.0.2')), 0)
+
+    def limited_view(self):
+        return ratelimit.rate_limit('1/m', key='ip')(lambda request: HttpResponse('ok'))
+
+    def test_too_many_requests(self):
+        view = self.limited_view()
+        self.assertEqual(view(self.request()).status_code, 200)
+
+        response = view(self.request())
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(b'Try again in 60 second(s)', response.content)
+
+        response = view(self.request(HTTP_X_REQUESTED_WITH='XMLHttpRequest'))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(json.loads(response.content)['success'], False)
+        self.assertIn('Try again', json.loads(response.content)['error'])
+
+    @override_settings(RATE_LIMIT_ENABLED=False)
+    def test_disabled(self):
+        view = self.limited_view()
+        self.assertEqual([view(self.request()).status_code for _ in range(5)], [200] * 5)
+
+    def test_methods(self):
+        limit = ratelimit.Limit('1/m', key='ip', methods=['post'], scope='test')
+        self.assertTrue(limit.applies(self.request()))
+        self.assertFalse(limit.applies(RequestFactory().get('/')))
+
+    def test_webhook_buckets_per_sender(self):
+        url = reverse('main:stripe_webhook')
+        for _ in range(100):
+            self.client.post(url, REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(self.client.post(url, REMOTE_ADDR='10.0.0.1').status_code, 429)
+        self.assertNotEqual(self.client.post(url, REMOTE_ADDR='10.0.0.2').status_code, 429)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+        overrides = override_settings(METRICS_DIR=self.dir, METRICS_TOKEN=None, METRICS_FLUSH_INTERVAL=0.05)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        for name, value in (('_counters', {}), ('_histograms', {}), ('_last_flush', 0.0), ('_flush_timer', None)):
+            patcher = mock.patch.object(metrics, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.cancel_timer)
+
+    def cancel_timer(self):
+        if metrics._flush_timer is not None:
+            metrics._flush_timer[1].cancel()
+
+    def write(self, pid, counters=(), histograms=()):
+        with open(os.path.join(self.dir, f'metrics-{pid}.json'), 'w') as fh:
+            json.dump({'counters': list(counters), 'histograms': list(histograms)}, fh)
+
+    def dead_pid(self):
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        return process.pid
+
+    def own_file(self):
+        with open(os.path.join(self.dir, f'metrics-{os.getpid()}.json')) as fh:
+            return json.load(fh)
+
+    def test_collect_merges_live_processes(self):
+        metrics.inc('cart_operations_total', op='add')
+        metrics.observe('http_request_duration_seconds', 0.02, buckets=(0.01, 0.1), route='home')
+        self.write(os.getppid(), [['cart_operations_total', [['op', 'add']], 2]], [[
+            'http_request_duration_seconds', [['route', 'home']],
+            {'buckets': [0.01, 0.1], 'counts': [1, 1], 'sum': 0.005, 'count': 1},
+        ]])
+        dead = self.dead_pid()
+        self.write(dead, [['cart_operations_total', [['op', 'add']], 100]])
+        self.write('junk')
+
+        counters, histograms = metrics._collect()
+        self.assertEqual(counters, {('cart_operations_total', (('op', 'add'),)): 3})
+        hist = histograms[('http_request_duration_seconds', (('route', 'home'),))]
+        self.assertEqual((hist['counts'], hist['count']), ([1, 2], 2))
+        self.assertAlmostEqual(hist['sum'], 0.025)
+        # The dead process's file is gone, the others stay
+        self.assertEqual(
+            sorted(os.listdir(self.dir)),
+            sorted(f'metrics-{pid}.json' for pid in (os.getpid(), os.getppid(), 'junk')),
+        )
+
+    def test_late_change_is_flushed_by_a_timer(self):
+        metrics.inc('cart_operations_total', op='add')
+        metrics.inc('cart_operations_total', op='add')
+        # The first increment was written at once, the second waits for the interval
+        self.assertEqual(self.own_file()['counters'], [['cart_operations_total', [['op', 'add']], 1]])
+        metrics._flush_timer[1].join(timeout=5)
+        self.assertEqual(self.own_file()['counters'], [['cart_operations_total', [['op', 'add']], 2]])
+
+    def test_render(self):
+        metrics.inc('cart_operations_total', op='say "hi"')
+        text = metrics.render({('orders', (('payment_status', 'PAID'),)): 4})
+        self.assertIn('# TYPE cart_operations_total counter\ncart_operations_total{op="say \\"hi\\""} 1\n', text)
+        self.assertIn('orders{payment_status="PAID"} 4\n', text)
+
+    def test_view_needs_staff_without_token(self):
+        url = reverse('main:metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create_user('customer'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+    def test_view_with_token(self):
+        url = reverse('main:metrics')
+        with override_settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+            response = self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong')
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+            # A token replaces the staff login
+            self.client.force_login(User.objects.create_user('staff', is_staff=True))
+            self.assertEqual(self.client.get(url).status_code, 401)
+
+
+class SoftDeleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.customer = User.objects.create_user('customer')
+        cls.restaurant, cls.other = create_catalog(2, [cls.owner])
+        cls.dishes = Dish.objects.bulk_create([
+            Dish(restaurant=cls.restaurant, name=f'Dish {i}', price=Decimal('10.00')) for i in range(4)
+        ])
+        cart = Cart.objects.create(user=cls.customer)
+        CartItem.objects.bulk_create([CartItem(cart=cart, dish=dish) for dish in cls.dishes])
+        order = Order.objects.create(user=cls.customer, total_price=Decimal('20.00'), payment_status='PAID')
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, dish=dish, dish_name=dish.name, quantity=1, price=dish.price) for dish in cls.dishes[:2]
+        ])
+        Review.objects.create(user=cls.customer, restaurant=cls.restaurant, rating=5)
+
+    def soft_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            soft_delete_restaurant(self.restaurant)
+
+    def test_hidden_by_default_managers(self):
+        self.soft_delete()
+        self.assertFalse(Restaurant.objects.filter(pk=self.restaurant.pk).exists())
+        self.assertTrue(Restaurant.all_objects.filter(pk=self.restaurant.pk).exists())
+        self.assertFalse(Dish.objects.filter(restaurant_id=self.restaurant.pk).exists())
+        self.assertEqual(Dish.all_objects.filter(restaurant_id=self.restaurant.pk).count(), 6)
+        self.assertFalse(Dish.objects.filter(restaurant=self.other).exists())
+        self.assertTrue(Restaurant.objects.filter(pk=self.other.pk).exists())
+        # Out of every cart at once, and queued for purging
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(Task.objects.get(name=purge_restaurant.task_name).args, [self.restaurant.pk])
+
+    def test_purge_resumes_after_interruption(self):
+        self.soft_delete()
+        calls = []
+
+        def fail_second_batch(queryset):
+            calls.append(1)
+            if len(calls) == 3:
+                raise RuntimeError('worker killed')
+            queryset.delete()
+
+        with mock.patch('main.purge._delete', side_effect=fail_second_batch), self.assertRaises(RuntimeError):
+            purge_restaurant(self.restaurant.pk, batch_size=2)
+        # Reviews and the first batch of dishes stayed deleted, the failed batch rolled back
+        self.assertFalse(Review.objects.filter(restaurant_id=self.restaurant.pk).exists())
+        self.assertEqual(Dish.all_objects.filter(restaurant_id=self.restaurant.pk).count(), 4)
+
+        self.assertEqual(purge_restaurant(self.restaurant.pk, batch_size=2)['dishes'], 4)
+        self.assertFalse(Restaurant.all_objects.filter(pk=self.restaurant.pk).exists())
+        self.assertFalse(Dish.all_objects.filter(restaurant_id=self.restaurant.pk).exists())
+        # Order history keeps the names
+        self.assertEqual(sorted(OrderItem.objects.values_list('dish', 'dish_name')), [(None, 'Dish 0'), (None, 'Dish 1')])
+        self.assertEqual(purge_restaurant(self.restaurant.pk), {})
+
+    def test_restore(self):
+        self.soft_delete()
+        restore_restaurant(Restaurant.all_objects.get(pk=self.restaurant.pk))
+        self.assertTrue(Restaurant.objects.filter(pk=self.restaurant.pk).exists())
+        self.assertEqual(Dish.objects.filter(restaurant_id=self.restaurant.pk).count(), 6)
+        # The queued purge finds nothing to do
+        self.assertEqual(purge_restaurant(self.restaurant.pk), {})
+        self.assertTrue(Review.objects.filter(restaurant_id=self.restaurant.pk).exists())
+
+    def test_replacing_image_of_hidden_restaurant_releases_old_one(self):
+        Restaurant.objects.filter(pk=self.restaurant.pk).update(image='restaurants/old.jpg')
+        self.soft_delete()
+        restaurant = Restaurant.all_objects.get(pk=self.restaurant.pk)
+        restaurant.image = 'restaurants/new.jpg'
+        with mock.patch('main.signals.release') as release, self.captureOnCommitCallbacks(execute=True):
+            restaurant.save()
+        release.assert_called_once_with('restaurants/old.jpg')
+
+
+def create_order(user, dishes, days_ago, status='PAID'):
+    """A ``status`` order of one of each dish, backdated ``days_ago`` days"""
+    order = Order.objects.create(user=user, total_price=sum(dish.price for dish in dishes), payment_status=status)
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, dish=dish, dish_name=dish.name, quantity=1, price=dish.price) for dish in dishes
+    ])
+    created_at = timezone.now() - timedelta(days=days_ago)
+    Order.objects.filter(pk=order.pk).update(created_at=created_at, updated_at=created_at)
+    order.refresh_from_db()
+    return order
+
+
+@override_settings(ORDER_ARCHIVE_AFTER_DAYS=180)
+class ArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.customer = User.objects.create_user('customer')
+        restaurant, = create_catalog(1, [cls.owner])
+        cls.pizza, cls.pasta = Dish.objects.bulk_create([
+            Dish(restaurant=restaurant, name=name, price=Decimal(price))
+            for name, price in (('Pizza', '12.50'), ('Pasta', '9.00'))
+        ])
+        cls.oldest = create_order(cls.customer, [cls.pizza, cls.pasta], 400)
+        cls.old = create_order(cls.customer, [cls.pasta], 200, status='CANCELLED')
+        # Still waiting on payment, so never archived however old
+        cls.pending = create_order(cls.customer, [cls.pizza], 300, status='PENDING')
+        cls.recent = create_order(cls.customer, [cls.pizza], 10)
+
+    def archive(self, **kwargs):
+        return list(archive.archive_orders(**kwargs))
+
+    def test_moves_finished_old_orders(self):
+        self.assertEqual(self.archive(batch_size=1), [1, 1])
+        self.assertEqual(set(Order.objects.values_list('id', flat=True)), {self.pending.pk, self.recent.pk})
+        self.assertFalse(OrderItem.objects.filter(order_id__in=[self.oldest.pk, self.old.pk]).exists())
+
+        archived = ArchivedOrder.objects.get(pk=self.oldest.pk)
+        self.assertEqual((archived.user, archived.total_price, archived.created_at),
+                         (self.customer, Decimal('21.50'), self.oldest.created_at))
+        self.assertEqual(archived.items, [[self.pizza.pk, 'Pizza', 1, '12.50'], [self.pasta.pk, 'Pasta', 1, '9.00']])
+        self.assertEqual([line.get_subtotal() for line in archived.get_line_items()], [Decimal('12.50'), Decimal('9.00')])
+        self.assertEqual(self.archive(), [])
+
+    def test_copies_before_deleting(self):
+        copy = ArchivedOrder.objects.bulk_create
+        live_while_copying = []
+
+        def checked_copy(archived):
+            live_while_copying.append(Order.objects.filter(pk__in=[order.id for order in archived]).count())
+            return copy(archived)
+
+        with mock.patch.object(ArchivedOrder.objects, 'bulk_create', side_effect=checked_copy):
+            self.assertEqual(self.archive(), [2])
+        self.assertEqual(live_while_copying, [2])
+
+    def test_conflicting_insert_rolls_the_batch_back(self):
+        ArchivedOrder.objects.create(
+            id=self.old.pk, user=self.customer, total_price=0, payment_status='PAID',
+            created_at=self.old.created_at, updated_at=self.old.updated_at,
+        )
+        with self.assertRaises(IntegrityError):
+            self.archive()
+        # Neither order of the batch was deleted, nor copied
+        self.assertEqual(Order.objects.filter(pk__in=[self.oldest.pk, self.old.pk]).count(), 2)
+        self.assertEqual(OrderItem.objects.filter(order=self.oldest).count(), 2)
+        self.assertFalse(ArchivedOrder.objects.filter(pk=self.oldest.pk).exists())
+
+    def test_user_orders_merges_live_and_archived(self):
+        self.archive()
+        orders = archive.user_orders(self.customer)
+        self.assertEqual([order.pk for order in orders], [self.recent.pk, self.old.pk, self.pending.pk, self.oldest.pk])
+        self.assertEqual([type(order) for order in orders], [Order, ArchivedOrder, Order, ArchivedOrder])
+        self.assertEqual([[line.dish_name for line in order.get_line_items()] for order in orders],
+                         [['Pizza'], ['Pasta'], ['Pizza'], ['Pizza', 'Pasta']])
+        self.assertEqual(archive.user_orders(self.owner), [])
+
+    def test_exports_include_archived_orders(self):
+        self.archive()
+        rows = list(exports.order_rows({}))
+        self.assertEqual([row[0] for row in rows], [self.oldest.pk, self.pending.pk, self.old.pk, self.recent.pk])
+        self.assertEqual(rows[0][:6], (self.oldest.pk, 'customer', '', Decimal('21.50'), 'PAID', None))
+
+        items = list(exports.order_item_rows(None, {}))
+        self.assertEqual([(row[0], row[4] is None, row[6]) for row in items], [
+            (self.oldest.pk, True, 'Pizza'), (self.oldest.pk, True, 'Pasta'),
+            (self.pending.pk, False, 'Pizza'), (self.old.pk, True, 'Pasta'), (self.recent.pk, False, 'Pizza'),
+        ])
+        # Archived dish ids still resolve to their restaurant
+        self.assertEqual({row[7] for row in items}, {self.pizza.restaurant_id})
+
+        self.assertEqual([row[0] for row in exports.order_rows({'status': 'CANCELLED'})], [self.old.pk])
+        self.assertEqual([row[0] for row in exports.order_rows({'restaurant': self.pizza.restaurant_id + 1})], [])
+
+
+class MediaTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        os.makedirs(os.path.join(root.name, 'dishes'))
+        with open(os.path.join(root.name, 'dishes', 'pizza.jpg'), 'wb') as f:
+            f.write(bytes(range(100)))
+        with open(os.path.join(root.name, 'secret.txt'), 'w') as f:
+            f.write('not media')
+        # secret.txt sits next to MEDIA_ROOT, not inside it
+        settings_override = override_settings(MEDIA_ROOT=os.path.join(root.name, 'dishes'), MEDIA_ACCEL=None)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.factory = RequestFactory()
+
+    def get(self, path='pizza.jpg', **headers):
+        response = media.serve_media(self.factory.get(f'/media/{path}', headers=headers), path)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        if response.streaming:
+            response.close()
+        return response, body
+
+    def test_parse_range(self):
+        self.assertEqual(media.parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(media.parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(media.parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(media.parse_range('bytes=95-200', 100), (95, 99))
+        self.assertEqual(media.parse_range('bytes=-200', 100), (0, 99))
+        for header in ('bytes=100-', 'bytes=9-0', 'bytes=-', 'bytes=0-1,5-6', 'items=0-9'):
+            self.assertIsNone(media.parse_range(header, 100), header)
+
+    def test_whole_file(self):
+        response, body = self.get()
+        self.assertEqual((response.status_code, body), (200, bytes(range(100))))
+        self.assertEqual((response['Content-Type'], response['Accept-Ranges']), ('image/jpeg', 'bytes'))
+        self.assertIn('max-age=', response['Cache-Control'])
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_range(self):
+        response, body = self.get(Range='bytes=10-19')
+        self.assertEqual((response.status_code, body), (206, bytes(range(10, 20))))
+        self.assertEqual((response['Content-Range'], response['Content-Length']), ('bytes 10-19/100', '10'))
+
+    def test_unsatisfiable_range(self):
+        response, body = self.get(Range='bytes=100-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */100'))
+
+    def test_if_range_mismatch_sends_whole_file(self):
+        etag = self.get()[0]['ETag']
+        response, body = self.get(Range='bytes=10-19', **{'If-Range': '"stale"'})
+        self.assertEqual((response.status_code, len(body)), (200, 100))
+        response, body = self.get(Range='bytes=10-19', **{'If-Range': etag})
+        self.assertEqual((response.status_code, len(body)), (206, 10))
+
+    def test_not_modified(self):
+        first = self.get()[0]
+        for headers in (
+            {'If-None-Match': first['ETag']},
+            {'If-None-Match': f'"other", {first["ETag"]}'},
+            {'If-Modified-Since': first['Last-Modified']},
+        ):
+            response, body = self.get(**headers)
+            self.assertEqual((response.status_code, body), (304, b''), headers)
+            self.assertEqual(response['ETag'], first['ETag'])
+        # A stale ETag wins over a fresh date
+        response = self.get(**{'If-None-Match': '"other"', 'If-Modified-Since': first['Last-Modified']})[0]
+        self.assertEqual(response.status_code, 200)
+
+    def test_paths_outside_media_root_are_rejected(self):
+        for path in ('../secret.txt', '/etc/passwd', 'missing.jpg', ''):
+            with self.assertRaises(Http404, msg=path):
+                self.get(path)
+
+    def test_accel_headers(self):
+        with self.settings(MEDIA_ACCEL='X-Accel-Redirect', MEDIA_ACCEL_PREFIX='/protected-media/'):
+            response, body = self.get(Range='bytes=0-9')
+        self.assertEqual((response.status_code, body), (200, b''))
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/pizza.jpg')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('ETag', response)
+
+        with self.settings(MEDIA_ACCEL='x-sendfile'):
+            response, body = self.get()
+        self.assertEqual(response['X-Sendfile'], os.path.join(settings.MEDIA_ROOT, 'pizza.jpg'))
+        self.assertNotIn('X-Accel-Redirect', response)
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin')
+        cls.alice, cls.bob = [User.objects.create_user(name) for name in ('alice', 'bob')]
+        for owner in (cls.alice, cls.bob):
+            owner.profile.role = 'staff'
+            owner.profile.save()
+        customer = User.objects.create_user('customer', email='customer@example.com')
+        cls.alices, cls.bobs = create_catalog(2, [cls.alice, cls.bob])
+        cls.soup, cls.stew = Dish.objects.bulk_create([
+            Dish(restaurant=restaurant, name=name, price=Decimal('5.00'))
+            for restaurant, name in ((cls.alices, 'Soup'), (cls.bobs, 'Stew'))
+        ])
+        cls.archived = create_order(customer, [cls.soup, cls.stew], 300)
+        cls.failed = create_order(customer, [cls.stew], 200, status='FAILED')
+        cls.recent = create_order(customer, [cls.soup], 5)
+        list(archive.archive_orders(before=timezone.now() - timedelta(days=250)))
+
+    def export(self, user, **params):
+        self.client.force_login(user)
+        response = self.client.get(reverse('main:export_orders'), params)
+        if response.status_code != 200:
+            return response, None
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv_merges_live_and_archived_items(self):
+        response, body = self.export(self.admin)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertRegex(response['Content-Disposition'], r'attachment; filename="items-[\d-]+\.csv"')
+        header, *rows = csv.reader(io.StringIO(body))
+        self.assertEqual(tuple(header), exports.ITEM_HEADER)
+        self.assertEqual([(int(row[0]), row[4] == '', row[6], row[8]) for row in rows], [
+            (self.archived.pk, True, 'Soup', self.alices.name),
+            (self.archived.pk, True, 'Stew', self.bobs.name),
+            (self.failed.pk, False, 'Stew', self.bobs.name),
+            (self.recent.pk, False, 'Soup', self.alices.name),
+        ])
+
+    def test_owner_only_sees_their_restaurants(self):
+        response, body = self.export(self.alice, format='jsonl')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([(row['order_id'], row['item_id'] is None, row['dish_name']) for row in rows], [
+            (self.archived.pk, True, 'Soup'), (self.recent.pk, False, 'Soup'),
+        ])
+        self.assertEqual({row['restaurant_id'] for row in rows}, {self.alices.pk})
+        self.assertEqual(rows[0]['price'], '5.00')
+
+        body = self.export(self.bob, format='jsonl', restaurant=self.alices.pk)[1]
+        self.assertEqual(body, '')
+
+    def test_filters(self):
+        def order_ids(**params):
+            body = self.export(self.admin, format='jsonl', **params)[1]
+            return [json.loads(line)['order_id'] for line in body.splitlines()]
+
+        failed_day = timezone.localdate(self.failed.created_at).isoformat()
+        self.assertEqual(order_ids(start=failed_day), [self.failed.pk, self.recent.pk])
+        self.assertEqual(order_ids(end=failed_day), [self.archived.pk, self.archived.pk, self.failed.pk])
+        self.assertEqual(order_ids(start=failed_day, end=failed_day), [self.failed.pk])
+        self.assertEqual(order_ids(status='failed'), [self.failed.pk])
+        self.assertEqual(order_ids(restaurant=self.alices.pk), [self.archived.pk, self.recent.pk])
+
+        for params in ({'start': '2026-13-01'}, {'restaurant': 'x'}, {'status': 'LOST'}, {'format': 'xml'}, {'level': 'dishes'}):
+            self.assertEqual(self.export(self.admin, **params)[0].status_code, 400, params)
+
+    def test_only_superusers_export_whole_orders(self):
+        response = self.export(self.alice, level='orders')[0]
+        self.assertEqual((response.status_code, response.content), (400, b'Only superusers can export whole orders.'))
+
+        header, *rows = csv.reader(io.StringIO(self.export(self.admin, level='orders')[1]))
+        self.assertEqual(tuple(header), exports.ORDER_HEADER)
+        self.assertEqual([(int(row[0]), row[2], row[4]) for row in rows], [
+            (self.archived.pk, 'customer@example.com', 'PAID'),
+            (self.failed.pk, 'customer@example.com', 'FAILED'),
+            (self.recent.pk, 'customer@example.com', 'PAID'),
+        ])
+        body = self.export(self.admin, level='orders', restaurant=self.bobs.pk)[1]
+        self.assertEqual([int(row[0]) for row in list(csv.reader(io.StringIO(body)))[1:]], [self.archived.pk, self.failed.pk])
+
+
+@override_settings(
+    CART_RETENTION_DAYS=30, PENDING_ORDER_TIMEOUT_HOURS=24, IDEMPOTENCY_KEY_TTL=3600,
+    SESSION_ENGINE='django.contrib.sessions.backends.db',
+)
+class CleanupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        users = [User.objects.create_user(f'user{i}') for i in range(3)]
+        restaurant, = create_catalog(1, users[:1])
+        dish = Dish.objects.get(restaurant=restaurant)
+        cls.abandoned, cls.edited, cls.fresh = Cart.objects.bulk_create([Cart(user=user) for user in users])
+        # The cart row is old, but an item changed yesterday
+        item = CartItem.objects.create(cart=cls.edited, dish=dish)
+        Cart.objects.filter(pk__in=[cls.abandoned.pk, cls.edited.pk]).update(updated_at=cls.now - timedelta(days=31))
+        CartItem.objects.filter(pk=item.pk).update(updated_at=cls.now - timedelta(days=1))
+
+        cls.stale = create_order(users[0], [dish], 2, status='PENDING')
+        cls.waiting = create_order(users[0], [dish], 0, status='PENDING')
+        cls.paid = create_order(users[0], [dish], 2)
+
+        Session.objects.bulk_create([
+            Session(session_key=f'session{i}', session_data='', expire_date=cls.now + timedelta(days=1 if i < 2 else -1))
+            for i in range(7)
+        ])
+        keys = IdempotencyKey.objects.bulk_create([
+            IdempotencyKey(user=users[0], key=f'key{i}', fingerprint='') for i in range(4)
+        ])
+        IdempotencyKey.objects.filter(pk__in=[key.pk for key in keys[1:]]).update(created_at=cls.now - timedelta(hours=2))
+
+    def deletes(self, queries, table):
+        return [q for q in queries if q['sql'].startswith('DELETE') and f'"{table}"' in q['sql'].split('WHERE')[0]]
+
+    def test_cleanup(self):
+        with CaptureQueriesContext(connection) as queries:
+            report = cleanup.run_cleanup(now=self.now, batch_size=2)
+        self.assertEqual(report, {
+            'abandoned carts': 1, 'stale pending orders': 1, 'expired sessions': 5, 'expired idempotency keys': 3,
+        })
+        self.assertEqual(set(Cart.objects.values_list('pk', flat=True)), {self.edited.pk, self.fresh.pk})
+        self.assertEqual(dict(Order.objects.values_list('pk', 'payment_status')), {
+            self.stale.pk: 'CANCELLED', self.waiting.pk: 'PENDING', self.paid.pk: 'PAID',
+        })
+        self.assertEqual(Order.objects.get(pk=self.stale.pk).updated_at, self.now)
+        self.assertEqual(Session.objects.count(), 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+        # At most two rows per transaction
+        self.assertEqual(len(self.deletes(queries, 'django_session')), 3)
+        self.assertEqual(len(self.deletes(queries, 'main_idempotencykey')), 2)
+
+        self.assertEqual(set(cleanup.run_cleanup(now=self.now).values()), {0})
+
+    def test_dry_run_changes_nothing(self):
+        out = io.StringIO()
+        with mock.patch('main.cleanup.timezone.now', return_value=self.now), \
+                CaptureQueriesContext(connection) as queries:
+            call_command('cleanup', '--dry-run', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            'abandoned carts: 1 would be cleaned up',
+            'stale pending orders: 1 would be cleaned up',
+            'expired sessions: 5 would be cleaned up',
+            'expired idempotency keys: 3 would be cleaned up',
+        ])
+        self.assertFalse([q for q in queries if not q['sql'].startswith('SELECT')])
+        self.assertEqual(Cart.objects.count(), 3)
+        self.assertEqual(Order.objects.get(pk=self.stale.pk).payment_status, 'PENDING')
+        self.assertEqual((Session.objects.count(), IdempotencyKey.objects.count()), (7, 4))
@@ -1,27 +1,42 @@
+import hmac
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from .models import Restaurant, Dish, Cuisine, Cart, CartItem, Order, OrderItem, Review
+from django.db import transaction
+from django.db.models import Count
+from .models import Restaurant, Dish, Cuisine, Cart, CartItem, Order, OrderItem, Review, LeaderboardEntry
 from .forms import RestaurantForm, DishForm
 from .decorators import staff_required, owner_or_superuser_required
+from .exports import ExportError, parse_filters, stream_export
+from .catalog import SORT_CHOICES, catalog_price_value, catalog_querystring, parse_catalog_filters, search_catalog
+from .context_processors import invalidate_user_summary
+from .cuisines import resolve_cuisines
+from .leaderboards import leaderboard_restaurants
+from .order_events import order_status_events
+from .profiling import clear_samples, n_plus_one_summary, route_summary, samples
+from . import metrics, payments
+from .idempotency import idempotent
+from .purge import soft_delete_restaurant
+from .query_budget import query_budget
+from .ratelimit import rate_limit
+from .reviews import decode_cursor, rating_summary, review_page
+from .templating import render_hot
 from django.contrib.auth.decorators import user_passes_test
 import json
-
-# Stripe import - handle case where package is not installed
-try:
-    import stripe
-except ImportError:
-    stripe = None
+import uuid
 
 
+@query_budget(5)
 def home_view(request):
     return render(request, 'home.html')
 
 
+@query_budget(7)
 @login_required
 @staff_required
 def staff_dashboard(request):
@@ -30,13 +45,33 @@ def staff_dashboard(request):
         restaurants = Restaurant.objects.all()
     else:
         restaurants = Restaurant.objects.filter(owner=request.user)
+    restaurants = restaurants.prefetch_related('cuisines')
     
     context = {
         'restaurants': restaurants,
     }
-    return render(request, 'main/staff_dashboard.html', context)
+    return render_hot(request, 'main/staff_dashboard.html', context)
+
+
+@query_budget(5)
+@login_required
+@staff_required
+def perf_dashboard(request):
+    """Slowest routes and worst repeated queries from the profiling samples"""
+    if request.method == 'POST':
+        clear_samples()
+        messages.success(request, 'Profiling samples cleared.')
+        return redirect('main:perf_dashboard')
+
+    context = {
+        'routes': route_summary(),
+        'offenders': n_plus_one_summary(),
+        'sample_count': len(samples()),
+    }
+    return render(request, 'main/perf_dashboard.html', context)
 
 
+@query_budget(13)
 @login_required
 def restaurant_detail(request, restaurant_id):
     """Restaurant detail page showing restaurant info and dishes"""
@@ -50,10 +85,12 @@ def restaurant_detail(request, restaurant_id):
         'restaurant': restaurant,
         'dishes': dishes,
         'can_edit': can_edit,
+        'has_reviewed': restaurant.has_user_reviewed(request.user),
     }
-    return render(request, 'main/restaurant_detail.html', context)
+    return render_hot(request, 'main/restaurant_detail.html', context)
 
 
+@query_budget(18)
 @login_required
 @staff_required
 def create_restaurant(request):
@@ -69,16 +106,9 @@ def create_restaurant(request):
             form.save_m2m()
 
             # handle new cuisines (comma-separated)
-            new_cuisines = form.cleaned_data.get('new_cuisines')
-            if new_cuisines:
-                names = [c.strip() for c in new_cuisines.split(',') if c.strip()]
-                for name in names:
-                    normalized = name.capitalize()
-                    cuisine_obj, created = Cuisine.objects.get_or_create(
-                        name__iexact=normalized,
-                        defaults={'name': normalized}
-                    )
-                    restaurant.cuisines.add(cuisine_obj)
+            cuisine_ids = resolve_cuisines(form.cleaned_data.get('new_cuisines'))
+            if cuisine_ids:
+                restaurant.cuisines.add(*cuisine_ids)
 
             messages.success(request, f'Restaurant "{restaurant.name}" created successfully!')
             return redirect('main:restaurant_detail', restaurant_id=restaurant.id)
@@ -93,6 +123,7 @@ def create_restaurant(request):
 
 
 
+@query_budget(16)
 @login_required
 @owner_or_superuser_required
 def update_restaurant(request, restaurant_id):
@@ -107,12 +138,9 @@ def update_restaurant(request, restaurant_id):
             form.save_m2m()  # save selected existing cuisines
 
             # Handle new cuisines
-            new_cuisines_str = form.cleaned_data.get('new_cuisines', '')
-            if new_cuisines_str:
-                new_cuisine_names = [name.strip() for name in new_cuisines_str.split(',') if name.strip()]
-                for cname in new_cuisine_names:
-                    cuisine_obj, created = Cuisine.objects.get_or_create(name=cname)
-                    restaurant.cuisines.add(cuisine_obj)
+            cuisine_ids = resolve_cuisines(form.cleaned_data.get('new_cuisines'))
+            if cuisine_ids:
+                restaurant.cuisines.add(*cuisine_ids)
 
             messages.success(request, f'Restaurant "{restaurant.name}" updated successfully!')
             return redirect('main:restaurant_detail', restaurant_id=restaurant.id)
@@ -127,6 +155,7 @@ def update_restaurant(request, restaurant_id):
 
 
 
+@query_budget(16)
 @login_required
 @owner_or_superuser_required
 def delete_restaurant(request, restaurant_id):
@@ -135,7 +164,8 @@ def delete_restaurant(request, restaurant_id):
     
     if request.method == 'POST':
         restaurant_name = restaurant.name
-        restaurant.delete()
+        # Hidden at once; dishes, reviews and cart items are purged in the background
+        soft_delete_restaurant(restaurant)
         messages.success(request, f'Restaurant "{restaurant_name}" deleted successfully!')
         return redirect('main:staff_dashboard')
     
@@ -145,6 +175,7 @@ def delete_restaurant(request, restaurant_id):
     return render(request, 'main/restaurant_confirm_delete.html', context)
 
 
+@query_budget(8)
 @login_required
 @owner_or_superuser_required
 def add_dish(request, restaurant_id):
@@ -170,6 +201,7 @@ def add_dish(request, restaurant_id):
     return render(request, 'main/dish_form.html', context)
 
 
+@query_budget(10)
 @login_required
 @owner_or_superuser_required
 def update_dish(request, dish_id):
@@ -194,6 +226,7 @@ def update_dish(request, dish_id):
     return render(request, 'main/dish_form.html', context)
 
 
+@query_budget(14)
 @login_required
 @owner_or_superuser_required
 def delete_dish(request, dish_id):
@@ -214,6 +247,7 @@ def delete_dish(request, dish_id):
     return render(request, 'main/dish_confirm_delete.html', context)
 
 
+@query_budget(8)
 def dish_detail(request, dish_id):
     """Dish detail page showing dish info and other dishes from same restaurant"""
     dish = get_object_or_404(Dish, pk=dish_id)
@@ -224,34 +258,85 @@ def dish_detail(request, dish_id):
     context = {
         'dish': dish,
         'other_dishes': other_dishes,
+        'idempotency_key': uuid.uuid4().hex,
     }
     return render(request, 'main/dish_detail.html', context)
 
+@query_budget(12)
 def explore(request):
     # Featured restaurants and dishes (use BooleanField 'is_featured')
     featured_restaurants = Restaurant.objects.filter(featured=True)[:10]
     featured_dishes = Dish.objects.filter(featured=True)[:10]
     
-    # All dishes from all restaurants
-    all_dishes = Dish.objects.all()
+    # Filtered, sorted page of all dishes with facet counts
+    filters = parse_catalog_filters(request.GET)
+    catalog = search_catalog(filters)
 
-    context = {
+    # Computed by `manage.py recompute_leaderboards`
+    boards = leaderboard_restaurants()
+
+    context = explore_context(featured_restaurants, featured_dishes, filters, catalog, boards)
+    return render_hot(request, 'main/explore.html', context)
+
+
+def explore_context(featured_restaurants, featured_dishes, filters, catalog, boards):
+    """Explore page context from its loaded parts (shared with main.async_views)"""
+    pagination = {}
+    if catalog['page'] > 1:
+        pagination['previous'] = '?' + catalog_querystring(filters, page=catalog['page'] - 1)
+    if catalog['page'] < catalog['pages']:
+        pagination['next'] = '?' + catalog_querystring(filters, page=catalog['page'] + 1)
+    return {
         'featured_restaurants': featured_restaurants,
         'featured_dishes': featured_dishes,
-        'all_dishes': all_dishes,
+        'all_dishes': catalog['dishes'],
+        'catalog': catalog,
+        'filters': filters,
+        'price_value': catalog_price_value(filters),
+        'sort_choices': SORT_CHOICES,
+        'pagination': pagination,
+        'leaderboards': [
+            {'title': title, 'restaurants': boards[board]}
+            for board, title in LeaderboardEntry.BOARD_CHOICES
+            if boards[board]
+        ],
     }
-    return render(request, 'main/explore.html', context)
 
 def is_admin(user):
     return user.is_superuser
 
+@query_budget(7)
 @user_passes_test(is_admin)
 def all_restaurants(request):
-    restaurants = Restaurant.objects.all()
-    return render(request, 'main/admin_restaurants.html', {'restaurants': restaurants})
+    restaurants = Restaurant.objects.prefetch_related('cuisines')
+    return render_hot(request, 'main/admin_restaurants.html', {'restaurants': restaurants})
+
+
+@query_budget(5)
+@login_required
+@staff_required
+def export_orders(request):
+    """Stream orders as CSV or JSON lines (owners see their own restaurants only)"""
+    try:
+        filters = parse_filters(request.GET)
+        filename, content_type, rows = stream_export(
+            request.user,
+            filters,
+            export_format=request.GET.get('format', 'csv'),
+            level=request.GET.get('level', 'items'),
+        )
+    except ExportError as e:
+        return HttpResponse(str(e), status=400)
 
+    response = StreamingHttpResponse(rows, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
+
+@query_budget(10)
 @login_required
+@rate_limit('30/m', key='user', burst=10)
+@idempotent
 def add_to_cart(request, dish_id):
     """Add a dish to cart or increase quantity if already exists"""
     dish = get_object_or_404(Dish, pk=dish_id)
@@ -266,6 +351,8 @@ def add_to_cart(request, dish_id):
         defaults={'quantity': 1}
     )
     
+    metrics.inc('cart_operations_total', op='add')
+
     if not item_created:
         # Item already exists, increase quantity
         quantity = int(request.POST.get('quantity', 1))
@@ -287,6 +374,7 @@ def add_to_cart(request, dish_id):
     return redirect('main:cart_page')
 
 
+@query_budget(8)
 @login_required
 def cart_page(request):
     """Display cart page with all items"""
@@ -298,16 +386,21 @@ def cart_page(request):
         'cart': cart,
         'cart_items': cart_items,
         'total': total,
+        # Reused if the checkout link is clicked twice
+        'idempotency_key': uuid.uuid4().hex,
     }
     return render(request, 'main/cart.html', context)
 
 
+@query_budget(10)
 @login_required
+@idempotent
 def increment_item(request, item_id):
     """Increment quantity of a cart item"""
     cart_item = get_object_or_404(CartItem, pk=item_id, cart__user=request.user)
     cart_item.quantity += 1
     cart_item.save()
+    metrics.inc('cart_operations_total', op='increment')
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.GET.get('ajax'):
         return JsonResponse({
@@ -321,12 +414,15 @@ def increment_item(request, item_id):
     return redirect('main:cart_page')
 
 
+@query_budget(10)
 @login_required
+@idempotent
 def decrement_item(request, item_id):
     """Decrement quantity of a cart item, remove if quantity becomes 0"""
     cart_item = get_object_or_404(CartItem, pk=item_id, cart__user=request.user)
     cart = cart_item.cart
     dish_name = cart_item.dish.name
+    metrics.inc('cart_operations_total', op='decrement')
     
     if cart_item.quantity > 1:
         cart_item.quantity -= 1
@@ -335,6 +431,7 @@ def decrement_item(request, item_id):
         removed = False
     else:
         cart_item.delete()
+        invalidate_user_summary(request.user.id)
         message = f'Removed {dish_name} from cart'
         removed = True
     
@@ -353,27 +450,24 @@ def decrement_item(request, item_id):
     return redirect('main:cart_page')
 
 
-# Stripe Configuration
-if stripe is not None:
-    stripe.api_key = getattr(settings, 'STRIPE_SECRET_KEY', None)
-
-
+@query_budget(11)
 @login_required
+@idempotent
 def create_checkout_session(request):
     """Create Stripe Checkout Session and Order"""
-    if stripe is None:
+    if not payments.is_installed():
         messages.error(request, 'Stripe is not installed. Please install stripe package.')
         return redirect('main:cart_page')
     
     cart, created = Cart.objects.get_or_create(user=request.user)
-    cart_items = cart.items.all().select_related('dish')
+    cart_items = cart.items.all().select_related('dish', 'dish__restaurant')
     
     if not cart_items.exists():
         messages.error(request, 'Your cart is empty!')
         return redirect('main:cart_page')
     
     # Check if Stripe is configured
-    if not stripe.api_key:
+    if not payments.is_configured():
         messages.error(request, 'Payment processing is not configured. Please contact support.')
         return redirect('main:cart_page')
     
@@ -416,7 +510,7 @@ def create_checkout_session(request):
         success_url = request.build_absolute_uri('/checkout/success/') + '?session_id={CHECKOUT_SESSION_ID}'
         cancel_url = request.build_absolute_uri('/checkout/cancel/')
         
-        checkout_session = stripe.checkout.Session.create(
+        checkout_session = payments.create_checkout_session(
             payment_method_types=['card'],
             line_items=line_items,
             mode='payment',
@@ -432,17 +526,20 @@ def create_checkout_session(request):
         # Update order with Stripe session ID
         order.stripe_session_id = checkout_session.id
         order.save()
+        metrics.inc('checkout_sessions_total', outcome='created')
         
         # Redirect to Stripe Checkout
         return redirect(checkout_session.url, code=303)
         
-    except stripe.error.StripeError as e:
+    except payments.PaymentError as e:
+        metrics.inc('checkout_sessions_total', outcome='failed')
         messages.error(request, f'Payment error: {str(e)}')
         # Delete the order if it was created
         if 'order' in locals():
             order.delete()
         return redirect('main:cart_page')
     except Exception as e:
+        metrics.inc('checkout_sessions_total', outcome='failed')
         messages.error(request, f'An error occurred: {str(e)}')
         # Delete the order if it was created
         if 'order' in locals():
@@ -450,11 +547,12 @@ def create_checkout_session(request):
         return redirect('main:cart_page')
 
 
+@query_budget(10)
 @csrf_exempt
 @require_POST
 def stripe_webhook(request):
     """Handle Stripe webhook events"""
-    if stripe is None:
+    if not payments.is_installed():
         return HttpResponse('Stripe is not installed', status=500)
     
     payload = request.body
@@ -465,14 +563,16 @@ def stripe_webhook(request):
         return HttpResponse('Webhook secret not configured', status=400)
     
     try:
-        event = stripe.Webhook.construct_event(
+        event = payments.construct_event(
             payload, sig_header, webhook_secret
         )
     except ValueError as e:
         # Invalid payload
+        metrics.inc('stripe_webhook_events_total', type='unknown', outcome='invalid_payload')
         return HttpResponse(f'Invalid payload: {str(e)}', status=400)
-    except stripe.error.SignatureVerificationError as e:
+    except payments.InvalidSignature as e:
         # Invalid signature
+        metrics.inc('stripe_webhook_events_total', type='unknown', outcome='invalid_signature')
         return HttpResponse(f'Invalid signature: {str(e)}', status=400)
     
     # Handle the event
@@ -481,35 +581,48 @@ def stripe_webhook(request):
         
         # Get the order by stripe_session_id
         try:
-            order = Order.objects.get(stripe_session_id=session['id'])
-            
-            # Update payment status to PAID
-            order.payment_status = 'PAID'
-            order.save()
-            
-            # Move CartItems to OrderItems
-            cart = order.user.cart
-            cart_items = cart.items.all()
-            
-            for cart_item in cart_items:
-                OrderItem.objects.create(
-                    order=order,
-                    dish=cart_item.dish,
-                    quantity=cart_item.quantity,
-                    price=cart_item.dish.price  # Store price at time of order
-                )
-            
-            # Clear the cart
-            cart_items.delete()
+            # One transaction: the PAID event (sent on commit by main.signals)
+            # must not reach the success page before the items exist
+            with transaction.atomic():
+                order = Order.objects.get(stripe_session_id=session['id'])
+                
+                # Update payment status to PAID
+                order.payment_status = 'PAID'
+                order.save()
+                
+                # Move CartItems to OrderItems
+                cart = order.user.cart
+                cart_items = cart.items.all().select_related('dish')
+                
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        dish=cart_item.dish,
+                        dish_name=cart_item.dish.name,
+                        quantity=cart_item.quantity,
+                        price=cart_item.dish.price  # Store price at time of order
+                    )
+                    for cart_item in cart_items
+                ])
+                
+                # Clear the cart
+                cart_items.delete()
+                invalidate_user_summary(order.user_id)
             
         except Order.DoesNotExist:
+            metrics.inc('stripe_webhook_events_total', type=event['type'], outcome='order_not_found')
             return HttpResponse(f'Order not found for session {session["id"]}', status=404)
         except Exception as e:
+            metrics.inc('stripe_webhook_events_total', type=event['type'], outcome='error')
             return HttpResponse(f'Error processing order: {str(e)}', status=500)
+        metrics.inc('stripe_webhook_events_total', type=event['type'], outcome='processed')
+    else:
+        metrics.inc('stripe_webhook_events_total', type=event['type'], outcome='ignored')
     
     return HttpResponse(status=200)
 
 
+@query_budget(8)
 @login_required
 def checkout_success(request):
     """Thank you page after successful payment"""
@@ -527,7 +640,7 @@ def checkout_success(request):
         # If order is PAID, check if user should be redirected to review page
         if order.payment_status == 'PAID':
             # Get the restaurant from the order items (use first restaurant if multiple)
-            restaurants = set(item.dish.restaurant for item in order_items)
+            restaurants = set(item.dish.restaurant for item in order_items if item.dish)
             if restaurants:
                 restaurant = list(restaurants)[0]  # Get first restaurant
                 # Check if user hasn't reviewed this restaurant yet
@@ -538,6 +651,7 @@ def checkout_success(request):
         context = {
             'order': order,
             'order_items': order_items,
+            'order_events_stream': getattr(settings, 'ORDER_EVENTS_STREAM', False),
         }
         return render(request, 'main/success.html', context)
     except Order.DoesNotExist:
@@ -545,12 +659,37 @@ def checkout_success(request):
         return redirect('main:cart_page')
 
 
+@login_required
+async def order_status_stream(request):
+    """Server-Sent Events stream of the user's order status changes (ASGI only)"""
+    if not getattr(settings, 'ORDER_EVENTS_STREAM', False):
+        # Under WSGI a stream holds a worker thread for minutes; 204 stops EventSource reconnecting
+        return HttpResponse(status=204)
+    user = await request.auser()
+    order_id = request.GET.get('order')
+    try:
+        order_id = int(order_id) if order_id else None
+    except ValueError:
+        return HttpResponse('Invalid order id', status=400)
+
+    response = StreamingHttpResponse(
+        order_status_events(user.id, order_id),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@query_budget(5)
 @login_required
 def checkout_cancel(request):
     """Cancel page when user cancels payment"""
     return render(request, 'main/cancel.html')
 
 
+@query_budget(7)
 @login_required
 def create_review(request, restaurant_id):
     restaurant = get_object_or_404(Restaurant, pk=restaurant_id)
@@ -591,22 +730,49 @@ def create_review(request, restaurant_id):
     return render(request, 'main/review_form.html', context)
 
 
+@query_budget(8)
 def restaurant_reviews(request, restaurant_id):
+    """Newest-first reviews, keyset paginated, with the rating summary"""
     restaurant = get_object_or_404(Restaurant, pk=restaurant_id)
-    reviews = restaurant.reviews.all().select_related('user').order_by('-created_at')
-    
-    average_rating = restaurant.get_average_rating()
-    reviews_count = restaurant.get_reviews_count()
-    user_has_reviewed = restaurant.has_user_reviewed(request.user) if request.user.is_authenticated else False
-    
-    context = {
+    cursor = decode_cursor(request.GET.get('after'))
+    reviews, next_cursor = review_page(restaurant, cursor)
+    summary = rating_summary(restaurant, request.user)
+    context = reviews_context(restaurant, cursor, reviews, next_cursor, summary)
+    return render(request, 'main/restaurant_reviews.html', context)
+
+
+def reviews_context(restaurant, cursor, reviews, next_cursor, summary):
+    return {
         'restaurant': restaurant,
         'reviews': reviews,
-        'average_rating': average_rating,
-        'reviews_count': reviews_count,
-        'user_has_reviewed': user_has_reviewed,
+        'next_cursor': next_cursor,
+        'is_first_page': cursor is None,
+        'average_rating': summary['average'],
+        'reviews_count': summary['total'],
+        'histogram': summary['histogram'],
+        'user_has_reviewed': summary['own_review_id'] is not None,
+        'own_rating': summary['own_rating'],
     }
-    return render(request, 'main/restaurant_reviews.html', context)
 
+@query_budget(3)
+def metrics_view(request):
+    """Prometheus text endpoint; needs METRICS_TOKEN as a bearer token, or a staff login without one"""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            response = HttpResponse('Unauthorized', status=401)
+            response['WWW-Authenticate'] = 'Bearer'
+            return response
+    elif not request.user.is_staff:
+        return HttpResponse('Forbidden', status=403)
+
+    gauges = {
+        ('orders', (('payment_status', row['payment_status']),)): row['total']
+        for row in Order.objects.values('payment_status').annotate(total=Count('id')).order_by()
+    }
+    return HttpResponse(metrics.render(gauges), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@query_budget(5)
 def about_us(request):
     return render(request, 'main/about_us.html')
\ No newline at end of file
@@ -0,0 +1,102 @@
+"""
+Getting a fresh worker ready before it takes traffic.
+
+The first request to hit a new process otherwise pays for compiling every
+template it touches, building the URL resolver, opening the database
+connection and filling the catalog caches. ``warm_up()`` does all of that up
+front. Everything it fills lives in the process that calls it, so the way to
+warm workers is ``WARMUP_ON_START=1``: wsgi.py/asgi.py then call it as each
+worker loads, before the server hands it requests.
+
+``manage.py warmup`` runs the same steps in a process of its own. It warms
+nothing that serves traffic; use it as a readiness check in a deploy, since
+it fails when a template does not compile, a URL does not resolve or the
+database is unreachable.
+"""
+import os
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.http import QueryDict
+from django.template import engines
+from django.urls import get_resolver
+
+from . import payments
+from .catalog import SORTS, parse_catalog_filters, search_catalog
+from .cuisines import cuisine_choices
+from .leaderboards import leaderboard_restaurants
+
+
+TEMPLATE_SUFFIXES = ('.html', '.txt')
+
+
+def _template_names(engine):
+    """Relative names of the project's templates for ``engine``"""
+    base = str(settings.BASE_DIR)
+    for directory in engine.template_dirs:
+        directory = str(directory)
+        # Skip templates of installed packages (admin etc.); they load on demand
+        if not directory.startswith(base) or not os.path.isdir(directory):
+            continue
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.endswith(TEMPLATE_SUFFIXES):
+                    yield os.path.relpath(os.path.join(root, name), directory).replace(os.sep, '/')
+
+
+def compile_templates():
+    count = 0
+    for engine in engines.all():
+        for name in _template_names(engine):
+            engine.get_template(name)
+            count += 1
+    return count
+
+
+def resolve_urls():
+    resolver = get_resolver()
+    # Building the reverse map imports every view module and compiles every pattern
+    resolver.reverse_dict
+    return len(resolver.url_patterns)
+
+
+def connect_database():
+    connection.ensure_connection()
+    return connection.vendor
+
+
+def prime_catalog():
+    for sort in SORTS:
+        params = QueryDict(mutable=True)
+        params['sort'] = sort
+        search_catalog(parse_catalog_filters(params))
+    cuisine_choices()
+    leaderboard_restaurants()
+    return len(SORTS)
+
+
+def load_payments():
+    if not (payments.is_installed() and payments.is_configured()):
+        return 'skipped'
+    payments.sdk()
+    return 'loaded'
+
+
+STEPS = (
+    ('templates', compile_templates),
+    ('urls', resolve_urls),
+    ('database', connect_database),
+    ('catalog', prime_catalog),
+    ('payments', load_payments),
+)
+
+
+def warm_up():
+    """Run every warm-up step; returns [(step, result, seconds), ...]"""
+    timings = []
+    for name, step in STEPS:
+        started = time.perf_counter()
+        result = step()
+        timings.append((name, result, time.perf_counter() - started))
+    return timings
@@ -3,6 +3,37 @@ ASGI config for restaurant_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Run it with an ASGI server (e.g. ``uvicorn restaurant_project.asgi:application``)
+and set ``ORDER_EVENTS_STREAM=1`` to serve the order status stream at
+/orders/events/: each open Server-Sent Events connection is then a coroutine
+instead of a blocked WSGI worker. The stream needs ASGI; with it off (the
+default, right for WSGI) the checkout success page reloads itself instead.
+
+ASGI deployment profile
+-----------------------
+To serve the catalog pages fully asynchronously, start the workers with::
+
+    ASYNC_VIEWS=1 ORDER_EVENTS_STREAM=1 PROFILING_ENABLED=0 \
+        gunicorn restaurant_project.asgi:application -k uvicorn.workers.UvicornWorker -w 2
+
+- ``ASYNC_VIEWS=1`` routes explore, restaurant/dish detail and reviews to
+  main.async_views.
+- ``ORDER_EVENTS_STREAM=1`` turns on the order status stream.
+- ``PROFILING_ENABLED=0`` drops ProfilingMiddleware, the only middleware left
+  that is sync-only. Any sync-only middleware makes Django run each request
+  in a thread again.
+- Keep ``CONN_MAX_AGE`` at 0 (the default), as Django advises under ASGI,
+  and pool connections in the database layer instead (e.g. pgbouncer).
+- Two to four workers per host are plenty; concurrency comes from the event
+  loop, not from more processes.
+
+Compare it with WSGI under slow clients, one worker each::
+
+    gunicorn restaurant_project.wsgi -w 1 -b 127.0.0.1:8000 &
+    ASYNC_VIEWS=1 PROFILING_ENABLED=0 uvicorn restaurant_project.asgi:application --port 8001 &
+    python manage.py slowclients --target wsgi=http://127.0.0.1:8000 \
+        --target asgi=http://127.0.0.1:8001 --connections 200 --send-time 2
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -14,3 +45,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'restaurant_project.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings
+
+if settings.WARMUP_ON_START:
+    from main.warmup import warm_up
+    warm_up()
@@ -16,6 +16,7 @@ from pathlib import Path
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 from dotenv import load_dotenv
+import importlib.util
 import os
 
 load_dotenv()
@@ -44,14 +45,21 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'main',
     'accounts',
+    'api',
+    'tasks',
+    'loadtest',
 ]
 
 MIDDLEWARE = [
+    'main.prerender.PrerenderMiddleware',
+    'main.profiling.ProfilingMiddleware',
+    'main.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main.ratelimit.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -68,13 +76,45 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'main.context_processors.navbar',
             ],
         },
     },
 ]
 
+# Optional Jinja2 engine for the card-heavy listing pages (main.templating);
+# find_spec checks for the package without importing it
+if importlib.util.find_spec("jinja2") is not None:
+    TEMPLATES.append({
+        'BACKEND': 'django.template.backends.jinja2.Jinja2',
+        'DIRS': [BASE_DIR / 'jinja2'],
+        'APP_DIRS': False,
+        'OPTIONS': {
+            'environment': 'main.templating.environment',
+            'context_processors': TEMPLATES[0]['OPTIONS']['context_processors'],
+        },
+    })
+
+# 'django' or 'jinja2'; falls back to 'django' when jinja2 is not installed
+HOT_TEMPLATE_ENGINE = os.getenv("HOT_TEMPLATE_ENGINE", "django")
+
+# Serve explore, restaurant/dish detail and reviews from main.async_views;
+# part of the ASGI deployment profile (restaurant_project/asgi.py)
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS") == "1"
+
+# Push order status to the checkout success page over Server-Sent Events
+# (main.order_events). Needs the ASGI server: under WSGI each open stream
+# holds a worker thread for up to ORDER_EVENTS_MAX_AGE seconds, so the page
+# falls back to reloading itself while this is off
+ORDER_EVENTS_STREAM = os.getenv("ORDER_EVENTS_STREAM") == "1"
+ORDER_EVENTS_POLL_INTERVAL = 15
+ORDER_EVENTS_MAX_AGE = 300
+
 WSGI_APPLICATION = 'restaurant_project.wsgi.application'
 
+# Warm each worker (main.warmup) as wsgi.py/asgi.py load, before it takes requests
+WARMUP_ON_START = os.getenv("WARMUP_ON_START") == "1"
+
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
@@ -130,6 +170,98 @@ STATICFILES_DIRS = [
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads are stored once per content hash (main.storage)
+STORAGES = {
+    'default': {'BACKEND': 'main.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# Media is served by main.media.serve_media. MEDIA_ACCEL = 'x-accel-redirect'
+# (nginx, internal location at MEDIA_ACCEL_PREFIX) or 'x-sendfile' (Apache)
+# lets the front server send the bytes instead of a Python worker
+MEDIA_SERVE = True
+MEDIA_ACCEL = os.getenv("MEDIA_ACCEL")
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+MEDIA_CACHE_MAX_AGE = 30 * 24 * 3600
+
+# Per-request profiling (main.profiling.ProfilingMiddleware); on by default
+# only with DEBUG, where every request is measured
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "1" if DEBUG else "0") == "1"
+PROFILING_SAMPLE_RATE = 1.0 if DEBUG else 0.05
+PROFILING_BUFFER_SIZE = 500
+
+# Query budgets (main.query_budget): 'raise', 'log' or 'off'
+QUERY_BUDGET_MODE = 'log' if DEBUG else 'off'
+QUERY_BUDGET_REPEAT_THRESHOLD = 3
+
+# Prometheus metrics (main.metrics); /metrics needs METRICS_TOKEN as a bearer
+# token, or a logged-in is_staff user when no token is set. Set METRICS_DIR
+# to a directory shared by all worker processes when running more than one
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Seconds explore results and facet counts are cached per filter key
+# (main.catalog); catalog edits in this process invalidate them at once
+CATALOG_CACHE_TTL = 60
+
+# Seconds the navbar's role and cart count are cached per user
+# (main.context_processors); cart and profile writes drop them at once, but
+# only in the processes sharing USER_SUMMARY_CACHE. With the default
+# local-memory cache that is the writing worker alone, so set it to a shared
+# cache alias when running more than one
+USER_SUMMARY_CACHE = os.getenv("USER_SUMMARY_CACHE", "default")
+USER_SUMMARY_CACHE_TTL = 300
+
+# Computed leaderboards (main.leaderboards); refreshed by
+# `manage.py recompute_leaderboards`
+LEADERBOARD_SIZE = 10
+LEADERBOARD_TRENDING_WINDOW_DAYS = 14
+LEADERBOARD_TRENDING_HALF_LIFE_HOURS = 48
+
+# Seconds a stored response is replayed for a repeated Idempotency-Key
+# (main.idempotency) on the cart and checkout endpoints
+IDEMPOTENCY_KEY_TTL = 3600
+
+# Token-bucket rate limits (main.ratelimit). Views declare their own with
+# @rate_limit; RATE_LIMITS adds limits by URL name through the middleware.
+# Buckets are per process unless RATE_LIMIT_CACHE names a shared cache alias.
+# Turn it off for `manage.py loadtest`, whose virtual users share one IP.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_CACHE = os.getenv("RATE_LIMIT_CACHE")
+RATE_LIMIT_IP_HEADER = os.getenv("RATE_LIMIT_IP_HEADER")
+RATE_LIMIT_MAX_BUCKETS = 100_000
+RATE_LIMITS = {
+    # Per sender, so junk posted from one address cannot use up the budget of
+    # Stripe's delivery IPs; Stripe retries on 429 in any case
+    'main:stripe_webhook': {'rate': '50/s', 'burst': 100, 'key': 'ip'},
+}
+
+# Static copies of the anonymous home/about/explore pages (main.prerender),
+# written by `manage.py prerender_pages` and rebuilt by the task worker
+# PRERENDER_DELAY seconds after a catalog change
+PRERENDER_ENABLED = True
+PRERENDER_ROOT = BASE_DIR / 'prerendered'
+PRERENDER_DELAY = 5
+
+# Points PRERENDER_ROOT at a temporary directory while tests run
+TEST_RUNNER = 'restaurant_project.test_runner.TestRunner'
+
+# Rows per transaction when a deleted restaurant is purged (main.purge)
+PURGE_BATCH_SIZE = 500
+
+# Finished orders older than this move to ArchivedOrder
+# (`manage.py archive_orders`, main.archive)
+ORDER_ARCHIVE_AFTER_DAYS = 180
+ORDER_ARCHIVE_STATUSES = ('PAID', 'FAILED', 'CANCELLED')
+ORDER_ARCHIVE_BATCH_SIZE = 500
+
+# Retention for `manage.py cleanup` (main.cleanup)
+CART_RETENTION_DAYS = 30
+PENDING_ORDER_TIMEOUT_HOURS = 24
+CLEANUP_BATCH_SIZE = 1000
+
 STRIPE_PUBLIC_KEY = os.getenv("STRIPE_PUBLIC_KEY")
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+# Only set this to use a Stripe stand-in (see `manage.py fake_stripe`)
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE")
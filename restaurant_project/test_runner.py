@@ -0,0 +1,20 @@
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """Keeps files the suite writes (pre-rendered pages) out of the project tree"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.scratch = tempfile.TemporaryDirectory(prefix='mealmate-tests-')
+        self.prerender_root = settings.PRERENDER_ROOT
+        settings.PRERENDER_ROOT = Path(self.scratch.name) / 'prerendered'
+
+    def teardown_test_environment(self, **kwargs):
+        settings.PRERENDER_ROOT = self.prerender_root
+        self.scratch.cleanup()
+        super().teardown_test_environment(**kwargs)
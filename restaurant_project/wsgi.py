@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'restaurant_project.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings
+
+if settings.WARMUP_ON_START:
+    from main.warmup import warm_up
+    warm_up()
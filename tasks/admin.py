@@ -0,0 +1,16 @@
+from django.contrib import admin
+from .models import Task
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'priority', 'attempts', 'max_attempts', 'run_at', 'locked_by')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'last_error')
+    readonly_fields = ('created_at', 'updated_at', 'locked_at', 'locked_by', 'last_error')
+    actions = ['requeue']
+
+    @admin.action(description='Requeue selected tasks')
+    def requeue(self, request, queryset):
+        updated = queryset.exclude(status='RUNNING').update(status='QUEUED', attempts=0, last_error='')
+        self.message_user(request, f'{updated} task(s) requeued.')
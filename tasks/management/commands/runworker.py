@@ -0,0 +1,101 @@
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import connections
+
+from tasks.queue import claim, execute, finish, heartbeat, requeue_stale, worker_id
+
+
+# Connections a forked child inherited from the parent. Closing them would
+# close the parent's sockets too (PostgreSQL says goodbye on the wire), so the
+# child forgets them and keeps them referenced so they are never collected.
+_inherited = []
+
+
+def _init_child():
+    django.setup()
+    for conn in connections.all(initialized_only=True):
+        if conn.connection is not None:
+            _inherited.append(conn.connection)
+            conn.connection = None
+    # Let the parent handle Ctrl+C and finish the running tasks
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='Size of the process pool')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is drained')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        worker = worker_id()
+        self.stdout.write(f'Worker {worker} started with {processes} process(es)')
+
+        interval = getattr(settings, 'TASKS_HEARTBEAT_INTERVAL', 30)
+        last_beat = time.monotonic()
+        running = {}
+        pool = self.start_pool(processes)
+        try:
+            while True:
+                requeue_stale()
+                if running and time.monotonic() - last_beat >= interval:
+                    heartbeat([task_obj.id for task_obj in running.values()], worker)
+                    last_beat = time.monotonic()
+
+                free = processes - len(running)
+                if free:
+                    for task_obj in claim(free, worker):
+                        try:
+                            future = pool.submit(execute, task_obj.name, task_obj.args, task_obj.kwargs)
+                        except BrokenProcessPool:
+                            # A child died and took the pool with it; its tasks are recorded as failed below
+                            self.stderr.write('Process pool broke; starting a new one.')
+                            pool.shutdown(wait=False)
+                            pool = self.start_pool(processes)
+                            future = pool.submit(execute, task_obj.name, task_obj.args, task_obj.kwargs)
+                        running[future] = task_obj
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+
+                done, _ = wait(running, timeout=options['sleep'], return_when=FIRST_COMPLETED)
+                self.record(running, done)
+        except KeyboardInterrupt:
+            # Wait for the tasks in flight
+            pool.shutdown(wait=True)
+            self.record(running, list(running))
+            self.stdout.write('Worker stopped.')
+        else:
+            pool.shutdown(wait=True)
+
+    def start_pool(self, processes):
+        # Nothing open to inherit; the no-op task forks the children now rather
+        # than on the first real submit, when claim() has opened a connection
+        connections.close_all()
+        pool = ProcessPoolExecutor(max_workers=processes, initializer=_init_child)
+        pool.submit(int).result()
+        return pool
+
+    def record(self, running, done):
+        for future in done:
+            task_obj = running.pop(future)
+            try:
+                error = future.result()
+            except Exception as e:
+                # The child process itself died
+                error = f'Worker process failed: {e!r}'
+            finish(task_obj, error)
+            status = self.style.SUCCESS('done') if error is None else self.style.ERROR(task_obj.status.lower())
+            self.stdout.write(f'{task_obj.name} #{task_obj.id}: {status}')
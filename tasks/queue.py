@@ -0,0 +1,148 @@
+"""
+Database backed task queue.
+
+Functions decorated with ``@task`` can be queued with ``enqueue()`` from a
+request and are executed later by ``manage.py runworker``.
+
+A worker refreshes ``locked_at`` on its running tasks every
+``TASKS_HEARTBEAT_INTERVAL`` seconds. A task whose lock is older than
+``TASKS_LOCK_TIMEOUT`` belongs to a worker that died; it is requeued as a
+failed attempt, or marked FAILED once it has used up ``max_attempts``.
+"""
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+
+_registry = {}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def task(func):
+    """Register a function so workers are allowed to run it"""
+    name = f'{func.__module__}.{func.__qualname__}'
+    _registry[name] = func
+    func.task_name = name
+    return func
+
+
+def enqueue(func, *args, priority=0, delay=None, max_attempts=3, **kwargs):
+    """Queue a call to a registered task; args must be JSON serializable"""
+    name = func if isinstance(func, str) else getattr(func, 'task_name', None)
+    if name is None:
+        raise ValueError(f'{func!r} is not a registered task, decorate it with @task.')
+    run_at = timezone.now() + timedelta(seconds=delay) if delay else timezone.now()
+    return Task.objects.create(
+        name=name,
+        args=list(args),
+        kwargs=kwargs,
+        priority=priority,
+        max_attempts=max_attempts,
+        run_at=run_at,
+    )
+
+
+def resolve(name):
+    if name not in _registry:
+        # Importing the module runs its @task decorators
+        import_string(name)
+    if name not in _registry:
+        raise LookupError(f'{name} is not a registered task.')
+    return _registry[name]
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _due():
+    return Task.objects.filter(status='QUEUED', run_at__lte=timezone.now()).order_by('-priority', 'run_at', 'id')
+
+
+def claim(limit, worker):
+    """
+    Atomically mark up to ``limit`` due tasks as RUNNING for ``worker``.
+
+    Databases with SELECT ... FOR UPDATE SKIP LOCKED (PostgreSQL, MySQL 8,
+    Oracle) let concurrent workers claim disjoint rows without waiting. On
+    SQLite, which has neither, each candidate is claimed with a conditional
+    UPDATE and only kept if this worker's UPDATE changed the row.
+    """
+    now = timezone.now()
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(_due().select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            Task.objects.filter(pk__in=ids).update(status='RUNNING', locked_by=worker, locked_at=now)
+    else:
+        ids = []
+        for pk in _due().values_list('id', flat=True)[:limit]:
+            if Task.objects.filter(pk=pk, status='QUEUED').update(status='RUNNING', locked_by=worker, locked_at=now):
+                ids.append(pk)
+    return list(Task.objects.filter(pk__in=ids))
+
+
+def heartbeat(ids, worker):
+    """Mark ``worker``'s running tasks as still alive"""
+    return Task.objects.filter(pk__in=ids, status='RUNNING', locked_by=worker).update(locked_at=timezone.now())
+
+
+def requeue_stale():
+    """Give tasks held by a worker that died back to the queue; returns how many"""
+    timeout = _setting('TASKS_LOCK_TIMEOUT', 600)
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    stale = Task.objects.filter(status='RUNNING', locked_at__lt=cutoff)
+    # The dead run counts as an attempt, so a task that kills its worker is not retried forever
+    lost = {
+        'attempts': F('attempts') + 1,
+        'last_error': f'Worker stopped sending heartbeats for {timeout} seconds.',
+        'locked_by': '',
+        'locked_at': None,
+        'updated_at': timezone.now(),
+    }
+    stale.filter(attempts__gte=F('max_attempts') - 1).update(status='FAILED', **lost)
+    return stale.update(status='QUEUED', **lost)
+
+
+def execute(name, args, kwargs):
+    """Run a task in the current process; returns None or a traceback string"""
+    try:
+        resolve(name)(*args, **kwargs)
+    except Exception:
+        return traceback.format_exc()
+    return None
+
+
+def backoff(attempts):
+    base = _setting('TASKS_RETRY_BACKOFF', 30)
+    limit = _setting('TASKS_RETRY_BACKOFF_MAX', 3600)
+    return min(base * 2 ** (attempts - 1), limit)
+
+
+def finish(task_obj, error=None):
+    """Record the outcome of a run, scheduling a retry with exponential backoff"""
+    task_obj.attempts += 1
+    task_obj.locked_by = ''
+    task_obj.locked_at = None
+    if error is None:
+        task_obj.status = 'DONE'
+        task_obj.last_error = ''
+    elif task_obj.attempts < task_obj.max_attempts:
+        task_obj.status = 'QUEUED'
+        task_obj.last_error = error
+        task_obj.run_at = timezone.now() + timedelta(seconds=backoff(task_obj.attempts))
+    else:
+        task_obj.status = 'FAILED'
+        task_obj.last_error = error
+    task_obj.save(update_fields=['attempts', 'status', 'last_error', 'run_at', 'locked_by', 'locked_at', 'updated_at'])
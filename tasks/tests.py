@@ -0,0 +1,142 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .management.commands import runworker
+from .models import Task
+from .queue import backoff, claim, enqueue, execute, finish, heartbeat, requeue_stale, task
+
+
+@task
+def add(a, b):
+    return a + b
+
+
+@task
+def explode():
+    raise ValueError('boom')
+
+
+class ClaimTests(TestCase):
+    def setUp(self):
+        self.low = enqueue(add, 1, 2)
+        self.high = enqueue(add, 3, 4, priority=5)
+        self.later = enqueue(add, 5, 6, delay=60)
+
+    def test_claims_due_tasks_by_priority(self):
+        claimed = claim(1, 'worker-a')
+        self.assertEqual([t.pk for t in claimed], [self.high.pk])
+        self.assertEqual((claimed[0].status, claimed[0].locked_by), ('RUNNING', 'worker-a'))
+        self.assertIsNotNone(claimed[0].locked_at)
+
+        self.assertEqual([t.pk for t in claim(5, 'worker-b')], [self.low.pk])
+        # Not due yet, and nothing left to claim
+        self.assertEqual(claim(5, 'worker-c'), [])
+        self.assertEqual(Task.objects.get(pk=self.later.pk).status, 'QUEUED')
+
+    def test_conditional_update_skips_rows_another_worker_took(self):
+        self.assertFalse(connection.features.has_select_for_update_skip_locked)
+        candidates = Task.objects.filter(pk__in=[self.low.pk, self.high.pk]).order_by('id')
+        # Another worker claims one between our SELECT and UPDATE
+        Task.objects.filter(pk=self.low.pk).update(status='RUNNING', locked_by='worker-b')
+        with mock.patch('tasks.queue._due', return_value=candidates):
+            claimed = claim(5, 'worker-a')
+        self.assertEqual([t.pk for t in claimed], [self.high.pk])
+        self.assertEqual(Task.objects.get(pk=self.low.pk).locked_by, 'worker-b')
+
+    def test_skip_locked_path(self):
+        # SQLite ignores select_for_update(), so this runs the same statements PostgreSQL would
+        with mock.patch.object(connection.features, 'has_select_for_update_skip_locked', True):
+            claimed = claim(5, 'worker-a')
+        self.assertEqual([t.pk for t in claimed], [self.high.pk, self.low.pk])
+        self.assertEqual(set(Task.objects.filter(status='RUNNING').values_list('locked_by', flat=True)), {'worker-a'})
+
+
+@override_settings(TASKS_RETRY_BACKOFF=30, TASKS_RETRY_BACKOFF_MAX=100)
+class FinishTests(TestCase):
+    def test_backoff_doubles_up_to_the_cap(self):
+        self.assertEqual([backoff(attempts) for attempts in range(1, 6)], [30, 60, 100, 100, 100])
+
+    def test_failed_run_is_retried_later(self):
+        enqueue(explode)
+        task_obj = claim(1, 'worker-a')[0]
+        error = execute(task_obj.name, task_obj.args, task_obj.kwargs)
+        self.assertIn('ValueError: boom', error)
+        before = timezone.now()
+        finish(task_obj, error)
+
+        task_obj.refresh_from_db()
+        self.assertEqual((task_obj.status, task_obj.attempts, task_obj.locked_by), ('QUEUED', 1, ''))
+        self.assertGreaterEqual(task_obj.run_at, before + timedelta(seconds=30))
+        self.assertIn('boom', task_obj.last_error)
+
+    def test_last_attempt_fails_for_good(self):
+        task_obj = enqueue(explode, max_attempts=2)
+        task_obj.attempts = 1
+        finish(task_obj, 'boom')
+        task_obj.refresh_from_db()
+        self.assertEqual((task_obj.status, task_obj.attempts), ('FAILED', 2))
+
+    def test_success(self):
+        task_obj = enqueue(add, 1, 2)
+        self.assertIsNone(execute(task_obj.name, task_obj.args, task_obj.kwargs))
+        finish(task_obj)
+        task_obj.refresh_from_db()
+        self.assertEqual((task_obj.status, task_obj.attempts, task_obj.last_error), ('DONE', 1, ''))
+
+    def test_only_registered_tasks_are_queued(self):
+        with self.assertRaises(ValueError):
+            enqueue(print)
+
+
+@override_settings(TASKS_LOCK_TIMEOUT=600)
+class StaleTaskTests(TestCase):
+    def running(self, worker='worker-a', age=0, **fields):
+        return Task.objects.create(
+            name=add.task_name, status='RUNNING', locked_by=worker,
+            locked_at=timezone.now() - timedelta(seconds=age), **fields,
+        )
+
+    def test_lost_run_counts_as_an_attempt(self):
+        lost = self.running(age=601)
+        alive = self.running(age=10)
+        self.assertEqual(requeue_stale(), 1)
+
+        lost.refresh_from_db()
+        self.assertEqual((lost.status, lost.attempts, lost.locked_by, lost.locked_at), ('QUEUED', 1, '', None))
+        self.assertIn('heartbeats', lost.last_error)
+        self.assertEqual(Task.objects.get(pk=alive.pk).status, 'RUNNING')
+
+    def test_lost_last_attempt_fails(self):
+        lost = self.running(age=601, attempts=2, max_attempts=3)
+        requeue_stale()
+        lost.refresh_from_db()
+        self.assertEqual((lost.status, lost.attempts), ('FAILED', 3))
+
+    def test_heartbeat_keeps_a_long_task_alive(self):
+        mine = self.running(age=590)
+        theirs = self.running(worker='worker-b', age=590)
+        self.assertEqual(heartbeat([mine.pk, theirs.pk], 'worker-a'), 1)
+
+        with mock.patch('tasks.queue.timezone.now', return_value=timezone.now() + timedelta(seconds=20)):
+            self.assertEqual(requeue_stale(), 1)
+        self.assertEqual(Task.objects.get(pk=mine.pk).status, 'RUNNING')
+        self.assertEqual(Task.objects.get(pk=theirs.pk).status, 'QUEUED')
+
+
+class WorkerChildTests(TestCase):
+    def test_child_forgets_inherited_connections_without_closing_them(self):
+        inherited = mock.Mock()
+        conn = mock.Mock(connection=inherited)
+        with mock.patch.object(runworker, 'connections') as connections, \
+                mock.patch.object(runworker, '_inherited', []) as kept, \
+                mock.patch('django.setup'), mock.patch('signal.signal'):
+            connections.all.return_value = [conn]
+            runworker._init_child()
+        self.assertIsNone(conn.connection)
+        inherited.close.assert_not_called()
+        conn.close.assert_not_called()
+        self.assertEqual(kept, [inherited])